@@ -0,0 +1,323 @@
+# -*- coding: utf-8 -*-
+
+"""
+Non-blocking execution of many SPARQL queries from a single thread.
+
+An L{AsyncClient} multiplexes HTTP requests to one or more endpoints over non-blocking
+sockets (using the standard C{asyncore} module), so thousands of queries can be in flight
+without a thread per request. The request itself (URI, Accept header, credentials, GET or
+POST) is built by L{SPARQLWrapper._createRequest<Wrapper.SPARQLWrapper._createRequest>}, exactly
+as for a synchronous L{SPARQLWrapper.query<Wrapper.SPARQLWrapper.query>} call.
+
+Usage::
+
+ from SPARQLWrapper import SPARQLWrapper, AsyncClient, JSON
+ client = AsyncClient(maxConcurrency=50, timeout=10)
+ sparql = SPARQLWrapper("http://localhost:2020/sparql", returnFormat=JSON)
+ pending = []
+ for queryString in queries :
+    sparql.setQuery(queryString)
+    pending.append(client.submit(sparql))
+ client.run()
+ for query in pending :
+    print query.result().convert()
+
+Only plain C{http} endpoints are supported; host names are resolved with a (blocking) DNS lookup
+when a request is started.
+"""
+
+import sys
+import time
+import socket
+import asyncore
+import httplib
+import urllib
+import urllib2
+from collections import deque
+from cStringIO import StringIO
+
+PENDING   = "PENDING"
+RUNNING   = "RUNNING"
+DONE      = "DONE"
+CANCELLED = "CANCELLED"
+
+class QueryTimeout(urllib2.URLError):
+    """
+    Raised by L{AsyncQuery.result} when the endpoint did not answer in time.
+    """
+
+    def __init__(self, timeout) :
+        urllib2.URLError.__init__(self, "no response from the endpoint after %s seconds" % timeout)
+
+class QueryCancelled(Exception):
+    """
+    Raised by L{AsyncQuery.result} when the query has been cancelled.
+    """
+
+class _FakeSocket(object):
+    """Lets C{httplib.HTTPResponse} parse a response that has already been received."""
+
+    def __init__(self, data) :
+        self._data = data
+
+    def makefile(self, mode, bufsize=None) :
+        return StringIO(self._data)
+
+class AsyncQuery(object):
+    """
+    Handle on a query submitted to an L{AsyncClient}. Users should not create instances of this class,
+    they are returned by L{AsyncClient.submit}.
+
+    @ivar state: one of C{PENDING}, C{RUNNING}, C{DONE} or C{CANCELLED}
+    """
+
+    def __init__(self, client, request, returnFormat, errorHandler, callback, timeout) :
+        self.client = client
+        self.request = request
+        self.returnFormat = returnFormat
+        self.errorHandler = errorHandler
+        self.callback = callback
+        self.timeout = timeout
+        self.deadline = None
+        self.state = PENDING
+        self.channel = None
+        self._result = None
+        self._exception = None
+
+    def done(self) :
+        """
+        @return: whether the query has finished, failed or been cancelled
+        @rtype: bool
+        """
+        return self.state in (DONE, CANCELLED)
+
+    def cancel(self) :
+        """
+        Cancel the query. A running request is aborted and its connection closed.
+        @return: False if the query had already finished, True otherwise
+        @rtype: bool
+        """
+        if self.done():
+            return False
+        self._exception = QueryCancelled()
+        self.client._finish(self, CANCELLED)
+        return True
+
+    def result(self) :
+        """
+        Return the result of a finished query, or raise the exception it failed with.
+        @return: query result
+        @rtype: L{QueryResult<Wrapper.QueryResult>} instance
+        """
+        if not self.done():
+            raise RuntimeError("the query has not finished yet, see AsyncClient.run")
+        if self._exception is not None:
+            raise self._exception
+        return self._result
+
+    def exception(self) :
+        """
+        @return: the exception the query failed with, or C{None}
+        """
+        return self._exception
+
+    def _complete(self, data) :
+        """Parse the raw HTTP response, mapping errors the same way as L{SPARQLWrapper._query<Wrapper.SPARQLWrapper._query>}."""
+        from Wrapper import QueryResult
+        try:
+            response = httplib.HTTPResponse(_FakeSocket(data), method=self.request.get_method())
+            response.begin()
+            body = response.read()
+            fp = urllib.addinfourl(StringIO(body), response.msg, self.request.get_full_url())
+            fp.code = response.status
+            fp.msg = response.reason
+            if not 200 <= response.status < 300:
+                self.errorHandler(urllib2.HTTPError(self.request.get_full_url(), response.status, response.reason, response.msg, StringIO(body)))
+            self._result = QueryResult((fp, self.returnFormat))
+        except Exception, e:
+            self._exception = e
+        self.client._finish(self, DONE)
+
+    def _fail(self, exception) :
+        self._exception = exception
+        self.client._finish(self, DONE)
+
+class _HTTPChannel(asyncore.dispatcher):
+    """Sends one request and collects the raw response."""
+
+    def __init__(self, query, socketMap) :
+        asyncore.dispatcher.__init__(self, map=socketMap)
+        self.query = query
+        self.outgoing = _serializeRequest(query.request)
+        self.incoming = []
+        self.received = 0
+        self.expected = None
+        host, port = urllib.splitport(query.request.get_host())
+        port = int(port or httplib.HTTP_PORT)
+        self.create_socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.connect((host, port))
+
+    def writable(self) :
+        return not self.connected or bool(self.outgoing)
+
+    def handle_connect(self) :
+        pass
+
+    def handle_write(self) :
+        sent = self.send(self.outgoing)
+        self.outgoing = self.outgoing[sent:]
+
+    def handle_read(self) :
+        data = self.recv(65536)
+        if data:
+            self.incoming.append(data)
+            self.received += len(data)
+            if self._responseComplete():
+                self._finish()
+
+    def _responseComplete(self) :
+        """Check whether a response with a C{Content-Length} header has been received completely."""
+        if self.expected is None:
+            head = "".join(self.incoming)
+            end = head.find("\r\n\r\n")
+            if end == -1:
+                return False
+            self.expected = -1
+            for line in head[:end].split("\r\n")[1:]:
+                name, _, value = line.partition(":")
+                if name.strip().lower() == "content-length":
+                    try:
+                        self.expected = end + 4 + int(value.strip())
+                    except ValueError:
+                        pass
+        return self.expected >= 0 and self.received >= self.expected
+
+    def _finish(self) :
+        self.close()
+        data = "".join(self.incoming)
+        if data:
+            self.query._complete(data)
+        else:
+            self.query._fail(urllib2.URLError("connection closed by the endpoint without a response"))
+
+    def handle_close(self) :
+        self._finish()
+
+    def handle_error(self) :
+        error = sys.exc_info()[1]
+        self.close()
+        self.query._fail(urllib2.URLError(error))
+
+def _serializeRequest(request) :
+    """
+    Turn a C{urllib2.Request} into the bytes of an HTTP/1.1 request.
+    @param request: request as built by L{SPARQLWrapper._createRequest<Wrapper.SPARQLWrapper._createRequest>}
+    @rtype: string
+    """
+    headers = {"Host" : request.get_host(), "Connection" : "close"}
+    for name, value in request.header_items():
+        headers[name.title()] = value
+    data = request.get_data()
+    if data is not None:
+        headers.setdefault("Content-Type", "application/x-www-form-urlencoded")
+        headers["Content-Length"] = str(len(data))
+    lines = ["%s %s HTTP/1.1" % (request.get_method(), request.get_selector())]
+    lines.extend(["%s: %s" % (name, value.strip()) for name, value in sorted(headers.items())])
+    return "\r\n".join(lines) + "\r\n\r\n" + (data or "")
+
+class AsyncClient(object):
+    """
+    Runs many queries concurrently from a single thread.
+
+    Queries are queued by L{submit} and executed by L{run}; at most C{maxConcurrency} requests are
+    in flight at any time (the others wait in the queue, like behind a semaphore).
+    """
+
+    def __init__(self, maxConcurrency=10, timeout=None) :
+        """
+        @keyword maxConcurrency: maximum number of simultaneous requests. Default: 10.
+        @type maxConcurrency: int
+        @keyword timeout: default time limit, in seconds, for each request once it has been started; C{None} for no limit.
+        @type timeout: number
+        """
+        self.maxConcurrency = maxConcurrency
+        self.timeout = timeout
+        self._pending = deque()
+        self._running = []
+        self._socketMap = {}
+
+    def submit(self, wrapper, callback=None, timeout=None) :
+        """
+        Queue the query currently set on C{wrapper}. The request is built immediately, so the wrapper can be
+        reused for the next query right away.
+        @param wrapper: the wrapper holding the endpoint, query, return format, credentials, etc.
+        @type wrapper: L{SPARQLWrapper<Wrapper.SPARQLWrapper>}
+        @keyword callback: function called with the L{AsyncQuery} once it is done (not when it is cancelled)
+        @keyword timeout: time limit for this request, overrides the one of the client
+        @rtype: L{AsyncQuery}
+        """
+        request = wrapper._createRequest()
+        if request.get_type() != "http":
+            raise ValueError("only http endpoints are supported, not %s" % request.get_type())
+        if timeout is None:
+            timeout = self.timeout
+        query = AsyncQuery(self, request, wrapper.returnFormat, wrapper._raiseHTTPError, callback, timeout)
+        self._pending.append(query)
+        return query
+
+    def __len__(self) :
+        """Number of queries queued or running."""
+        return len(self._pending) + len(self._running)
+
+    def _start(self) :
+        while self._pending and len(self._running) < self.maxConcurrency:
+            query = self._pending.popleft()
+            if query.state != PENDING:
+                continue
+            query.state = RUNNING
+            if query.timeout is not None:
+                query.deadline = time.time() + query.timeout
+            self._running.append(query)
+            try:
+                query.channel = _HTTPChannel(query, self._socketMap)
+            except socket.error, e:
+                query._fail(urllib2.URLError(e))
+
+    def _finish(self, query, state) :
+        if query.channel is not None:
+            query.channel.close()
+            query.channel = None
+        if query in self._running:
+            self._running.remove(query)
+        previous, query.state = query.state, state
+        if state == DONE and previous != DONE and query.callback is not None:
+            query.callback(query)
+
+    def _expire(self) :
+        now = time.time()
+        for query in self._running[:]:
+            if query.deadline is not None and now >= query.deadline:
+                query._fail(QueryTimeout(query.timeout))
+
+    def run(self, timeout=None) :
+        """
+        Execute the queued queries until all of them are done.
+        @keyword timeout: stop after this many seconds even if some queries are still queued or running
+        @return: True if all queries are done, False if C{timeout} expired first
+        @rtype: bool
+        """
+        stop = timeout is not None and time.time() + timeout or None
+        while True:
+            self._start()
+            if not self._running:
+                return True
+            if stop is not None and time.time() >= stop:
+                return False
+            asyncore.loop(timeout=0.05, map=self._socketMap, count=1)
+            self._expire()
+
+    def cancel(self) :
+        """Cancel all queued and running queries."""
+        for query in list(self._pending) + self._running:
+            query.cancel()
+        self._pending.clear()
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+
+"""
+Incremental parsing of U{SPARQL JSON results<http://www.w3.org/TR/rdf-sparql-json-res/>}.
+
+L{QueryResult.convert<Wrapper.QueryResult.convert>} reads the whole response and decodes it in
+one go, so the raw body and the decoded document are both held in memory. L{iterBindings}
+instead reads the response in chunks and yields the members of C{results.bindings} one at a
+time, keeping only the current chunk and binding in memory.
+
+The parser assumes the usual layout of SPARQL JSON results, where C{bindings} is the first
+member named so in the document (ie, C{head} does not contain a member of that name).
+"""
+
+import re
+import codecs
+import json
+
+_bindingsStart = re.compile(r'"bindings"\s*:\s*\[')
+_separators    = re.compile(r'[\s,]*')
+
+def iterBindings(stream, chunkSize=65536) :
+    """
+    Yield the bindings of a SPARQL JSON SELECT result one at a time.
+    @param stream: file-like object with the UTF-8 encoded JSON document, eg, the response of a query
+    @keyword chunkSize: number of bytes read from C{stream} at a time
+    @type chunkSize: int
+    @return: generator of binding dictionaries, mapping each variable name to a C{type}/C{value} dictionary
+    @raise ValueError: if the document is not a valid SPARQL JSON result
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    raw_decode = json.JSONDecoder().raw_decode
+    buffer = u""
+    eof = False
+
+    # skip everything up to the opening bracket of the bindings
+    while True:
+        match = _bindingsStart.search(buffer)
+        if match:
+            buffer = buffer[match.end():]
+            break
+        if eof:
+            raise ValueError("no results.bindings member in the JSON result")
+        # keep enough of the end of the buffer for a match spanning two chunks
+        buffer = buffer[-64:]
+        chunk = stream.read(chunkSize)
+        eof = not chunk
+        buffer += decoder.decode(chunk, eof)
+
+    # decode one binding at a time
+    while True:
+        position = _separators.match(buffer).end()
+        if position < len(buffer):
+            if buffer[position] == u"]":
+                break
+            try:
+                binding, end = raw_decode(buffer, position)
+            except ValueError:
+                # most likely an incomplete binding: read some more first
+                if eof:
+                    raise
+            else:
+                yield binding
+                buffer = buffer[end:]
+                continue
+        elif eof:
+            raise ValueError("unterminated results.bindings array in the JSON result")
+        chunk = stream.read(chunkSize)
+        eof = not chunk
+        buffer = buffer[position:] + decoder.decode(chunk, eof)
+
+    # read the rest, so that a keep-alive connection can be reused
+    while stream.read(chunkSize):
+        pass
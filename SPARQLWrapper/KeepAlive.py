@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+
+"""
+Persistent (keep-alive) HTTP connections for L{SPARQLWrapper<Wrapper.SPARQLWrapper>}.
+
+By default every query opens a new TCP (and, for https, TLS) connection to the endpoint
+via C{urllib2.urlopen}. A L{ConnectionPool} keeps finished connections around so that
+subsequent queries to the same host can reuse them. The pool is installed per wrapper
+(see L{SPARQLWrapper.setConnectionPool<Wrapper.SPARQLWrapper.setConnectionPool>}), so the
+global C{urllib2} opener is never touched.
+
+Usage::
+
+ from SPARQLWrapper import SPARQLWrapper, ConnectionPool
+ sparql = SPARQLWrapper("http://localhost:2020/sparql")
+ sparql.setConnectionPool(ConnectionPool(maxsize=4, idle_timeout=30, max_requests=100))
+
+"""
+
+import time
+import socket
+import httplib
+import urllib
+import urllib2
+import threading
+
+class _PooledConnection(object):
+    """
+    A C{httplib} connection together with the bookkeeping needed by the pool.
+    """
+
+    def __init__(self, key, connection) :
+        self.key = key
+        self.connection = connection
+        self.requests = 0
+        self.lastUsed = time.time()
+
+    def close(self) :
+        try:
+            self.connection.close()
+        except Exception:
+            pass
+
+class ConnectionPool(object):
+    """
+    Pool of keep-alive HTTP connections, keyed by scheme, host and port.
+
+    Connections are handed out by L{acquire} and given back by L{release} once the
+    response body has been fully read. A connection is not reused if the server asked
+    to close it, if it has been idle for longer than C{idle_timeout} seconds, or if it
+    has already served C{max_requests} requests.
+
+    The pool is thread safe; concurrent requests simply get different connections.
+
+    @ivar connectionsOpened: number of new connections created by the pool so far
+    @ivar connectionsReused: number of requests that were served by an already open connection
+    """
+
+    def __init__(self, maxsize=4, idle_timeout=60, max_requests=100) :
+        """
+        @keyword maxsize: maximum number of idle connections kept per host. Default: 4.
+        @type maxsize: int
+        @keyword idle_timeout: seconds after which an idle connection is discarded instead of reused. Default: 60.
+        @type idle_timeout: number
+        @keyword max_requests: number of requests after which a connection is closed, C{None} for no limit. Default: 100.
+        @type max_requests: int
+        """
+        self.maxsize = maxsize
+        self.idle_timeout = idle_timeout
+        self.max_requests = max_requests
+        self.connectionsOpened = 0
+        self.connectionsReused = 0
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def _expired(self, pooled) :
+        if self.idle_timeout is not None and time.time() - pooled.lastUsed >= self.idle_timeout:
+            return True
+        if self.max_requests is not None and pooled.requests >= self.max_requests:
+            return True
+        return False
+
+    def acquire(self, key, factory, fresh=False) :
+        """
+        Return an idle connection for C{key}, or a new one built by C{factory}.
+        @param key: C{(scheme, host)} tuple identifying the endpoint
+        @param factory: callable returning a new C{httplib} connection
+        @keyword fresh: if true, always open a new connection
+        @return: tuple of the pooled connection and a flag telling whether it was reused
+        """
+        self._lock.acquire()
+        try:
+            idle = self._idle.get(key, [])
+            while idle and not fresh:
+                pooled = idle.pop()
+                if self._expired(pooled):
+                    pooled.close()
+                    continue
+                self.connectionsReused += 1
+                return (pooled, True)
+            self.connectionsOpened += 1
+        finally:
+            self._lock.release()
+        return (_PooledConnection(key, factory()), False)
+
+    def release(self, pooled) :
+        """
+        Give a connection back to the pool once its response has been read completely.
+        @param pooled: connection returned by L{acquire}
+        """
+        pooled.requests += 1
+        pooled.lastUsed = time.time()
+        if self._expired(pooled):
+            pooled.close()
+            return
+        self._lock.acquire()
+        try:
+            idle = self._idle.setdefault(pooled.key, [])
+            if len(idle) < self.maxsize:
+                idle.append(pooled)
+                return
+        finally:
+            self._lock.release()
+        pooled.close()
+
+    def discard(self, pooled) :
+        """
+        Close a connection that cannot be reused (eg, its response was not read to the end).
+        @param pooled: connection returned by L{acquire}
+        """
+        pooled.close()
+
+    def close(self) :
+        """Close all idle connections."""
+        self._lock.acquire()
+        try:
+            idle, self._idle = self._idle, {}
+        finally:
+            self._lock.release()
+        for connections in idle.values():
+            for pooled in connections:
+                pooled.close()
+
+    def __len__(self) :
+        """Number of idle connections currently held by the pool."""
+        return sum([len(connections) for connections in self._idle.values()])
+
+class _PooledReader(object):
+    """
+    Minimal socket-like wrapper around a C{httplib.HTTPResponse} that gives the
+    connection back to the pool as soon as the body is exhausted.
+    """
+
+    def __init__(self, pool, pooled, response) :
+        self._pool = pool
+        self._pooled = pooled
+        self._response = response
+
+    def _done(self) :
+        pooled, self._pooled = self._pooled, None
+        if pooled is None:
+            return
+        if self._response.will_close:
+            self._pool.discard(pooled)
+        else:
+            self._pool.release(pooled)
+
+    def recv(self, amt=-1) :
+        if self._pooled is None:
+            return ""
+        if amt is None or amt < 0:
+            data = self._response.read()
+        else:
+            data = self._response.read(amt)
+        if self._response.isclosed() or not data:
+            self._done()
+        return data
+    read = recv
+
+    def close(self) :
+        if self._pooled is not None:
+            # the body was not read to the end, the connection is in an unknown state
+            pooled, self._pooled = self._pooled, None
+            self._pool.discard(pooled)
+
+class KeepAliveHandler(urllib2.HTTPHandler, urllib2.HTTPSHandler):
+    """
+    C{urllib2} handler sending http and https requests over connections taken from a L{ConnectionPool}.
+    """
+
+    def __init__(self, pool=None) :
+        urllib2.HTTPHandler.__init__(self)
+        if pool is None:
+            pool = ConnectionPool()
+        self.pool = pool
+
+    def http_open(self, req) :
+        return self._open(httplib.HTTPConnection, req)
+
+    def https_open(self, req) :
+        return self._open(httplib.HTTPSConnection, req)
+
+    def _send(self, pooled, req) :
+        headers = dict(req.unredirected_hdrs)
+        headers.update(req.headers)
+        headers = dict((name.title(), value) for name, value in headers.items())
+        connection = pooled.connection
+        if req.has_data():
+            connection.request(req.get_method(), req.get_selector(), req.get_data(), headers)
+        else:
+            connection.request(req.get_method(), req.get_selector(), headers=headers)
+        return connection.getresponse(buffering=True)
+
+    def _open(self, http_class, req) :
+        host = req.get_host()
+        if not host:
+            raise urllib2.URLError("no host given")
+        timeout = getattr(req, "timeout", socket._GLOBAL_DEFAULT_TIMEOUT)
+        key = (req.get_type(), host)
+        factory = lambda : http_class(host, timeout=timeout)
+
+        pooled, reused = self.pool.acquire(key, factory)
+        try:
+            if pooled.connection.sock is not None:
+                # like a fresh connection, fall back to the socket default timeout
+                if timeout is socket._GLOBAL_DEFAULT_TIMEOUT:
+                    pooled.connection.sock.settimeout(socket.getdefaulttimeout())
+                else:
+                    pooled.connection.sock.settimeout(timeout)
+            response = self._send(pooled, req)
+        except (socket.error, httplib.HTTPException), e:
+            self.pool.discard(pooled)
+            if not reused:
+                raise urllib2.URLError(e)
+            # the server probably dropped the idle connection: retry once on a fresh one
+            pooled, reused = self.pool.acquire(key, factory, fresh=True)
+            try:
+                response = self._send(pooled, req)
+            except (socket.error, httplib.HTTPException), e:
+                self.pool.discard(pooled)
+                raise urllib2.URLError(e)
+
+        fp = socket._fileobject(_PooledReader(self.pool, pooled, response), close=True)
+        resp = urllib.addinfourl(fp, response.msg, req.get_full_url())
+        resp.code = response.status
+        resp.msg = response.reason
+        return resp
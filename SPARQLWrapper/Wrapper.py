@@ -24,6 +24,10 @@
 """
 
 import sys
+import time
+import random
+import socket
+import httplib
 import urllib, urllib2
 import base64
 import re
@@ -33,6 +37,9 @@ from . import __agent__
 from SPARQLExceptions import QueryBadFormed, EndPointNotFound, EndPointInternalError
 from SPARQLUtils import deprecated
 from KeyCaseInsensitiveDict import KeyCaseInsensitiveDict
+from KeepAlive import ConnectionPool, KeepAliveHandler
+from JSONStream import iterBindings
+from AsyncWrapper import QueryTimeout
 
 #  Possible output format keys...
 JSON   = "json"
@@ -126,6 +133,7 @@ class SPARQLWrapper :
         self.user = None
         self.passwd = None
         self.customParameters = {}
+        self.customHttpHeaders = {}
         self._defaultGraph = defaultGraph
         if defaultGraph : self.customParameters["default-graph-uri"] = defaultGraph
         if returnFormat in _allowedFormats :
@@ -136,6 +144,13 @@ class SPARQLWrapper :
         self.queryString = """SELECT * WHERE{ ?s ?p ?o }"""
         self.method    = GET
         self.queryType = SELECT
+        self.connectionPool = None
+        self.timeout = None
+        self.deadline = None
+        self.retries = 0
+        self.backoff = 0.1
+        self.maxBackoff = 10
+        self._opener = None
 
     def resetQuery(self) :
         """Reset the query, ie, return format, query, default or named graph settings, etc,
@@ -207,6 +222,28 @@ class SPARQLWrapper :
             self.customParameters[name] = value
             return True
 
+    def addCustomHttpHeader(self,httpHeaderName,httpHeaderValue) :
+        """
+            Add a custom HTTP header to the requests sent to the endpoint,
+            eg, C{If-None-Match} for a conditional request. Setting a header
+            that is already set replaces its value.
+            @param httpHeaderName: name of the header
+            @type httpHeaderName: string
+            @param httpHeaderValue: value of the header
+            @type httpHeaderValue: string
+        """
+        self.customHttpHeaders[httpHeaderName] = httpHeaderValue
+
+    def clearCustomHttpHeader(self,httpHeaderName) :
+        """
+            Remove a custom HTTP header set by L{addCustomHttpHeader}.
+            @param httpHeaderName: name of the header
+            @type httpHeaderName: string
+            @return: whether the header was set
+            @rtype: bool
+        """
+        return self.customHttpHeaders.pop(httpHeaderName, None) is not None
+
     def setCredentials(self,user,passwd) :
         """
             Set the credentials for querying the current endpoint
@@ -218,6 +255,42 @@ class SPARQLWrapper :
         self.user = user
         self.passwd = passwd
 
+    def setTimeout(self,timeout) :
+        """
+            Set a time limit for the connection to the endpoint and for each read of its response.
+            @param timeout: limit in seconds, or C{None} to use the default socket timeout
+            @type timeout: number
+        """
+        self.timeout = timeout
+
+    def setDeadline(self,deadline) :
+        """
+            Set a time limit for the whole query, retries included and up to the end of its response.
+            Each attempt, and each read of the response body, only gets the time that is left, so a
+            hung or slow connection can not hold the query past its deadline: L{QueryTimeout} is
+            raised instead.
+            @param deadline: limit in seconds, or C{None} for no limit
+            @type deadline: number
+        """
+        self.deadline = deadline
+
+    def setRetries(self,retries,backoff=0.1,maxBackoff=10) :
+        """
+            Retry queries that fail with a server error (5xx) or a connection error. Before retry
+            number I{n} the wrapper sleeps a random time between 0 and C{min(maxBackoff, backoff * 2**n)}
+            seconds, so that clients failing together do not retry together. A badly formed query
+            (L{QueryBadFormed}) or a missing endpoint (L{EndPointNotFound}) is never retried.
+            @param retries: number of retries after the first attempt; 0 disables them
+            @type retries: int
+            @keyword backoff: base delay in seconds
+            @type backoff: number
+            @keyword maxBackoff: longest delay in seconds
+            @type maxBackoff: number
+        """
+        self.retries = retries
+        self.backoff = backoff
+        self.maxBackoff = maxBackoff
+
     def setQuery(self,query) :
         """
             Set the SPARQL query text. Note: no check is done on the validity of the query 
@@ -262,16 +335,25 @@ class SPARQLWrapper :
         if method in _allowedRequests : self.method = method
 
     def setUseKeepAlive(self):
-        """Make urllib2 use keep-alive.
-        @raise ImportError: when could not be imported urlgrabber.keepalive.HTTPHandler
-        """
-        try:
-            from urlgrabber.keepalive import HTTPHandler
-            keepalive_handler = HTTPHandler()
-            opener = urllib2.build_opener(keepalive_handler)
-            urllib2.install_opener(opener)
-        except ImportError:
-            warnings.warn("urlgrabber not installed in the system. The execution of this method has no effect.")
+        """Make this instance reuse its HTTP connections (keep-alive), using a
+        L{ConnectionPool<KeepAlive.ConnectionPool>} with the default settings.
+        Unlike earlier versions, this does not need C{urlgrabber} and does not
+        change the global C{urllib2} opener.
+        """
+        if self.connectionPool is None:
+            self.setConnectionPool(ConnectionPool())
+
+    def setConnectionPool(self,pool) :
+        """Send the queries of this instance over keep-alive connections taken from C{pool}.
+        The same pool can be shared by several instances.
+        @param pool: connection pool, or C{None} to go back to one connection per query
+        @type pool: L{ConnectionPool<KeepAlive.ConnectionPool>}
+        """
+        self.connectionPool = pool
+        if pool is None:
+            self._opener = None
+        else:
+            self._opener = urllib2.build_opener(KeepAliveHandler(pool))
 
     def _getURI(self) :
         """Return the URI as sent (or to be sent) to the SPARQL endpoint. The URI is constructed
@@ -332,29 +414,87 @@ class SPARQLWrapper :
         request.add_header("User-Agent", self.agent)
         request.add_header("Accept", acceptHeader)
         if (self.user and self.passwd):
-            request.add_header("Authorization", "Basic " + base64.encodestring("%s:%s" % (self.user,self.passwd)))
+            request.add_header("Authorization", "Basic " + base64.b64encode("%s:%s" % (self.user,self.passwd)))
+        for name, value in self.customHttpHeaders.items():
+            request.add_header(name, value)
         return request
 
     def _query(self):
         """Internal method to execute the query. Returns the output of the
-        C{urllib2.urlopen} method of the standard Python library
+        C{urllib2.urlopen} method of the standard Python library.
+        Failed attempts are retried as set by L{setRetries}, within the L{deadline<setDeadline>}.
 
+        @return: tuples with the raw request plus the expected format
+        """
+        stop = None
+        if self.deadline is not None:
+            stop = time.time() + self.deadline
+        attempt = 0
+        while True:
+            timeout = self.timeout
+            if stop is not None:
+                left = max(stop - time.time(), 0.001)
+                timeout = timeout is None and left or min(timeout, left)
+            try:
+                response, format = self._attempt(timeout)
+                if stop is not None:
+                    response = DeadlineResponse(response, stop, self.deadline)
+                return (response, format)
+            except Exception, e:
+                if attempt >= self.retries or not self._isRetryable(e):
+                    raise
+                delay = random.uniform(0, min(self.maxBackoff, self.backoff * 2 ** attempt))
+                if stop is not None and time.time() + delay >= stop:
+                    raise
+                time.sleep(delay)
+                attempt += 1
+
+    def _attempt(self, timeout):
+        """Internal method to send the query once.
+        @param timeout: limit in seconds for the connection and each read, or C{None}
         @return: tuples with the raw request plus the expected format
         """
         request = self._createRequest()
+        kwargs = {}
+        if timeout is not None:
+            kwargs["timeout"] = timeout
         try:
-            response = urllib2.urlopen(request)
+            if self._opener is not None:
+                response = self._opener.open(request, **kwargs)
+            else:
+                response = urllib2.urlopen(request, **kwargs)
             return (response, self.returnFormat)
         except urllib2.HTTPError, e:
-            if e.code == 400:
-                raise QueryBadFormed()
-            elif e.code == 404:
-                raise EndPointNotFound()
-            elif e.code == 500:
-                raise EndPointInternalError(e.read())
-            else:
-                raise e
+            self._raiseHTTPError(e)
             return (None, self.returnFormat)
+
+    def _isRetryable(self, e) :
+        """Internal method to tell whether a failed attempt is worth repeating:
+        server errors and connection problems are, client errors are not.
+        @param e: the error raised by L{_attempt}
+        @rtype: bool
+        """
+        if isinstance(e, urllib2.HTTPError):
+            return e.code >= 500
+        return isinstance(e, (EndPointInternalError, urllib2.URLError,
+                              socket.error, httplib.HTTPException))
+
+    def _raiseHTTPError(self, e) :
+        """Internal method to turn an HTTP error sent back by the endpoint into the matching exception.
+        @param e: the error
+        @type e: C{urllib2.HTTPError}
+        @raise QueryBadFormed: for 400 responses
+        @raise EndPointNotFound: for 404 responses
+        @raise EndPointInternalError: for 500 responses
+        """
+        if e.code == 400:
+            raise QueryBadFormed()
+        elif e.code == 404:
+            raise EndPointNotFound()
+        elif e.code == 500:
+            raise EndPointInternalError(e.read())
+        else:
+            raise e
     
     def query(self) :
         """
@@ -385,6 +525,99 @@ class SPARQLWrapper :
 
 #######################################################################################################
 
+def _httpResponseOf(response) :
+    """Internal function to find the C{httplib.HTTPResponse} that a C{urllib2} response, plain or
+    from a L{KeepAliveHandler}, is read from.
+    @return: the HTTP response, or C{None}
+    """
+    for i in range(8) :
+        if isinstance(response, httplib.HTTPResponse) :
+            return response
+        for name in ("_sock", "fp", "_response") :
+            inner = getattr(response, name, None)
+            if inner is not None :
+                response = inner
+                break
+        else :
+            return None
+    return None
+
+class _DeadlineSocket(object) :
+    """
+    Internal wrapper around the socket an HTTP response is read from, that gives each C{recv} only
+    the time left until the deadline of its L{DeadlineResponse}.
+    """
+
+    def __init__(self, sock, response) :
+        self._sock = sock
+        self._response = response
+
+    def recv(self, *args) :
+        self._sock.settimeout(self._response.left())
+        try:
+            return self._sock.recv(*args)
+        except socket.timeout:
+            raise QueryTimeout(self._response.deadline)
+
+    def __getattr__(self, name) :
+        return getattr(self._sock, name)
+
+class DeadlineResponse(object) :
+    """
+    Wrapper around the response of a query with a L{deadline<SPARQLWrapper.setDeadline>}, so that
+    reading the body can not take longer than the time left either: every read, and every C{recv}
+    from the socket underneath, checks the time left and raises L{QueryTimeout} once there is none.
+    Everything else is passed on to the response.
+    """
+
+    def __init__(self, response, stop, deadline) :
+        """
+        @param response: the response, as returned by C{urllib2}
+        @param stop: the time at which the query is given up
+        @param deadline: the time limit of the query, in seconds, for error messages
+        """
+        self.response = response
+        self.stop = stop
+        self.deadline = deadline
+        # each response reads its connection through a file object of its own, so a pooled
+        # connection is left alone once the response has been read
+        http = _httpResponseOf(response)
+        if http is not None and isinstance(http.fp, socket._fileobject) :
+            http.fp._sock = _DeadlineSocket(http.fp._sock, self)
+
+    def __getattr__(self, name) :
+        return getattr(self.response, name)
+
+    def left(self) :
+        """The time left until the deadline, in seconds.
+        @raise QueryTimeout: if there is none
+        """
+        left = self.stop - time.time()
+        if left <= 0:
+            raise QueryTimeout(self.deadline)
+        return left
+
+    def read(self, *args) :
+        self.left()
+        return self.response.read(*args)
+
+    def readline(self, *args) :
+        self.left()
+        return self.response.readline(*args)
+
+    def readlines(self, *args) :
+        self.left()
+        return self.response.readlines(*args)
+
+    def __iter__(self) :
+        return iter(self.readline, "")
+
+    def next(self) :
+        line = self.readline()
+        if not line:
+            raise StopIteration
+        return line
+
 class QueryResult :
     """
     Wrapper around an a query result. Users should not create instances of this class, it is
@@ -469,6 +702,19 @@ class QueryResult :
         #    import json
         #return json.load(self.response)
 
+    def iterBindings(self, chunkSize=65536) :
+        """
+        Iterate over the bindings of a JSON SELECT result while it is being read from the endpoint,
+        instead of decoding the whole result at once like L{convert}. See L{JSONStream.iterBindings}.
+        @keyword chunkSize: number of bytes read from the response at a time
+        @return: generator of binding dictionaries
+        @raise ValueError: if the result is not in JSON
+        """
+        ct = self.info()["content-type"]
+        if not True in [ct.find(q) != -1 for q in _SPARQL_JSON] :
+            raise ValueError("Bindings can only be streamed from JSON results, not %s" % ct)
+        return iterBindings(self.response, chunkSize)
+
     def _convertXML(self) :
         """
         Convert an XML result into a Python dom tree. This method can be overwritten in a
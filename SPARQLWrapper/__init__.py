@@ -184,4 +184,6 @@ __agent__   = "sparqlwrapper %s (http://sparql-wrapper.sourceforge.net/)" % __ve
 
 from Wrapper      import SPARQLWrapper, XML, JSON, TURTLE, N3, RDF, GET, POST, SELECT, CONSTRUCT, ASK, DESCRIBE
 from SmartWrapper import SPARQLWrapper2
+from KeepAlive    import ConnectionPool
+from AsyncWrapper import AsyncClient
 
@@ -74,6 +74,12 @@ class Dispatcher(object):
             lst.append(handler)
         self._dispatch_map[event_type] = lst
 
+    def subscribed(self, event_type):
+        """ True if any handler is subscribed to event_type, so that
+        callers can skip making events nobody will receive."""
+        return self._dispatch_map is not None and \
+            bool(self._dispatch_map.get(event_type))
+
     def dispatch(self, event):
         """ Dispatch the given event to the subscribed handlers for
         the event's type"""
@@ -26,7 +26,7 @@ See the `setuptools dynamic discovery of services and plugins`__ for more inform
 from .store import Store
 from .parser import Parser
 from .serializer import Serializer
-from .query import ResultParser, ResultSerializer
+from .query import Processor, Result, ResultParser, ResultSerializer
 from .exceptions import Error
 
 __all__ = ['register', 'get', 'plugins', 'PluginException', 'Plugin', 'PKGPlugin']
@@ -34,12 +34,18 @@ __all__ = ['register', 'get', 'plugins', 'PluginException', 'Plugin', 'PKGPlugin
 entry_points = {'rdf.plugins.store': Store,
                 'rdf.plugins.serializer': Serializer,
                 'rdf.plugins.parser': Parser,
+                'rdf.plugins.queryprocessor': Processor,
+                'rdf.plugins.queryresult': Result,
                 'rdf.plugins.resultparser': ResultParser,
                 'rdf.plugins.resultserializer': ResultSerializer,
                 }
 
 _plugins = {}
 
+# the plugins below are registered by their 'rdflib.' module paths; load
+# them from the package this copy of rdflib was actually imported as
+_package = __name__.rsplit('.', 1)[0]
+
 
 class PluginException(Error):
     pass
@@ -56,7 +62,10 @@ class Plugin(object):
 
     def getClass(self):
         if self._class is None:
-            module = __import__(self.module_path, globals(), locals(), [""])
+            module_path = self.module_path
+            if module_path.startswith('rdflib.'):
+                module_path = _package + module_path[len('rdflib'):]
+            module = __import__(module_path, globals(), locals(), [""])
             self._class = getattr(module, self.class_name)
         return self._class
 
@@ -121,6 +130,10 @@ register('default', Store,
                 'rdflib.plugins.memory', 'IOMemory')
 register('IOMemory', Store, 
                 'rdflib.plugins.memory', 'IOMemory')
+register('ArrayMemory', Store,
+                'rdflib.plugins.arraymemory', 'ArrayMemory')
+register('Snapshot', Store,
+                'rdflib.plugins.snapshot', 'Snapshot')
 register('Sleepycat', Store, 
                 'rdflib.plugins.sleepycat', 'Sleepycat')
 
@@ -157,3 +170,8 @@ register('rdfa', Parser,
                 'rdflib.plugins.parsers.rdfa', 'RDFaParser')
 
 register("nquads", Parser, "rdflib.plugins.parsers.nquads", "NQuadsParser")
+
+register('sparql', Processor,
+                'rdflib.plugins.sparql.processor', 'SPARQLProcessor')
+register('sparql', Result,
+                'rdflib.plugins.sparql.processor', 'SPARQLResult')
@@ -0,0 +1,397 @@
+"""
+An in-memory, context-aware store that keeps its triples in sorted
+arrays of integers instead of nested dictionaries.
+
+Each term is given an integer id once, and every (subject, predicate,
+object, context) quad is stored in three sorted permutations -- spoc,
+posc and ospc -- of two ``array('l')`` columns each, so a quad takes
+48 bytes plus its share of the term dictionary. Patterns are answered
+by binary search for the range of rows starting with their bound
+terms.
+
+Added quads are buffered, and sorted into the indexes the next time
+the store is read: a few at a time they are inserted in place, in
+bulk they are sorted on their own and merged with the rows.
+"""
+
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import izip
+
+from ..store import Store, NO_STORE, VALID_STORE, TripleAddedEvent
+
+__all__ = ['ArrayMemory']
+
+ANY = Any = None
+
+# two ids are packed into each array item, a << 32 | b
+_LOW = (1 << 32) - 1
+_LOW64 = (1 << 64) - 1
+if array('l').itemsize < 8:
+    raise ImportError("ArrayMemory needs 64 bit array('l') items")
+
+# a buffer of pending quads is inserted in place if it is shorter than
+# the indexes divided by this, and they are rebuilt otherwise
+_REBUILD_RATIO = 16
+
+
+class _Index(object):
+    """
+    One permutation of the quads of an ArrayMemory, sorted. ``heads``
+    holds the first two ids of each row and ``tails`` the last two.
+    ``order`` gives the positions in a (s, p, o, c) quad of the ids
+    of a row.
+    """
+
+    __slots__ = ('order', 'unorder', 'heads', 'tails')
+
+    def __init__(self, order):
+        self.order = order
+        self.unorder = tuple([order.index(i) for i in range(4)])
+        self.heads = array('l')
+        self.tails = array('l')
+
+    def __len__(self):
+        return len(self.heads)
+
+    def pack(self, quad):
+        a, b, c, d = self.order
+        return quad[a] << 32 | quad[b], quad[c] << 32 | quad[d]
+
+    def merge(self, quads):
+        """Add the quads that aren't rows yet. Each row is sorted as
+        the single number head << 64 | tail, which is much quicker
+        than sorting pairs."""
+        a, b, c, d = self.order
+        keys = set([q[a] << 96 | q[b] << 64 | q[c] << 32 | q[d] for q in quads])
+        if self.heads:
+            keys.update([head << 64 | tail
+                         for head, tail in izip(self.heads, self.tails)])
+        keys = sorted(keys)
+        self.heads = array('l', [key >> 64 for key in keys])
+        self.tails = array('l', [key & _LOW64 for key in keys])
+
+    def clear(self):
+        self.heads = array('l')
+        self.tails = array('l')
+
+    def find(self, quad):
+        """Row of the quad, or -1."""
+        head, tail = self.pack(quad)
+        lo = bisect_left(self.heads, head)
+        hi = bisect_right(self.heads, head, lo)
+        i = bisect_left(self.tails, tail, lo, hi)
+        if i < hi and self.tails[i] == tail:
+            return i
+        return -1
+
+    def insert(self, quad):
+        head, tail = self.pack(quad)
+        lo = bisect_left(self.heads, head)
+        hi = bisect_right(self.heads, head, lo)
+        i = bisect_left(self.tails, tail, lo, hi)
+        self.heads.insert(i, head)
+        self.tails.insert(i, tail)
+
+    def delete(self, quad):
+        i = self.find(quad)
+        del self.heads[i]
+        del self.tails[i]
+
+    def span(self, first=None, second=None, third=None):
+        """Range of the rows starting with the given ids."""
+        heads = self.heads
+        if first is None:
+            return 0, len(heads)
+        if second is None:
+            lo = bisect_left(heads, first << 32)
+            return lo, bisect_left(heads, (first + 1) << 32, lo)
+        head = first << 32 | second
+        lo = bisect_left(heads, head)
+        hi = bisect_right(heads, head, lo)
+        if third is None:
+            return lo, hi
+        tails = self.tails
+        lo = bisect_left(tails, third << 32, lo, hi)
+        return lo, bisect_left(tails, (third + 1) << 32, lo, hi)
+
+    def rows(self, lo, hi):
+        """Yield the rows from lo to hi as (s, p, o, c) quads."""
+        heads, tails = self.heads, self.tails
+        u0, u1, u2, u3 = self.unorder
+        for i in xrange(lo, hi):
+            head = heads[i]
+            tail = tails[i]
+            row = (head >> 32, head & _LOW, tail >> 32, tail & _LOW)
+            yield (row[u0], row[u1], row[u2], row[u3])
+
+
+class ArrayMemory(Store):
+    """\
+    A context-aware in-memory store, using sorted integer arrays as
+    indexes: much smaller than IOMemory, and about as fast to query.
+    Quoted (formula) statements are not supported.
+    """
+
+    context_aware = True
+    formula_aware = False
+
+    def __init__(self, configuration=None, identifier=None):
+        super(ArrayMemory, self).__init__(configuration)
+        self.identifier = identifier
+
+        # term <-> integer id
+        self._ids = {}
+        self._terms = []
+
+        self._spoc = _Index((0, 1, 2, 3))
+        self._posc = _Index((1, 2, 0, 3))
+        self._ospc = _Index((2, 0, 1, 3))
+        self._indexes = (self._spoc, self._posc, self._ospc)
+
+        # ids of the quads added since the indexes were last updated
+        self._pending = array('l')
+        self._lock = threading.Lock()
+
+        # quads per context id, and distinct triples
+        self._contexts = {}
+        self._triples = 0
+
+        self.__namespace = {}
+        self.__prefix = {}
+
+    def open(self, configuration, create=False):
+        if not create:
+            # An ArrayMemory Store never exists.
+            return NO_STORE
+        else:
+            return VALID_STORE
+
+    def bind(self, prefix, namespace):
+        self.__prefix[namespace] = prefix
+        self.__namespace[prefix] = namespace
+
+    def namespace(self, prefix):
+        return self.__namespace.get(prefix, None)
+
+    def prefix(self, namespace):
+        return self.__prefix.get(namespace, None)
+
+    def namespaces(self):
+        for prefix, namespace in self.__namespace.iteritems():
+            yield prefix, namespace
+
+    def _id(self, term):
+        i = self._ids.get(term)
+        if i is None:
+            i = self._ids[term] = len(self._terms)
+            self._terms.append(term)
+        return i
+
+    def _flush(self):
+        """Sort the pending quads into the indexes."""
+        with self._lock:
+            pending = self._pending
+            if not pending:
+                return
+            self._pending = array('l')
+            quads = zip(pending[0::4], pending[1::4], pending[2::4],
+                        pending[3::4])
+            if len(quads) * _REBUILD_RATIO < len(self._spoc):
+                for quad in quads:
+                    if self._spoc.find(quad) < 0:
+                        self._insert(quad)
+            else:
+                for index in self._indexes:
+                    index.merge(quads)
+                self._count()
+
+    def _load(self, quads):
+        """Replace the quads of the store with the given ones."""
+        for index in self._indexes:
+            index.clear()
+            index.merge(quads)
+        self._count()
+
+    def _count(self):
+        """Count the quads per context and the distinct triples."""
+        contexts = {}
+        triples = 0
+        last = None
+        for head, tail in izip(self._spoc.heads, self._spoc.tails):
+            c = tail & _LOW
+            contexts[c] = contexts.get(c, 0) + 1
+            if (head, tail >> 32) != last:
+                last = (head, tail >> 32)
+                triples += 1
+        self._contexts = contexts
+        self._triples = triples
+
+    def _insert(self, quad):
+        s, p, o, c = quad
+        lo, hi = self._spoc.span(s, p, o)
+        if lo == hi:
+            self._triples += 1
+        for index in self._indexes:
+            index.insert(quad)
+        self._contexts[c] = self._contexts.get(c, 0) + 1
+
+    def _delete(self, quad):
+        s, p, o, c = quad
+        for index in self._indexes:
+            index.delete(quad)
+        lo, hi = self._spoc.span(s, p, o)
+        if lo == hi:
+            self._triples -= 1
+        self._contexts[c] -= 1
+        if not self._contexts[c]:
+            del self._contexts[c]
+
+    def _toIds(self, (subject, predicate, object), context):
+        """Ids of the bound terms, or None if one isn't in the store."""
+        ids = self._ids
+        try:
+            return tuple([None if term is Any else ids[term]
+                          for term in (subject, predicate, object, context)])
+        except KeyError:
+            return None
+
+    def _span(self, si, pi, oi):
+        """The index and range of rows matching the ids."""
+        if si is not None:
+            if pi is not None:
+                index = self._spoc
+                return index, index.span(si, pi, oi)
+            if oi is not None:
+                index = self._ospc
+                return index, index.span(oi, si)
+            index = self._spoc
+            return index, index.span(si)
+        if pi is not None:
+            index = self._posc
+            return index, index.span(pi, oi)
+        if oi is not None:
+            index = self._ospc
+            return index, index.span(oi)
+        index = self._spoc
+        return index, index.span()
+
+    def _match(self, si, pi, oi, ci):
+        index, (lo, hi) = self._span(si, pi, oi)
+        for quad in index.rows(lo, hi):
+            if ci is None or quad[3] == ci:
+                yield quad
+
+    def add(self, triple, context, quoted=False):
+        """\
+        Add a triple to the store.
+        """
+        Store.add(self, triple, context, quoted)
+        subject, predicate, object = triple
+        self._pending.extend((self._id(subject), self._id(predicate),
+                              self._id(object), self._id(context)))
+
+    def addN(self, quads):
+        """\
+        Add a batch of quads to the store. Like ``add`` they are only
+        buffered, and sorted into the indexes on the next read.
+        """
+        dispatcher = self.dispatcher
+        dispatch = dispatcher.subscribed(TripleAddedEvent)
+        ids = self._ids
+        terms = self._terms
+        pending = []
+        context = ci = None
+        for s, p, o, c in quads:
+            assert c is not None, "Context associated with %s %s %s is None!"%(s,p,o)
+            if dispatch:
+                dispatcher.dispatch(TripleAddedEvent(triple=(s, p, o), context=c))
+            for term in (s, p, o):
+                i = ids.get(term)
+                if i is None:
+                    i = ids[term] = len(terms)
+                    terms.append(term)
+                pending.append(i)
+            # a batch is mostly in a single context, and graphs are
+            # slow to hash
+            if c is not context:
+                context, ci = c, self._id(c)
+            pending.append(ci)
+        self._pending.extend(pending)
+
+    def remove(self, triple, context=None):
+        Store.remove(self, triple, context)
+        if context is not None:
+            if context == self:
+                context = None
+        self._flush()
+        ids = self._toIds(triple, context)
+        if ids is None:
+            return
+        quads = list(self._match(*ids))
+        with self._lock:
+            if len(quads) * _REBUILD_RATIO < len(self._spoc):
+                for quad in quads:
+                    self._delete(quad)
+            elif quads:
+                removed = set(quads)
+                self._load([quad for quad in self._spoc.rows(0, len(self._spoc))
+                            if quad not in removed])
+
+    def triples(self, triple, context=None):
+        """A generator over all the triples matching """
+        if context is not None:
+            if context == self:
+                context = None
+        self._flush()
+        ids = self._toIds(triple, context)
+        if ids is None:
+            return
+        terms = self._terms
+        last = None
+        for quad in self._match(*ids):
+            s, p, o, c = quad
+            if (s, p, o) == last:
+                continue # the same triple in another context
+            last = (s, p, o)
+            yield (terms[s], terms[p], terms[o]), self._tripleContexts(s, p, o)
+
+    def _tripleContexts(self, s, p, o):
+        terms = self._terms
+        lo, hi = self._spoc.span(s, p, o)
+        for quad in self._spoc.rows(lo, hi):
+            yield terms[quad[3]]
+
+    def estimate(self, triple, context=None):
+        """Number of quads matching the pattern in any context, found
+        by binary search. Used by the SPARQL evaluator to order joins.
+        """
+        self._flush()
+        ids = self._toIds(triple, None)
+        if ids is None:
+            return 0
+        index, (lo, hi) = self._span(*ids[:3])
+        return hi - lo
+
+    def __len__(self, context=None):
+        if context is not None:
+            if context == self:
+                context = None
+        self._flush()
+        if context is None:
+            return self._triples
+        ci = self._ids.get(context)
+        return self._contexts.get(ci, 0)
+
+    def contexts(self, triple=None):
+        self._flush()
+        if triple:
+            ids = self._toIds(triple, None)
+            if ids is None:
+                return
+            for context in self._tripleContexts(*ids[:3]):
+                yield context
+        else:
+            for ci in self._contexts.keys():
+                yield self._terms[ci]
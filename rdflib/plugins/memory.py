@@ -1,6 +1,6 @@
 from __future__ import generators
-from rdflib.term import BNode
-from rdflib.store import Store, NO_STORE, VALID_STORE
+from ..term import BNode
+from ..store import Store, NO_STORE, VALID_STORE, TripleAddedEvent
 
 __all__ = ['Memory', 'IOMemory']
 
@@ -355,6 +355,71 @@ class IOMemory(Store):
             self._setNestedIndex(self.pos, pi, oi, si, ci)
             self._setNestedIndex(self.osp, oi, si, pi, ci)
 
+    def addN(self, quads):
+        """\
+        Add a batch of quads to the store: keys are assigned to the
+        terms of the whole batch first, then each index is filled in
+        turn, without the per triple lookups and events of add.
+        """
+        dispatcher = self.dispatcher
+        dispatch = dispatcher.subscribed(TripleAddedEvent)
+        r = self.reverse
+        rows = []
+        context = None
+        for s, p, o, c in quads:
+            assert c is not None, "Context associated with %s %s %s is None!"%(s,p,o)
+            if dispatch:
+                dispatcher.dispatch(TripleAddedEvent(triple=(s, p, o), context=c))
+            keys = []
+            for identifier in (s, p, o):
+                key = r.get(identifier)
+                if key is None:
+                    key = self._key(identifier)
+                keys.append(key)
+            # graphs are slow to hash, so look the context up only when
+            # it changes
+            if c is not context:
+                context = c
+                ci = r.get(c)
+                if ci is None:
+                    ci = self._key(c)
+            keys.append(ci)
+            rows.append(keys)
+
+        self._fillIndex(self.cspo, rows, (3, 0, 1, 2))
+        self._fillIndex(self.cpos, rows, (3, 1, 2, 0))
+        self._fillIndex(self.cosp, rows, (3, 2, 0, 1))
+        self._fillIndex(self.spo, rows, (0, 1, 2, 3))
+        self._fillIndex(self.pos, rows, (1, 2, 0, 3))
+        self._fillIndex(self.osp, rows, (2, 0, 1, 3))
+
+    def _key(self, identifier):
+        """ Assign a new random key to identifier. """
+        f = self.forward
+        key=randid()
+        while f.has_key(key):
+            key=randid()
+        f[key] = identifier
+        self.reverse[identifier] = key
+        return key
+
+    def _fillIndex(self, index, rows, order):
+        """ Set index[a][b][c][d] = 1 for the keys of each row taken in
+        the given order, like _setNestedIndex. """
+        createIndex = self.createIndex
+        i, j, k, l = order
+        for row in rows:
+            nested = index.get(row[i])
+            if nested is None:
+                nested = index[row[i]] = createIndex()
+            inner = nested.get(row[j])
+            if inner is None:
+                inner = nested[row[j]] = createIndex()
+            nested = inner.get(row[k])
+            if nested is None:
+                nested = inner[row[k]] = createIndex()
+            nested[row[l]] = 1
+
     def _setNestedIndex(self, index, *keys):
         for key in keys[:-1]:
             if not index.has_key(key):
@@ -531,6 +596,59 @@ class IOMemory(Store):
                         ss, pp, oo = self.intToIdentifier((s, p, o))
                         yield (ss, pp, oo), (c for c in self.contexts((ss, pp, oo)))
 
+    def estimate(self, triple, context=None):
+        """Number of triples matching the pattern, read off the indexes.
+
+        Exact unless the whole pattern is unbound, in which case a
+        quick upper bound is returned. Used by the SPARQL evaluator to
+        order joins.
+        """
+        if context is not None:
+            if context == self:
+                context = None
+
+        if context is None:
+            spo = self.spo
+            pos = self.pos
+            osp = self.osp
+        else:
+            try:
+                ci = self.reverse[context]
+                spo = self.cspo[ci]
+                pos = self.cpos[ci]
+                osp = self.cosp[ci]
+            except KeyError:
+                return 0
+
+        subject, predicate, object = triple
+        try:
+            si = subject is not Any and self.reverse[subject]
+            pi = predicate is not Any and self.reverse[predicate]
+            oi = object is not Any and self.reverse[object]
+        except KeyError:
+            return 0
+
+        if si is not False:
+            predicates = spo.get(si, {})
+            if pi is not False:
+                objects = predicates.get(pi, {})
+                if oi is not False:
+                    return int(oi in objects)
+                return len(objects)
+            if oi is not False:
+                return len(osp.get(oi, {}).get(si, {}))
+            return sum([len(objects) for objects in predicates.itervalues()])
+        if pi is not False:
+            objects = pos.get(pi, {})
+            if oi is not False:
+                return len(objects.get(oi, {}))
+            return sum([len(subjects) for subjects in objects.itervalues()])
+        if oi is not False:
+            return sum([len(predicates)
+                        for predicates in osp.get(oi, {}).itervalues()])
+        # everything unbound: more than any pattern with a bound term
+        return len(spo) * max(len(pos), 1)
+
     def __len__(self, context=None):
 
         if context is not None:
@@ -19,17 +19,27 @@ graphs that can be used and queried. The store that backs the graph
 >>> assert(g.value(s, FOAF.name) == "Arco Publications")
 """
 
-from rdflib.py3compat import b
+import re
+
+from ...py3compat import b
+from ... import term
 
 # Build up from the NTriples parser:
-from rdflib.plugins.parsers.ntriples import NTriplesParser
-from rdflib.plugins.parsers.ntriples import ParseError
-from rdflib.plugins.parsers.ntriples import r_tail
-from rdflib.plugins.parsers.ntriples import r_wspace
-from rdflib.plugins.parsers.ntriples import r_wspaces
+from .ntriples import NTriplesParser
+from .ntriples import ParseError
+from .ntriples import r_tail
+from .ntriples import r_wspace
+from .ntriples import r_wspaces
+from .ntriples import withoutgc
+from .ntriples import statement
+from .ntriples import uriref
+from .parallel import parsechunks
 
 __all__ = ['QuadSink', 'NQuadsParser']
 
+# a whole line, the context being the last group
+r_quad = re.compile(statement + b(r'[ \t]+') + uriref + b(r'[ \t]*\.[ \t]*\Z'))
+
 class QuadSink(object):
     def __init__(self):
         class FakeStore(object):
@@ -48,6 +58,10 @@ class QuadSink(object):
             yield s,p,o,ctx
 
 class NQuadsParser(NTriplesParser):
+
+    # quads are added to the store with addN, this many at a time
+    batch = 10000
+
     def __init__(self, sink=None):
         if sink is not None:
             assert sink.store.context_aware, ("NQuadsParser must be given"
@@ -60,21 +74,46 @@ class NQuadsParser(NTriplesParser):
         assert sink.store.context_aware, ("NQuadsParser must be given"
                                           " a context aware store.")
         self.sink = sink
+        self.terms = kwargs.get('pool', self.pool)
+        if self.terms is None:
+            self.terms = term.defaultTermPool
         
         source = inputsource.getByteStream()
         
         if not hasattr(source, 'read'):
             raise ParseError("Item to parse must be a file-like object.")
 
+        processes = kwargs.get('processes')
+        if processes:
+            for quads in parsechunks(source, NQuadsParser, processes, True,
+                                     self.terms):
+                withoutgc(sink.store.addN, quads)
+            return self.sink
+
         self.file = source
         self.buffer = ''
+        self.lines = []
+        self.index = 0
+        self.quads = []
+        try:
+            withoutgc(self.parselines)
+        finally:
+            withoutgc(self.flush)
+        return self.sink
+
+    def parselines(self):
         while True:
             self.line = self.readline()
             if self.line is None: break
             try: self.parseline()
             except ParseError:
                raise ParseError("Invalid line: %r" % self.line)
-        return self.sink
+
+    def flush(self):
+        """Add the quads parsed so far to the store."""
+        if self.quads:
+            self.sink.store.addN(self.quads)
+            self.quads = []
   
     def context(self):
         context = self.uriref()
@@ -83,6 +122,15 @@ class NQuadsParser(NTriplesParser):
         return context
   
     def parseline(self):
+        m = r_quad.match(self.line)
+        if m is None:
+            # comments, empty lines, and errors
+            return self.parsetokens()
+        subject, predicate, obj = self.statement(m)
+        self.addquad(subject, predicate, obj, self.makeuri(m.group(9)))
+
+    def parsetokens(self):
+        """Parse the line token by token."""
         self.eat(r_wspace)
         if (not self.line) or self.line.startswith(b('#')):
             return # The line is empty or a comment
@@ -101,7 +149,12 @@ class NQuadsParser(NTriplesParser):
 
         if self.line:
             raise ParseError("Trailing garbage")
+        self.addquad(subject, predicate, obj, context)
+
+    def addquad(self, subject, predicate, obj, context):
         # Must have a context aware store - add on a normal Graph
         # discards anything where the ctx != graph.identifier
-        self.sink.store.add((subject, predicate, obj), context)
+        self.quads.append((subject, predicate, obj, context))
+        if len(self.quads) >= self.batch:
+            self.flush()
 
@@ -1,28 +1,56 @@
-from rdflib.parser import Parser
-from rdflib.plugins.parsers.ntriples import NTriplesParser
+from ...parser import Parser
+from .ntriples import NTriplesParser, withoutgc
+from .parallel import parsechunks
 
 __all__ = ['NTSink', 'NTParser']
 
 class NTSink(object):
+    """Adds the triples it is given to the graph with ``addN``, a
+    batch of ``batch`` at a time, so that the store can index them
+    together. Call ``flush`` to add the last batch."""
+
+    batch = 10000
+
     def __init__(self, graph):
         self.graph = graph
+        self.quads = []
 
     def triple(self, s, p, o):
-        self.graph.add((s, p, o))
+        self.quads.append((s, p, o, self.graph))
+        if len(self.quads) >= self.batch:
+            self.flush()
+
+    def flush(self):
+        if self.quads:
+            self.graph.addN(self.quads)
+            self.quads = []
 
 
 class NTParser(Parser):
     """parser for the ntriples format, often stored with the .nt extension
 
-    See http://www.w3.org/TR/rdf-testcases/#ntriples"""
+    See http://www.w3.org/TR/rdf-testcases/#ntriples
+
+    With ``processes`` the file is parsed in chunks by that many
+    processes, see :mod:`rdflib.plugins.parsers.parallel`."""
 
     def __init__(self):
         super(NTParser, self).__init__()
 
-    def parse(self, source, sink, baseURI=None):
+    def parse(self, source, sink, baseURI=None, pool=None, processes=None):
         f = source.getByteStream() # TODO getCharacterStream?
-        parser = NTriplesParser(NTSink(sink))
-        parser.parse(f)
+        if processes:
+            for triples in parsechunks(f, NTriplesParser, processes,
+                                       pool=pool):
+                withoutgc(sink.addN, [(s, p, o, sink) for s, p, o in triples])
+            f.close()
+            return
+        ntsink = NTSink(sink)
+        parser = NTriplesParser(ntsink, pool)
+        try:
+            withoutgc(parser.parse, f)
+        finally:
+            withoutgc(ntsink.flush)
         f.close()
 
 
@@ -5,28 +5,40 @@ License: GPL 2, W3C, BSD, or MIT
 Author: Sean B. Palmer, inamidst.com
 """
 
+import gc
 import re
-from rdflib.term import URIRef as URI
-from rdflib.term import BNode as bNode
-from rdflib.term import Literal
+from ...term import URIRef as URI
+from ...term import BNode as bNode
+from ...term import Literal
+from ... import term
 
-from rdflib.py3compat import b, cast_bytes
+from ...py3compat import b, cast_bytes
 
 __all__ = ['unquote', 'uriquote', 'Sink', 'NTriplesParser']
 
 uriref = b(r'<([^:]+:[^\s"<>]+)>')
 literal = b(r'"([^"\\]*(?:\\.[^"\\]*)*)"')
 litinfo = b(r'(?:@([a-z]+(?:-[a-z0-9]+)*)|\^\^') + uriref + b(r')?')
+nodeid = b(r'_:([A-Za-z][A-Za-z0-9]*)')
+
+# the subject, predicate and object of a line in one go: their groups
+# are the subject uriref or nodeID, the predicate, the object uriref,
+# nodeID or literal, and the literal's language or datatype
+statement = (b(r'[ \t]*(?:') + uriref + b('|') + nodeid + b(r')[ \t]+') +
+             uriref + b(r'[ \t]+(?:') + uriref + b('|') + nodeid + b('|') +
+             literal + litinfo + b(')'))
 
 r_line = re.compile(b(r'([^\r\n]*)(?:\r\n|\r|\n)'))
 r_wspace = re.compile(b(r'[ \t]*'))
 r_wspaces = re.compile(b(r'[ \t]+'))
 r_tail = re.compile(b(r'[ \t]*\.[ \t]*'))
 r_uriref = re.compile(uriref)
-r_nodeid = re.compile(b(r'_:([A-Za-z][A-Za-z0-9]*)'))
+r_nodeid = re.compile(nodeid)
 r_literal = re.compile(literal + litinfo)
+r_unplain = re.compile(b(r'[\\\x80-\xff]'))
+r_triple = re.compile(statement + b(r'[ \t]*\.[ \t]*\Z'))
 
-bufsiz = 2048
+bufsiz = 1 << 16
 validate = False
 
 class Node(unicode): pass
@@ -87,6 +99,18 @@ def uriquote(uri):
         return r_hibyte.sub(
             lambda m: '%%%02X' % ord(m.group(1)), uri)
 
+def withoutgc(function, *args):
+    """Call function(*args) with the cyclic garbage collector paused.
+    A bulk load makes a great many objects but no reference cycles,
+    and each collection would walk the whole store loaded so far."""
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return function(*args)
+    finally:
+        if enabled:
+            gc.enable()
+
 class NTriplesParser(object):
     """An N-Triples Parser.
     
@@ -94,20 +118,34 @@ class NTriplesParser(object):
 
           p = NTriplesParser(sink=MySink())
           sink = p.parse(f) # file; use parsestring for a string
+
+    URIRefs and Literals are made through ``pool`` if it's a
+    :class:`~rdflib.term.TermPool`, or else through
+    :data:`~rdflib.term.defaultTermPool` if that is set. Blank node
+    ids are their label prefixed with ``scope``.
     """
 
-    def __init__(self, sink=None):
+    pool = None
+    scope = u''
+
+    def __init__(self, sink=None, pool=None):
         if sink is not None:
             self.sink = sink
         else: self.sink = Sink()
+        self.pool = pool
 
     def parse(self, f):
         """Parse f as an N-Triples file."""
         if not hasattr(f, 'read'):
             raise ParseError("Item to parse must be a file-like object.")
 
+        self.terms = self.pool
+        if self.terms is None:
+            self.terms = term.defaultTermPool
         self.file = f
         self.buffer = ''
+        self.lines = []
+        self.index = 0
         while True:
             self.line = self.readline()
             if self.line is None: break
@@ -132,26 +170,59 @@ class NTriplesParser(object):
     def readline(self):
         """Read an N-Triples line from buffered input."""
         # N-Triples lines end in either CRLF, CR, or LF
-        # Therefore, we can't just use f.readline()
-        if not self.buffer:
+        # Therefore, we can't just use f.readline(), but str.splitlines
+        # splits at just these, so a block is split at once and its
+        # lines handed out one by one
+        while self.index >= len(self.lines):
             buffer = self.file.read(bufsiz)
-            if not buffer: return None
-            self.buffer = buffer
-
-        while True:
-            m = r_line.match(self.buffer)
-            if m: # the more likely prospect
-                self.buffer = self.buffer[m.end():]
-                return m.group(1)
-            else:
-                buffer = self.file.read(bufsiz)
-                if not buffer and not self.buffer.isspace():
+            data = self.buffer + buffer
+            self.lines = []
+            self.index = 0
+            if not buffer:
+                self.buffer = ''
+                if data.endswith(b('\r')):
+                    return data[:-1]
+                if data and not data.isspace():
                     raise ParseError("EOF in line")
-                elif not buffer:
-                    return None
-                self.buffer += buffer
+                return None
+            # the rest of the block after its last line end is kept for
+            # the next, and so is a CR at its very end, which may be the
+            # start of a CRLF
+            end = max(data.rfind(b('\n')),
+                      data.rfind(b('\r'), 0, len(data) - 1)) + 1
+            self.lines = data[:end].splitlines()
+            self.buffer = data[end:]
+        line = self.lines[self.index]
+        self.index += 1
+        return line
 
     def parseline(self):
+        m = r_triple.match(self.line)
+        if m is None:
+            # comments, empty lines, and errors
+            return self.parsetokens()
+        subject, predicate, object = self.statement(m)
+        self.sink.triple(subject, predicate, object)
+
+    def statement(self, m):
+        """The terms of a statement matched by r_triple."""
+        (suri, snode, puri, ouri, onode,
+         lit, lang, dtype) = m.group(1, 2, 3, 4, 5, 6, 7, 8)
+        if suri is not None:
+            subject = self.makeuri(suri)
+        else:
+            subject = bNode(self.scope + snode.decode())
+        predicate = self.makeuri(puri)
+        if ouri is not None:
+            object = self.makeuri(ouri)
+        elif onode is not None:
+            object = bNode(self.scope + onode.decode())
+        else:
+            object = self.makeliteral(lit, lang, dtype)
+        return subject, predicate, object
+
+    def parsetokens(self):
+        """Parse the line token by token."""
         self.eat(r_wspace)
         if (not self.line) or self.line.startswith(b('#')):
             return # The line is empty or a comment
@@ -202,34 +273,47 @@ class NTriplesParser(object):
 
     def uriref(self):
         if self.peek(b('<')):
-            uri = self.eat(r_uriref).group(1)
-            uri = unquote(uri)
-            uri = uriquote(uri)
-            return URI(uri)
+            return self.makeuri(self.eat(r_uriref).group(1))
         return False
 
     def nodeid(self):
         if self.peek(b('_')):
-            return bNode(self.eat(r_nodeid).group(1).decode())
+            return bNode(self.scope + self.eat(r_nodeid).group(1).decode())
         return False
 
     def literal(self):
         if self.peek(b('"')):
-            lit, lang, dtype = self.eat(r_literal).groups()
-            if lang:
-                lang = lang.decode() 
-            else:
-                lang = None
-            if dtype:
-                dtype = dtype.decode()
-            else: 
-                dtype = None
-            if lang and dtype:
-                raise ParseError("Can't have both a language and a datatype")
-            lit = unquote(lit)
-            return Literal(lit, lang, dtype)
+            return self.makeliteral(*self.eat(r_literal).groups())
         return False
 
+    def makeuri(self, uri):
+        if validate or r_unplain.search(uri):
+            uri = unquote(uri)
+            uri = uriquote(uri)
+        # else there's nothing to unquote
+        if self.terms is not None:
+            return self.terms.uriref(uri)
+        return URI(uri)
+
+    def makeliteral(self, lit, lang, dtype):
+        if lang:
+            lang = lang.decode() 
+        else:
+            lang = None
+        if dtype:
+            dtype = dtype.decode()
+        else: 
+            dtype = None
+        if lang and dtype:
+            raise ParseError("Can't have both a language and a datatype")
+        if validate or r_unplain.search(lit):
+            lit = unquote(lit)
+        else:
+            lit = lit.decode('ascii') # nothing to unquote
+        if self.terms is not None:
+            return self.terms.literal(lit, lang, dtype)
+        return Literal(lit, lang, dtype)
+
 # # Obsolete, unused
 # def parseURI(uri):
 #     import urllib
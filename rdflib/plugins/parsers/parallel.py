@@ -0,0 +1,138 @@
+"""
+Parses line-based RDF -- N-Triples and N-Quads -- in a pool of
+processes.
+
+The input is cut into chunks at line ends, and each process parses
+its chunks with the ordinary parser into a table of the distinct terms
+of the chunk and an array of their ids per statement, which is all it
+sends back. A file on disk isn't read by this process at all: the
+workers are only given the byte range of their chunk. Blank node
+labels are scoped to the document, as every chunk of it prefixes them
+with the same fresh id.
+"""
+
+import os
+from array import array
+from cStringIO import StringIO
+from multiprocessing import Pool
+
+from ... import term
+from ...term import URIRef, BNode, Literal
+from ...parser import StringInputSource
+
+__all__ = ['parsechunks']
+
+# at least this many bytes per chunk, and about this many chunks per
+# process so that processes done early can take over some work
+minchunk = 1 << 20
+chunksperprocess = 4
+
+
+class ChunkSink(object):
+    """Keeps the statements of a chunk as ids in a table of its terms.
+    It stands in for the store of an NQuadsParser too."""
+
+    context_aware = True
+
+    def __init__(self):
+        self.store = self
+        self.ids = {}
+        self.terms = []
+        self.rows = array('l')
+
+    def id(self, term):
+        i = self.ids.get(term)
+        if i is None:
+            i = self.ids[term] = len(self.terms)
+            self.terms.append(term)
+        return i
+
+    def triple(self, s, p, o):
+        self.rows.extend((self.id(s), self.id(p), self.id(o)))
+
+    def addN(self, quads):
+        for quad in quads:
+            self.rows.extend([self.id(term) for term in quad])
+
+
+def _parsechunk((parser, quads, source, start, end, scope)):
+    """Parse a chunk in a worker process. source is the chunk, or the
+    path of the file to read it from between start and end."""
+    if start is None:
+        data = source
+    else:
+        f = open(source, 'rb')
+        try:
+            f.seek(start)
+            data = f.read(end - start)
+        finally:
+            f.close()
+    sink = ChunkSink()
+    p = parser(sink)
+    p.scope = scope
+    if quads:
+        p.parse(StringInputSource(data), sink)
+    else:
+        p.parse(StringIO(data))
+    return sink.terms, sink.rows.tostring()
+
+
+def _chunks(f, processes):
+    """Cut f at line ends into chunks, as (source, start, end)."""
+    if isinstance(f, file) and os.path.isfile(f.name):
+        path = os.path.abspath(f.name)
+        start = f.tell()
+        size = os.fstat(f.fileno()).st_size
+        step = max(minchunk, (size - start) // (processes * chunksperprocess))
+        while start < size:
+            f.seek(start + step)
+            f.readline()
+            end = min(f.tell(), size)
+            yield path, start, end
+            start = end
+        f.seek(size)
+    else:
+        data = f.read()
+        start = 0
+        step = max(minchunk, len(data) // (processes * chunksperprocess))
+        while start < len(data):
+            end = data.find('\n', start + step) + 1 or len(data)
+            yield data[start:end], None, None
+            start = end
+
+
+def _pooled(pool, t):
+    if isinstance(t, URIRef):
+        return pool.uriref(t)
+    if isinstance(t, Literal):
+        return pool.literal(t, t.language, t.datatype)
+    return t
+
+
+def parsechunks(f, parser, processes, quads=False, pool=None):
+    """
+    Parse the N-Triples in file f, or N-Quads if quads is true, with
+    instances of parser in a pool of processes. Yields a list of the
+    statements of each chunk, as tuples of terms, in the order of the
+    file. The terms are made through the
+    :class:`~rdflib.term.TermPool` pool, or defaultTermPool if that is
+    set, like the parser would.
+    """
+    if pool is None:
+        pool = term.defaultTermPool
+    scope = unicode(BNode()) + u'_'
+    width = quads and 4 or 3
+    tasks = [(parser, quads, source, start, end, scope)
+             for source, start, end in _chunks(f, processes)]
+    workers = Pool(processes)
+    try:
+        for terms, rows in workers.imap(_parsechunk, tasks):
+            ids = array('l')
+            ids.fromstring(rows)
+            if pool is not None:
+                terms = [_pooled(pool, t) for t in terms]
+            statement = [terms[i] for i in ids]
+            yield zip(*[statement[i::width] for i in range(width)])
+        workers.close()
+    finally:
+        workers.terminate()
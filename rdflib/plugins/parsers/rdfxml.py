@@ -36,12 +36,13 @@ from xml.sax.handler import ErrorHandler
 from xml.sax.saxutils import handler, quoteattr, escape
 from urlparse import urljoin, urldefrag
 
-from rdflib.namespace import RDF, is_ncname
-from rdflib.term import URIRef
-from rdflib.term import BNode
-from rdflib.term import Literal
-from rdflib.exceptions import ParserError, Error
-from rdflib.parser import Parser
+from ...namespace import RDF, is_ncname
+from ... import term
+from ...term import URIRef
+from ...term import BNode
+from ...term import Literal
+from ...exceptions import ParserError, Error
+from ...parser import Parser
 
 __all__ = ['create_parser', 'BagID', 'ElementHandler', 'RDFXMLHandler', 'RDFXMLParser']
 
@@ -119,8 +120,19 @@ class RDFXMLHandler(handler.ContentHandler):
     def __init__(self, store):
         self.store = store
         self.preserve_bnode_ids = False
+        self.pool = None
         self.reset()
 
+    def uriref(self, value):
+        if self.pool is None:
+            return URIRef(value)
+        return self.pool.uriref(value)
+
+    def literal(self, value, lang=None, datatype=None):
+        if self.pool is None:
+            return Literal(value, lang, datatype)
+        return self.pool.literal(value, lang, datatype)
+
     def reset(self):
         document_element = ElementHandler()
         document_element.start = self.document_element_start
@@ -226,19 +238,19 @@ class RDFXMLHandler(handler.ContentHandler):
         result = urljoin(self.current.base, uri, allow_fragments=1)
         if uri and uri[-1]=="#" and result[-1]!="#":
             result = "%s#" % result
-        return URIRef(result)
+        return self.uriref(result)
 
     def convert(self, name, qname, attrs):
         if name[0] is None:
-            name = URIRef(name[1])
+            name = self.uriref(name[1])
         else:
-            name = URIRef("".join(name))
+            name = self.uriref("".join(name))
         atts = {}
         for (n, v) in attrs.items(): #attrs._attrs.iteritems(): #
             if n[0] is None:
-                att = URIRef(n[1])
+                att = self.uriref(n[1])
             else:
-                att = URIRef("".join(n))
+                att = self.uriref("".join(n))
             if att.startswith(XMLNS) or att[0:3].lower()=="xml":
                 pass
             elif att in UNQUALIFIED:
@@ -314,7 +326,7 @@ class RDFXMLHandler(handler.ContentHandler):
             if not att.startswith(str(RDFNS)):
                 predicate = absolutize(att)
                 try:
-                    object = Literal(atts[att], language)
+                    object = self.literal(atts[att], language)
                 except Error, e:
                     self.error(e.msg)
             elif att==RDF.type: #S2
@@ -328,7 +340,7 @@ class RDFXMLHandler(handler.ContentHandler):
             else:
                 predicate = absolutize(att)
                 try:
-                    object = Literal(atts[att], language)
+                    object = self.literal(atts[att], language)
                 except Error, e:
                     self.error(e.msg)
             self.store.add((subject, predicate, object))
@@ -439,11 +451,11 @@ class RDFXMLHandler(handler.ContentHandler):
                     predicate = absolutize(att)
 
                 if att==RDF.type:
-                    o = URIRef(atts[att])
+                    o = self.uriref(atts[att])
                 else:
                     if datatype is not None:
                         language = None
-                    o = Literal(atts[att], language, datatype)
+                    o = self.literal(atts[att], language, datatype)
 
                 if object is None:
                     object = BNode()
@@ -466,7 +478,7 @@ class RDFXMLHandler(handler.ContentHandler):
             literalLang = current.language
             if current.datatype is not None:
                 literalLang = None
-            current.object = Literal(current.data, literalLang, current.datatype)
+            current.object = self.literal(current.data, literalLang, current.datatype)
             current.data = None
         if self.next.end==self.list_node_element_end:
             if current.object!=RDF.nil:
@@ -570,6 +582,10 @@ class RDFXMLParser(Parser):
         preserve_bnode_ids = args.get("preserve_bnode_ids", None)
         if preserve_bnode_ids is not None:
             content_handler.preserve_bnode_ids = preserve_bnode_ids
+        pool = args.get("pool")
+        if pool is None:
+            pool = term.defaultTermPool
+        content_handler.pool = pool
         # We're only using it once now
         #content_handler.reset()
         #self._parser.reset()
@@ -0,0 +1,280 @@
+"""
+A read-only store over a snapshot file, opened with ``mmap``.
+
+A snapshot is written from any Graph with :func:`write_snapshot`, and
+holds what an :class:`~rdflib.plugins.arraymemory.ArrayMemory` holds in
+memory: a dictionary of the terms, sorted so that a term's id is its
+rank, and the spoc, posc and ospc permutations of the quads as sorted
+columns of 64 bit integers. Nothing is parsed or copied when it is
+opened -- terms are decoded and index rows read from the mapped file
+as they are needed -- so opening is near instant whatever the size of
+the graph, processes opening the same file share one copy of it in
+the page cache, and pages nobody reads can be dropped by the OS.
+
+Usage::
+
+    write_snapshot(graph, 'registry.snapshot')
+
+    graph = ConjunctiveGraph('Snapshot')
+    graph.open('registry.snapshot')
+
+The file is little-endian, and laid out as a header of eight 64 bit
+numbers -- the magic, then the numbers of terms, quads, distinct
+triples and contexts, and the lengths of the term and namespace data
+-- followed by the term offsets, the (context id, quads) pairs, the
+heads and tails columns of each index, the encoded terms, and the
+namespace bindings.
+"""
+
+import os
+import mmap
+import struct
+
+from ..term import URIRef, BNode, Literal
+from ..store import NO_STORE, VALID_STORE, CORRUPTED_STORE
+from .arraymemory import ArrayMemory, _Index
+
+__all__ = ['Snapshot', 'write_snapshot']
+
+MAGIC = 'RDFSNAP1'
+_HEADER = struct.Struct('<8s6q')
+_INT = struct.Struct('<q')
+
+# the order of the ids in the rows of each index, as in ArrayMemory
+_ORDERS = ((0, 1, 2, 3), (1, 2, 0, 3), (2, 0, 1, 3))
+
+
+def _encode(term):
+    """The bytes a term is stored and sorted as. Contexts may be given
+    as graphs, which are stored as their identifier."""
+    term = getattr(term, 'identifier', term)
+    if isinstance(term, Literal):
+        return 'L%s\0%s\0%s' % ((term.language or '').encode('utf-8'),
+                                (term.datatype or '').encode('utf-8'),
+                                term.encode('utf-8'))
+    if isinstance(term, BNode):
+        return 'B' + term.encode('utf-8')
+    if isinstance(term, URIRef):
+        return 'U' + term.encode('utf-8')
+    raise TypeError("Can't store %r in a snapshot" % (term,))
+
+
+def _decode(data):
+    kind = data[0]
+    if kind == 'U':
+        return URIRef(data[1:].decode('utf-8'))
+    if kind == 'B':
+        return BNode(data[1:].decode('utf-8'))
+    language, datatype, value = data[1:].split('\0', 2)
+    return Literal(value.decode('utf-8'), lang=language or None,
+                   datatype=datatype and URIRef(datatype.decode('utf-8')) or None)
+
+
+def _int64s(numbers):
+    # array('l') is only 32 bits on Windows and 32 bit builds
+    return struct.pack('<%dq' % len(numbers), *numbers)
+
+
+def write_snapshot(graph, path):
+    """
+    Write the quads and namespace bindings of graph to a snapshot file
+    at path. The file is written next to path and then renamed, so
+    processes opening path meanwhile still get the old snapshot.
+    """
+    if graph.context_aware:
+        quads = graph.quads((None, None, None))
+    else:
+        quads = ((s, p, o, graph.identifier) for s, p, o in graph)
+
+    # number the distinct terms as they come, then renumber by rank
+    ids = {}
+    rows = set()
+    for quad in quads:
+        row = []
+        for term in quad:
+            data = _encode(term)
+            i = ids.get(data)
+            if i is None:
+                i = ids[data] = len(ids)
+            row.append(i)
+        rows.add(tuple(row))
+    terms = sorted(ids)
+    rank = [0] * len(terms)
+    for r, data in enumerate(terms):
+        rank[ids[data]] = r
+    rows = [(rank[s], rank[p], rank[o], rank[c]) for s, p, o, c in rows]
+
+    contexts = {}
+    for row in rows:
+        contexts[row[3]] = contexts.get(row[3], 0) + 1
+    triples = len(set([row[:3] for row in rows]))
+    offsets = [0]
+    for data in terms:
+        offsets.append(offsets[-1] + len(data))
+    termdata = ''.join(terms)
+    namespaces = '\0'.join(['%s\0%s' % (prefix.encode('utf-8'),
+                                        namespace.encode('utf-8'))
+                            for prefix, namespace in graph.namespaces()])
+
+    temporary = path + '.tmp'
+    f = open(temporary, 'wb')
+    try:
+        f.write(_HEADER.pack(MAGIC, len(terms), len(rows), triples,
+                             len(contexts), len(termdata), len(namespaces)))
+        f.write(_int64s(offsets))
+        f.write(_int64s([n for pair in sorted(contexts.items()) for n in pair]))
+        for order in _ORDERS:
+            index = _Index(order)
+            index.merge(rows)
+            f.write(_int64s(index.heads))
+            f.write(_int64s(index.tails))
+        f.write(termdata)
+        f.write(namespaces)
+    finally:
+        f.close()
+    os.rename(temporary, path)
+
+
+class _Column(object):
+    """The 64 bit integers at offset in a buffer, as a read-only
+    sequence that bisect can search. Indexes aren't checked, as
+    only the store's own searches use it."""
+
+    __slots__ = ('buffer', 'offset', 'length')
+
+    def __init__(self, buffer, offset, length):
+        self.buffer = buffer
+        self.offset = offset
+        self.length = length
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, i, unpack=_INT.unpack_from):
+        return unpack(self.buffer, self.offset + 8 * i)[0]
+
+
+class _Terms(object):
+    """The terms of a snapshot by id, decoded from the mapped file
+    when asked for."""
+
+    def __init__(self, buffer, offsets, start):
+        self.buffer = buffer
+        self.offsets = offsets
+        self.start = start
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def data(self, i):
+        offsets = self.offsets
+        return self.buffer[self.start + offsets[i]:self.start + offsets[i + 1]]
+
+    def __getitem__(self, i):
+        return _decode(self.data(i))
+
+
+class _Ids(object):
+    """The ids of the terms of a snapshot, found by binary search of
+    their encodings."""
+
+    def __init__(self, terms):
+        self.terms = terms
+
+    def get(self, term, default=None):
+        try:
+            data = _encode(term)
+        except TypeError:
+            return default
+        terms = self.terms
+        buffer, start = terms.buffer, terms.start
+        offsets = terms.offsets
+        unpack, base = _INT.unpack_from, offsets.offset
+        lo, hi = 0, len(terms)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            i = base + 8 * mid
+            if buffer[start + unpack(buffer, i)[0]:
+                      start + unpack(buffer, i + 8)[0]] < data:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(terms) and terms.data(lo) == data:
+            return lo
+        return default
+
+    def __getitem__(self, term):
+        i = self.get(term)
+        if i is None:
+            raise KeyError(term)
+        return i
+
+    def __contains__(self, term):
+        return self.get(term) is not None
+
+
+class Snapshot(ArrayMemory):
+    """\
+    A read-only, context-aware store over a snapshot file written by
+    write_snapshot. The configuration is the path of the file.
+    """
+
+    def __init__(self, configuration=None, identifier=None):
+        super(Snapshot, self).__init__(None, identifier)
+        self._map = None
+        if configuration:
+            self.open(configuration)
+
+    def open(self, configuration, create=False):
+        if not os.path.exists(configuration):
+            return NO_STORE
+        if os.path.getsize(configuration) < _HEADER.size:
+            return CORRUPTED_STORE
+        f = open(configuration, 'rb')
+        try:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        finally:
+            f.close()
+        if buffer[:len(MAGIC)] != MAGIC:
+            buffer.close()
+            return CORRUPTED_STORE
+        (magic, terms, quads, triples, contexts, termdata,
+         namespaces) = _HEADER.unpack_from(buffer, 0)
+
+        offset = _HEADER.size
+        offsets = _Column(buffer, offset, terms + 1)
+        offset += 8 * (terms + 1)
+        pairs = _Column(buffer, offset, 2 * contexts)
+        self._contexts = dict([(pairs[i], pairs[i + 1])
+                               for i in range(0, len(pairs), 2)])
+        offset += 16 * contexts
+        for index in self._indexes:
+            index.heads = _Column(buffer, offset, quads)
+            index.tails = _Column(buffer, offset + 8 * quads, quads)
+            offset += 16 * quads
+        self._terms = _Terms(buffer, offsets, offset)
+        self._ids = _Ids(self._terms)
+        self._triples = triples
+        offset += termdata
+
+        if namespaces:
+            pairs = buffer[offset:offset + namespaces].split('\0')
+            for prefix, namespace in zip(pairs[0::2], pairs[1::2]):
+                self.bind(prefix.decode('utf-8'),
+                          URIRef(namespace.decode('utf-8')))
+        self._map = buffer
+        return VALID_STORE
+
+    def close(self, commit_pending_transaction=False):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+    def add(self, triple, context, quoted=False):
+        raise TypeError("Snapshot stores are read-only")
+
+    def addN(self, quads):
+        raise TypeError("Snapshot stores are read-only")
+
+    def remove(self, triple, context=None):
+        raise TypeError("Snapshot stores are read-only")
@@ -0,0 +1,13 @@
+"""
+A small built-in SPARQL engine for :meth:`rdflib.graph.Graph.query`.
+
+It evaluates the subset of SPARQL 1.0 that is generated by telescope's
+query compiler: SELECT, ASK and CONSTRUCT queries over basic graph
+patterns, OPTIONAL, UNION and FILTER, with ORDER BY, LIMIT, OFFSET,
+DISTINCT and REDUCED. Named graphs (FROM, GRAPH) and DESCRIBE are not
+supported.
+
+>>> from rdflib import Graph
+>>> rows = Graph().query("SELECT ?s WHERE { ?s ?p ?o }")
+
+"""
@@ -0,0 +1,547 @@
+"""
+Evaluation of parsed queries (see :mod:`rdflib.plugins.sparql.parser`)
+against a :class:`~rdflib.graph.Graph`.
+
+Solutions are dictionaries mapping variables to terms, and are produced
+lazily, so ASK queries and unordered queries with a LIMIT stop as soon as
+they have enough of them.
+
+Basic graph patterns are evaluated as nested index lookups. Before every
+lookup the remaining triple pattern with the fewest expected matches is
+chosen, using the current bindings and the ``estimate`` method of the
+store when it has one (see :meth:`rdflib.plugins.memory.IOMemory.estimate`)
+and the number of unbound positions otherwise. Filters are applied as soon
+as all their variables are bound by the basic graph patterns of their group,
+and filters like ``?name = "B0015" || ?name = "B0034"`` bind their variable
+before the lookups, so they don't need to scan the matching triples.
+"""
+
+import re
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from ...term import URIRef, BNode, Literal, Variable
+from ...graph import Graph, ConjunctiveGraph
+from .parser import XSD
+
+__all__ = ['evalQuery']
+
+XSD_STRING = URIRef(XSD + 'string')
+XSD_BOOLEAN = URIRef(XSD + 'boolean')
+XSD_INTEGER = URIRef(XSD + 'integer')
+XSD_DECIMAL = URIRef(XSD + 'decimal')
+XSD_DOUBLE = URIRef(XSD + 'double')
+
+_INTEGERS = frozenset([URIRef(XSD + name) for name in (
+    'integer', 'int', 'long', 'short', 'byte', 'nonNegativeInteger',
+    'positiveInteger', 'nonPositiveInteger', 'negativeInteger',
+    'unsignedLong', 'unsignedInt', 'unsignedShort', 'unsignedByte')])
+_FLOATS = frozenset([URIRef(XSD + 'float'), XSD_DOUBLE])
+
+TRUE = Literal(u'true', datatype=XSD_BOOLEAN)
+FALSE = Literal(u'false', datatype=XSD_BOOLEAN)
+
+
+class _EvalError(Exception):
+    """A type error while evaluating an expression; filters treat it as false."""
+
+
+def _boolean(value):
+    return value and TRUE or FALSE
+
+
+def _numeric(term):
+    """The Python value of a numeric literal, or None."""
+    if not isinstance(term, Literal) or term.datatype is None:
+        return None
+    try:
+        if term.datatype in _INTEGERS:
+            return int(unicode(term))
+        if term.datatype == XSD_DECIMAL:
+            return Decimal(unicode(term))
+        if term.datatype in _FLOATS:
+            return float(unicode(term))
+    except (ValueError, InvalidOperation):
+        raise _EvalError()
+    return None
+
+
+def _toLiteral(value):
+    if isinstance(value, float):
+        return Literal(repr(value), datatype=XSD_DOUBLE)
+    if isinstance(value, Decimal):
+        return Literal(unicode(value), datatype=XSD_DECIMAL)
+    return Literal(unicode(value), datatype=XSD_INTEGER)
+
+
+def _isString(term):
+    return isinstance(term, Literal) and \
+        (term.datatype is None or term.datatype == XSD_STRING)
+
+
+def _ebv(term):
+    """The effective boolean value of a term."""
+    if isinstance(term, Literal):
+        if term.datatype == XSD_BOOLEAN:
+            return unicode(term) in (u'true', u'1')
+        number = _numeric(term)
+        if number is not None:
+            return bool(number) and number == number
+        if _isString(term):
+            return len(term) > 0
+    raise _EvalError()
+
+
+def _tryEBV(expression, solution):
+    try:
+        return _ebv(_eval(expression, solution))
+    except _EvalError:
+        return None
+
+
+def _sameTerm(a, b):
+    return type(a) is type(b) and unicode(a) == unicode(b) and \
+        getattr(a, 'language', None) == getattr(b, 'language', None) and \
+        getattr(a, 'datatype', None) == getattr(b, 'datatype', None)
+
+
+def _compare(a, b):
+    """cmp() of two terms by value, raising _EvalError when they are not comparable."""
+    x, y = _numeric(a), _numeric(b)
+    if x is not None and y is not None:
+        if isinstance(x, float) or isinstance(y, float):
+            x, y = float(x), float(y)
+        return cmp(x, y)
+    if _isString(a) and _isString(b) and a.language == b.language:
+        return cmp(unicode(a), unicode(b))
+    if isinstance(a, Literal) and isinstance(b, Literal) and \
+            a.datatype is not None and a.datatype == b.datatype:
+        return cmp(unicode(a), unicode(b))
+    raise _EvalError()
+
+
+def _equal(a, b):
+    try:
+        return _compare(a, b) == 0
+    except _EvalError:
+        if isinstance(a, Literal) and isinstance(b, Literal) and \
+                not _sameTerm(a, b):
+            raise
+        return _sameTerm(a, b)
+
+
+_RELATIONS = {
+    '<': lambda c: c < 0,
+    '>': lambda c: c > 0,
+    '<=': lambda c: c <= 0,
+    '>=': lambda c: c >= 0,
+}
+
+_ARITHMETIC = {
+    '+': lambda x, y: x + y,
+    '-': lambda x, y: x - y,
+    '*': lambda x, y: x * y,
+}
+
+_REGEX_FLAGS = {'i': re.I, 's': re.S, 'm': re.M, 'x': re.X}
+_regexes = {}
+
+
+def _regex(text, pattern, flags=Literal(u'')):
+    if not isinstance(text, Literal) or not _isString(pattern) or \
+            not _isString(flags):
+        raise _EvalError()
+    key = (unicode(pattern), unicode(flags))
+    compiled = _regexes.get(key)
+    if compiled is None:
+        options = re.U
+        for flag in flags:
+            try:
+                options |= _REGEX_FLAGS[flag]
+            except KeyError:
+                raise _EvalError()
+        try:
+            compiled = re.compile(pattern, options)
+        except re.error:
+            raise _EvalError()
+        if len(_regexes) > 1000:
+            _regexes.clear()
+        _regexes[key] = compiled
+    return compiled.search(text) is not None
+
+
+def _langMatches(tag, range_):
+    if not _isString(tag) or not _isString(range_):
+        raise _EvalError()
+    tag, range_ = tag.lower(), range_.lower()
+    if range_ == u'*':
+        return tag != u''
+    return tag == range_ or tag.startswith(range_ + u'-')
+
+
+def _call(name, arguments, solution):
+    if name == 'bound':
+        if not isinstance(arguments[0], Variable):
+            raise _EvalError()
+        return _boolean(arguments[0] in solution)
+    values = [_eval(argument, solution) for argument in arguments]
+    value = values[0]
+    if name == 'isiri':
+        return _boolean(isinstance(value, URIRef))
+    if name == 'isblank':
+        return _boolean(isinstance(value, BNode))
+    if name == 'isliteral':
+        return _boolean(isinstance(value, Literal))
+    if name == 'sameterm':
+        return _boolean(_sameTerm(value, values[1]))
+    if name == 'regex':
+        return _boolean(_regex(*values))
+    if name == 'langmatches':
+        return _boolean(_langMatches(value, values[1]))
+    if name == 'str':
+        if isinstance(value, (URIRef, Literal)):
+            return Literal(unicode(value))
+    elif isinstance(value, Literal):
+        if name == 'lang':
+            return Literal(value.language or u'')
+        if name == 'datatype' and not value.language:
+            return value.datatype or XSD_STRING
+    raise _EvalError()
+
+
+def _eval(expression, solution):
+    """Evaluate an expression for a solution, returning a term."""
+    if isinstance(expression, Variable):
+        try:
+            return solution[expression]
+        except KeyError:
+            raise _EvalError()
+    if not isinstance(expression, tuple):
+        return expression
+    operator = expression[0]
+    if operator == 'call':
+        return _call(expression[1], expression[2], solution)
+    if operator == '||' or operator == '&&':
+        # errors only matter if the other operand does not decide the result
+        decisive = operator == '||'
+        left = _tryEBV(expression[1], solution)
+        if left is decisive:
+            return _boolean(decisive)
+        right = _tryEBV(expression[2], solution)
+        if right is decisive:
+            return _boolean(decisive)
+        if left is None or right is None:
+            raise _EvalError()
+        return _boolean(not decisive)
+    if operator == '!':
+        return _boolean(not _ebv(_eval(expression[1], solution)))
+    if operator == 'neg':
+        number = _numeric(_eval(expression[1], solution))
+        if number is None:
+            raise _EvalError()
+        return _toLiteral(-number)
+    a = _eval(expression[1], solution)
+    b = _eval(expression[2], solution)
+    if operator == '=':
+        return _boolean(_equal(a, b))
+    if operator == '!=':
+        return _boolean(not _equal(a, b))
+    if operator in _RELATIONS:
+        return _boolean(_RELATIONS[operator](_compare(a, b)))
+    x, y = _numeric(a), _numeric(b)
+    if x is None or y is None:
+        raise _EvalError()
+    if isinstance(x, float) or isinstance(y, float):
+        x, y = float(x), float(y)
+    elif isinstance(x, Decimal) or isinstance(y, Decimal) or operator == '/':
+        x, y = Decimal(x), Decimal(y)
+    try:
+        if operator == '/':
+            return _toLiteral(x / y)
+        return _toLiteral(_ARITHMETIC[operator](x, y))
+    except (ZeroDivisionError, InvalidOperation):
+        raise _EvalError()
+
+
+def _variables(expression):
+    if isinstance(expression, Variable):
+        return set([expression])
+    found = set()
+    if isinstance(expression, tuple):
+        if expression[0] == 'call':
+            arguments = expression[2]
+        else:
+            arguments = expression[1:]
+        for argument in arguments:
+            found |= _variables(argument)
+    return found
+
+
+def _candidates(expression):
+    """
+    The variable and the only values it can have for an equality filter
+    (or a disjunction of them) to hold, or None.
+    """
+    if not isinstance(expression, tuple):
+        return None
+    if expression[0] == '||':
+        left = _candidates(expression[1])
+        right = _candidates(expression[2])
+        if left and right and left[0] == right[0]:
+            values = left[1] + [v for v in right[1]
+                                if not [w for w in left[1] if _sameTerm(v, w)]]
+            return (left[0], values)
+        return None
+    if expression[0] == '=':
+        a, b = expression[1:]
+    elif expression[0] == 'call' and expression[1] == 'sameterm':
+        a, b = expression[2]
+    else:
+        return None
+    if isinstance(b, Variable):
+        a, b = b, a
+    if not isinstance(a, Variable) or isinstance(b, (Variable, tuple)):
+        return None
+    if isinstance(b, URIRef) or (_isString(b) and b.language):
+        return (a, [b])
+    if _isString(b):
+        # a simple literal equals the xsd:string with the same text
+        return (a, [Literal(unicode(b)),
+                    Literal(unicode(b), datatype=XSD_STRING)])
+    return None
+
+
+def _accepts(expression, solution):
+    try:
+        return _ebv(_eval(expression, solution))
+    except _EvalError:
+        return False
+
+
+class _Evaluation(object):
+    """The state of the evaluation of one query against a graph."""
+
+    def __init__(self, graph):
+        self.graph = graph
+        store = graph.store
+        self.estimate = getattr(store, 'estimate', None)
+        if isinstance(graph, ConjunctiveGraph):
+            self.context = None
+        else:
+            self.context = graph
+
+    def cost(self, pattern):
+        """Expected number of matches of a triple pattern (None for unbound)."""
+        if self.estimate is not None:
+            return self.estimate(pattern, self.context)
+        # no statistics: prefer bound subjects, then objects, then predicates
+        s, p, o = pattern
+        return 1 + (s is None and 4) + (o is None and 2) + (p is None and 1)
+
+    # basic graph patterns
+
+    def bgp(self, triples, solution):
+        if not triples:
+            yield solution
+            return
+        best = None
+        for index, triple in enumerate(triples):
+            bound = tuple([solution.get(t, t) for t in triple])
+            # a bound term may be falsy, like Literal(u''), so it must
+            # not be tested for truth: None is the wildcard
+            pattern = tuple([None if isinstance(t, Variable) else t
+                             for t in bound])
+            cost = self.cost(pattern)
+            if best is None or cost < best[0]:
+                best = (cost, index, bound, pattern)
+        cost, index, bound, pattern = best
+        if cost == 0:
+            return
+        rest = triples[:index] + triples[index + 1:]
+        for match in self.graph.triples(pattern):
+            extended = solution
+            for term, value in zip(bound, match):
+                if isinstance(term, Variable):
+                    if extended is solution:
+                        extended = dict(solution)
+                    elif extended.get(term, value) != value:
+                        # a variable used twice in the same pattern
+                        break
+                    extended[term] = value
+            else:
+                for result in self.bgp(rest, extended):
+                    yield result
+
+    # group graph patterns
+
+    def group(self, group, solutions):
+        pending = [(f, _variables(f)) for f in group.filters]
+        certain = set()
+        for kind, value in group.parts:
+            if kind == 'bgp':
+                variables = set([t for triple in value for t in triple
+                                 if isinstance(t, Variable)])
+                # bind variables that a filter compares to constants before
+                # the lookups; the filter itself still runs afterwards
+                for expression, _ in pending:
+                    candidates = _candidates(expression)
+                    if candidates and candidates[0] in variables - certain:
+                        solutions = self.seed(candidates, solutions)
+                solutions = self.join(value, solutions)
+                certain |= variables
+            elif kind == 'optional':
+                solutions = self.leftJoin(value, solutions)
+            elif kind == 'union':
+                solutions = self.union(value, solutions)
+            else:
+                solutions = self.group(value, solutions)
+            # a filter can be applied early once nothing can change its variables
+            ready = [f for f, variables in pending if variables <= certain]
+            if ready:
+                pending = [(f, v) for f, v in pending if not v <= certain]
+                solutions = self.filter(ready, solutions)
+        if pending:
+            solutions = self.filter([f for f, v in pending], solutions)
+        return solutions
+
+    def seed(self, (variable, values), solutions):
+        for solution in solutions:
+            if variable in solution:
+                yield solution
+                continue
+            for value in values:
+                extended = dict(solution)
+                extended[variable] = value
+                yield extended
+
+    def join(self, triples, solutions):
+        for solution in solutions:
+            for result in self.bgp(triples, solution):
+                yield result
+
+    def leftJoin(self, group, solutions):
+        for solution in solutions:
+            matched = False
+            for result in self.group(group, [solution]):
+                matched = True
+                yield result
+            if not matched:
+                yield solution
+
+    def union(self, groups, solutions):
+        for solution in solutions:
+            for group in groups:
+                for result in self.group(group, [solution]):
+                    yield result
+
+    def filter(self, filters, solutions):
+        for solution in solutions:
+            for expression in filters:
+                if not _accepts(expression, solution):
+                    break
+            else:
+                yield solution
+
+
+_KIND_ORDER = {BNode: 1, URIRef: 2, Literal: 3}
+
+
+def _orderKey(term):
+    if term is None:
+        return (0,)
+    for kind, rank in _KIND_ORDER.items():
+        if isinstance(term, kind):
+            break
+    else:
+        rank = 4
+    if rank == 3:
+        number = None
+        try:
+            number = _numeric(term)
+        except _EvalError:
+            pass
+        if number is not None:
+            return (3, 0, number)
+        return (3, 1, unicode(term), term.datatype or u'', term.language or u'')
+    return (rank, unicode(term))
+
+
+def _ordered(solutions, order):
+    def value(expression, solution):
+        try:
+            return _eval(expression, solution)
+        except _EvalError:
+            return None
+    solutions = list(solutions)
+    # sort by the last condition first, relying on the stability of sort
+    for expression, descending in reversed(order):
+        solutions.sort(key=lambda s: _orderKey(value(expression, s)),
+                       reverse=descending)
+    return solutions
+
+
+def _slice(items, offset, limit):
+    if limit is None:
+        return islice(items, offset, None)
+    return islice(items, offset, offset + limit)
+
+
+def _distinct(rows):
+    seen = set()
+    for row in rows:
+        key = tuple(row)
+        if key not in seen:
+            seen.add(key)
+            yield row
+
+
+def evalQuery(graph, query, initBindings={}):
+    """
+    Evaluate a parsed query against a graph.
+
+    Returns a dictionary with the ``type_``, ``vars_``, ``bindings``,
+    ``askAnswer`` and ``graph`` of the result, as expected by
+    :class:`~rdflib.plugins.sparql.processor.SPARQLResult`.
+    """
+    initial = dict((Variable(name), value)
+                   for name, value in initBindings.items())
+    evaluation = _Evaluation(graph)
+    solutions = evaluation.group(query.where, [initial])
+
+    if query.type_ == 'ASK':
+        for solution in solutions:
+            return {'type_': 'ASK', 'askAnswer': True}
+        return {'type_': 'ASK', 'askAnswer': False}
+
+    if query.order:
+        solutions = _ordered(solutions, query.order)
+
+    if query.type_ == 'CONSTRUCT':
+        solutions = _slice(solutions, query.offset, query.limit)
+        result = Graph()
+        for solution in solutions:
+            bnodes = {}
+            for triple in query.template:
+                terms = []
+                for term in triple:
+                    if isinstance(term, Variable):
+                        term = solution.get(term)
+                    elif isinstance(term, BNode):
+                        term = bnodes.setdefault(term, BNode())
+                    terms.append(term)
+                s, p, o = terms
+                if isinstance(s, (URIRef, BNode)) and isinstance(p, URIRef) \
+                        and o is not None:
+                    result.add((s, p, o))
+        return {'type_': 'CONSTRUCT', 'graph': result}
+
+    variables = query.vars
+    if variables is None:
+        variables = [v for v in query.where.variables()
+                     if not v.startswith('_')]
+    rows = ([solution.get(v) for v in variables] for solution in solutions)
+    if query.distinct:
+        rows = _distinct(rows)
+    rows = _slice(rows, query.offset, query.limit)
+    bindings = [dict(zip(variables, row)) for row in rows]
+    return {'type_': 'SELECT', 'vars_': variables, 'bindings': bindings}
@@ -0,0 +1,493 @@
+"""
+Parser for the SPARQL subset evaluated by :mod:`rdflib.plugins.sparql.evaluate`.
+
+:func:`parseQuery` turns the text of a query into a :class:`Query`. Graph
+patterns become :class:`GroupPattern` instances, whose ``parts`` are
+``('bgp', triples)``, ``('optional', group)``, ``('union', groups)`` and
+``('group', group)`` tuples. Expressions are rdflib terms (constants and
+:class:`~rdflib.term.Variable` instances) or ``(operator, argument, ...)``
+tuples, eg ``('&&', a, b)`` or ``('call', 'regex', [a, b])``.
+
+Blank nodes in the WHERE clause are turned into variables (they cannot be
+projected), blank nodes in a CONSTRUCT template are kept as they are and
+replaced by fresh ones for every solution.
+"""
+
+import re
+from urlparse import urljoin
+
+from ...term import URIRef, BNode, Literal, Variable
+from ...exceptions import Error
+
+__all__ = ['SPARQLError', 'Query', 'GroupPattern', 'parseQuery']
+
+XSD = 'http://www.w3.org/2001/XMLSchema#'
+RDF_TYPE = URIRef('http://www.w3.org/1999/02/22-rdf-syntax-ns#type')
+
+# built-in functions and their minimum and maximum number of arguments
+BUILTINS = {'bound': (1, 1), 'isiri': (1, 1), 'isuri': (1, 1),
+            'isblank': (1, 1), 'isliteral': (1, 1), 'str': (1, 1),
+            'lang': (1, 1), 'datatype': (1, 1), 'sameterm': (2, 2),
+            'langmatches': (2, 2), 'regex': (2, 3)}
+
+
+class SPARQLError(Error):
+    """A query could not be parsed or is not supported."""
+
+
+class Query(object):
+    """
+    A parsed query.
+
+    ``type_`` is 'SELECT', 'ASK' or 'CONSTRUCT'; ``vars`` the projected
+    variables (None for ``SELECT *``); ``template`` the triples of a
+    CONSTRUCT; ``order`` a list of ``(expression, descending)`` pairs.
+    """
+
+    def __init__(self, type_):
+        self.type_ = type_
+        self.vars = None
+        self.distinct = False
+        self.template = None
+        self.where = None
+        self.order = []
+        self.limit = None
+        self.offset = 0
+
+
+class GroupPattern(object):
+    """The parts of a group graph pattern, and the filters scoped to it."""
+
+    def __init__(self):
+        self.parts = []
+        self.filters = []
+
+    def variables(self):
+        """All the variables of the pattern, in order of appearance."""
+        found = []
+        for kind, value in self.parts:
+            if kind == 'bgp':
+                for triple in value:
+                    found.extend([t for t in triple if isinstance(t, Variable)])
+            elif kind == 'union':
+                for group in value:
+                    found.extend(group.variables())
+            else:
+                found.extend(value.variables())
+        seen = set()
+        return [v for v in found if not (v in seen or seen.add(v))]
+
+
+_TOKENS = re.compile(ur'''
+    (?P<ws>\s+|\#[^\n]*)
+  | (?P<iri><[^<>"{}|^`\\\x00-\x20]*>)
+  | (?P<string>"""(?:[^"\\]|\\.|"(?!""))*"""
+             | \'\'\'(?:[^'\\]|\\.|'(?!''))*\'\'\'
+             | "(?:[^"\\\n\r]|\\.)*"
+             | '(?:[^'\\\n\r]|\\.)*')
+  | (?P<lang>@[a-zA-Z]+(?:-[a-zA-Z0-9]+)*)
+  | (?P<var>[?$]\w+)
+  | (?P<bnode>_:\w(?:[\w.-]*[\w-])?)
+  | (?P<number>(?:\d+\.\d*|\.\d+|\d+)(?:[eE][+-]?\d+)?)
+  | (?P<pname>(?:[A-Za-z](?:[\w.-]*[\w-])?)?:(?:\w(?:[\w.-]*[\w-])?)?)
+  | (?P<name>[A-Za-z_]\w*)
+  | (?P<punct>\^\^|\|\||&&|!=|<=|>=|[{}()\[\].,;*=<>+\-/!])
+''', re.X | re.U)
+
+_ESCAPES = re.compile(ur'\\(?:u([0-9A-Fa-f]{4})|U([0-9A-Fa-f]{8})|(.))', re.S)
+_SIMPLE_ESCAPES = {'t': u'\t', 'n': u'\n', 'r': u'\r', 'b': u'\b',
+                   'f': u'\f', '"': u'"', "'": u"'", '\\': u'\\'}
+
+
+def _unescape(text):
+    def replace(match):
+        short, long_, char = match.groups()
+        if char is not None:
+            try:
+                return _SIMPLE_ESCAPES[char]
+            except KeyError:
+                raise SPARQLError("Invalid escape sequence \\%s" % char)
+        return unichr(int(short or long_, 16))
+    return _ESCAPES.sub(replace, text)
+
+
+def tokenize(text):
+    """Split a query into a list of ``(kind, value, position)`` tuples."""
+    tokens = []
+    position = 0
+    while position < len(text):
+        match = _TOKENS.match(text, position)
+        if match is None:
+            raise SPARQLError("Unexpected character %r at position %d"
+                              % (text[position], position))
+        kind = match.lastgroup
+        if kind != 'ws':
+            tokens.append((kind, match.group(kind), position))
+        position = match.end()
+    tokens.append(('eof', None, position))
+    return tokens
+
+
+class _Parser(object):
+
+    def __init__(self, text, namespaces, base):
+        if isinstance(text, str):
+            text = text.decode('utf-8')
+        self.tokens = tokenize(text)
+        self.index = 0
+        self.namespaces = dict(namespaces)
+        self.base = base
+        self.anonymous = 0
+
+    # token helpers
+
+    def peek(self, offset=0):
+        return self.tokens[min(self.index + offset, len(self.tokens) - 1)]
+
+    def next(self):
+        token = self.tokens[self.index]
+        self.index += 1
+        return token
+
+    def fail(self, expected):
+        kind, value, position = self.peek()
+        raise SPARQLError("Expected %s but found %s at position %d"
+                          % (expected, value or 'end of query', position))
+
+    def at(self, *values):
+        kind, value, position = self.peek()
+        if kind == 'punct':
+            return value in values
+        if kind == 'name':
+            return value.upper() in values
+        return False
+
+    def accept(self, *values):
+        if self.at(*values):
+            return self.next()[1]
+        return None
+
+    def expect(self, value):
+        if not self.at(value):
+            self.fail(repr(value))
+        return self.next()[1]
+
+    # query forms
+
+    def query(self):
+        self.prologue()
+        if self.accept('SELECT'):
+            query = Query('SELECT')
+            if self.accept('DISTINCT', 'REDUCED'):
+                query.distinct = True
+            if self.accept('*'):
+                query.vars = None
+            else:
+                query.vars = []
+                while self.peek()[0] == 'var':
+                    query.vars.append(Variable(self.next()[1][1:]))
+                if not query.vars:
+                    self.fail('variables or *')
+        elif self.accept('CONSTRUCT'):
+            query = Query('CONSTRUCT')
+            query.template = self.template()
+        elif self.accept('ASK'):
+            query = Query('ASK')
+        else:
+            self.fail('SELECT, CONSTRUCT or ASK')
+        if self.at('FROM'):
+            raise SPARQLError("FROM clauses are not supported")
+        self.accept('WHERE')
+        query.where = self.group()
+        if query.type_ != 'ASK':
+            self.modifiers(query)
+        if self.peek()[0] != 'eof':
+            self.fail('end of query')
+        return query
+
+    def prologue(self):
+        if self.accept('BASE'):
+            self.base = self.iri()
+        while self.accept('PREFIX'):
+            kind, value, position = self.next()
+            if kind != 'pname' or not value.endswith(':'):
+                raise SPARQLError("Invalid prefix declaration at position %d"
+                                  % position)
+            self.namespaces[value[:-1]] = self.iri()
+
+    def modifiers(self, query):
+        if self.accept('ORDER'):
+            self.expect('BY')
+            while True:
+                if self.at('ASC', 'DESC'):
+                    descending = self.next()[1].upper() == 'DESC'
+                    self.expect('(')
+                    query.order.append((self.expression(), descending))
+                    self.expect(')')
+                elif self.peek()[0] == 'var':
+                    query.order.append((self.term(), False))
+                elif self.at('('):
+                    query.order.append((self.primary(), False))
+                elif self.peek()[0] == 'name' and \
+                        self.peek()[1].lower() in BUILTINS:
+                    query.order.append((self.primary(), False))
+                else:
+                    break
+            if not query.order:
+                self.fail('an order condition')
+        while self.at('LIMIT', 'OFFSET'):
+            keyword = self.next()[1].upper()
+            kind, value, position = self.next()
+            if kind != 'number' or not value.isdigit():
+                raise SPARQLError("Expected an integer after %s at position %d"
+                                  % (keyword, position))
+            if keyword == 'LIMIT':
+                query.limit = int(value)
+            else:
+                query.offset = int(value)
+
+    # graph patterns
+
+    def template(self):
+        self.expect('{')
+        triples = []
+        while not self.at('}'):
+            self.triples(triples, template=True)
+            if not self.accept('.'):
+                break
+        self.expect('}')
+        return triples
+
+    def group(self):
+        self.expect('{')
+        group = GroupPattern()
+        while not self.accept('}'):
+            if self.accept('.'):
+                continue
+            elif self.accept('FILTER'):
+                group.filters.append(self.constraint())
+            elif self.accept('OPTIONAL'):
+                group.parts.append(('optional', self.group()))
+            elif self.at('GRAPH'):
+                raise SPARQLError("GRAPH patterns are not supported")
+            elif self.at('{'):
+                alternatives = [self.group()]
+                while self.accept('UNION'):
+                    alternatives.append(self.group())
+                if len(alternatives) == 1:
+                    group.parts.append(('group', alternatives[0]))
+                else:
+                    group.parts.append(('union', alternatives))
+            else:
+                triples = []
+                self.triples(triples)
+                if group.parts and group.parts[-1][0] == 'bgp':
+                    group.parts[-1][1].extend(triples)
+                else:
+                    group.parts.append(('bgp', triples))
+        return group
+
+    def triples(self, triples, template=False):
+        if self.at('['):
+            subject = self.blank(triples, template)
+            if self.at('.', '}'):
+                return
+        else:
+            subject = self.term(template)
+        self.properties(subject, triples, template)
+
+    def properties(self, subject, triples, template):
+        while True:
+            if self.peek()[:2] == ('name', 'a'):
+                self.next()
+                predicate = RDF_TYPE
+            else:
+                predicate = self.term(template)
+                if isinstance(predicate, Literal):
+                    raise SPARQLError("Literal %s used as a predicate"
+                                      % predicate.n3())
+            while True:
+                if self.at('['):
+                    object_ = self.blank(triples, template)
+                else:
+                    object_ = self.term(template)
+                triples.append((subject, predicate, object_))
+                if not self.accept(','):
+                    break
+            if not self.accept(';'):
+                return
+            while self.accept(';'):
+                pass
+            if self.at('.', '}', ']'):
+                return
+
+    def blank(self, triples, template):
+        self.expect('[')
+        self.anonymous += 1
+        if template:
+            node = BNode()
+        else:
+            node = Variable('_anon%d' % self.anonymous)
+        if not self.accept(']'):
+            self.properties(node, triples, template)
+            self.expect(']')
+        return node
+
+    # terms
+
+    def iri(self):
+        kind, value, position = self.next()
+        if kind == 'iri':
+            value = value[1:-1]
+            if self.base:
+                value = urljoin(self.base, value)
+            return URIRef(value)
+        if kind == 'pname':
+            prefix, local = value.split(':', 1)
+            try:
+                return URIRef(self.namespaces[prefix] + local)
+            except KeyError:
+                raise SPARQLError("Unknown prefix %r at position %d"
+                                  % (prefix, position))
+        self.index -= 1
+        self.fail('an IRI')
+
+    def term(self, template=False):
+        kind, value, position = self.peek()
+        if kind == 'var':
+            self.next()
+            return Variable(value[1:])
+        elif kind in ('iri', 'pname'):
+            return self.iri()
+        elif kind == 'bnode':
+            self.next()
+            if template:
+                return BNode(value[2:])
+            return Variable('_' + value[2:])
+        elif kind == 'string':
+            self.next()
+            quotes = value[:3] in ('"""', "'''") and 3 or 1
+            lexical = _unescape(value[quotes:-quotes])
+            if self.peek()[0] == 'lang':
+                return Literal(lexical, lang=self.next()[1][1:].lower())
+            if self.accept('^^'):
+                return Literal(lexical, datatype=self.iri())
+            return Literal(lexical)
+        elif kind == 'number':
+            self.next()
+            return _number(value)
+        elif kind == 'punct' and value in ('+', '-') and \
+                self.peek(1)[0] == 'number':
+            self.next()
+            return _number(value + self.next()[1])
+        elif kind == 'name' and value.lower() in ('true', 'false'):
+            self.next()
+            return Literal(value.lower(), datatype=URIRef(XSD + 'boolean'))
+        self.fail('an RDF term')
+
+    # expressions
+
+    def constraint(self):
+        if self.at('('):
+            return self.primary()
+        kind, value, position = self.peek()
+        if kind in ('iri', 'pname') or \
+                (kind == 'name' and value.lower() in BUILTINS):
+            return self.primary()
+        self.fail('a constraint')
+
+    def expression(self):
+        left = self.conjunction()
+        while self.accept('||'):
+            left = ('||', left, self.conjunction())
+        return left
+
+    def conjunction(self):
+        left = self.relational()
+        while self.accept('&&'):
+            left = ('&&', left, self.relational())
+        return left
+
+    def relational(self):
+        left = self.additive()
+        operator = self.accept('=', '!=', '<', '>', '<=', '>=')
+        if operator:
+            return (operator, left, self.additive())
+        return left
+
+    def additive(self):
+        left = self.multiplicative()
+        while True:
+            operator = self.accept('+', '-')
+            if not operator:
+                return left
+            left = (operator, left, self.multiplicative())
+
+    def multiplicative(self):
+        left = self.unary()
+        while True:
+            operator = self.accept('*', '/')
+            if not operator:
+                return left
+            left = (operator, left, self.unary())
+
+    def unary(self):
+        if self.accept('!'):
+            return ('!', self.unary())
+        if self.accept('-'):
+            return ('neg', self.unary())
+        if self.accept('+'):
+            return self.unary()
+        return self.primary()
+
+    def primary(self):
+        if self.accept('('):
+            expression = self.expression()
+            self.expect(')')
+            return expression
+        kind, value, position = self.peek()
+        if kind == 'name' and value.lower() in BUILTINS:
+            self.next()
+            name = value.lower()
+            arguments = self.arguments()
+            least, most = BUILTINS[name]
+            if not least <= len(arguments) <= most:
+                raise SPARQLError("Wrong number of arguments for %s at position %d"
+                                  % (value, position))
+            if name == 'isuri':
+                name = 'isiri'
+            return ('call', name, arguments)
+        if kind in ('iri', 'pname') and self.peek(1)[1] == '(':
+            raise SPARQLError("Unsupported function %s at position %d"
+                              % (value, position))
+        return self.term()
+
+    def arguments(self):
+        self.expect('(')
+        arguments = []
+        if not self.accept(')'):
+            arguments.append(self.expression())
+            while self.accept(','):
+                arguments.append(self.expression())
+            self.expect(')')
+        return arguments
+
+
+def _number(text):
+    if 'e' in text or 'E' in text:
+        datatype = 'double'
+    elif '.' in text:
+        datatype = 'decimal'
+    else:
+        datatype = 'integer'
+    return Literal(text.lstrip('+'), datatype=URIRef(XSD + datatype))
+
+
+def parseQuery(text, namespaces={}, base=None):
+    """
+    Parse the text of a query into a :class:`Query`.
+
+    ``namespaces`` maps prefixes to namespaces for prefixed names that are
+    not declared in the query itself.
+    """
+    return _Parser(text, namespaces, base).query()
@@ -0,0 +1,70 @@
+"""
+The ``sparql`` query processor and result plugins, used by default by
+:meth:`rdflib.graph.Graph.query`.
+"""
+
+from threading import Lock
+
+from ...query import Processor, Result
+from .parser import parseQuery, Query
+from .evaluate import evalQuery
+
+__all__ = ['SPARQLProcessor', 'SPARQLResult', 'prepareQuery']
+
+# parsed queries, keyed by text, namespaces and base
+_prepared = {}
+_preparedLock = Lock()
+_PREPARED_MAX = 256
+
+
+def prepareQuery(queryString, initNs={}, base=None):
+    """
+    Parse a query once, so it can be passed to :meth:`Graph.query` many
+    times. Parsed queries are also cached, so repeating the same text is
+    cheap as well.
+    """
+    key = (queryString, tuple(sorted(initNs.items())), base)
+    query = _prepared.get(key)
+    if query is None:
+        query = parseQuery(queryString, initNs, base)
+        _preparedLock.acquire()
+        try:
+            if len(_prepared) >= _PREPARED_MAX:
+                _prepared.clear()
+            _prepared[key] = query
+        finally:
+            _preparedLock.release()
+    return query
+
+
+class SPARQLResult(Result):
+
+    def __init__(self, res):
+        Result.__init__(self, res['type_'])
+        self.vars = res.get('vars_')
+        self.bindings = res.get('bindings')
+        self.askAnswer = res.get('askAnswer')
+        self.graph = res.get('graph')
+
+
+class SPARQLProcessor(Processor):
+
+    def __init__(self, graph):
+        self.graph = graph
+
+    def query(self, strOrQuery, initBindings={}, initNs={}, base=None,
+              DEBUG=False):
+        """
+        Evaluate a query (text or the result of :func:`prepareQuery`).
+
+        Prefixes bound in the graph can be used without declaring them,
+        ``initNs`` adds or overrides prefixes and ``initBindings`` maps
+        variable names to their initial values.
+        """
+        if isinstance(strOrQuery, Query):
+            query = strOrQuery
+        else:
+            namespaces = dict(self.graph.namespaces())
+            namespaces.update(initNs)
+            query = prepareQuery(strOrQuery, namespaces, base)
+        return evalQuery(self.graph, query, initBindings)
@@ -181,13 +181,15 @@ class Store(object):
         It should be an error to not specify a context and have the quoted argument be True.
         It should also be an error for the quoted argument to be True when the store is not formula-aware.
         """
-        self.dispatcher.dispatch(TripleAddedEvent(triple=(subject, predicate, object), context=context))
+        if self.dispatcher.subscribed(TripleAddedEvent):
+            self.dispatcher.dispatch(TripleAddedEvent(triple=(subject, predicate, object), context=context))
 
     def addN(self, quads):
        """
        Adds each item in the list of statements to a specific context. The quoted argument
        is interpreted by formula-aware stores to indicate this statement is quoted/hypothetical.
-       Note that the default implementation is a redirect to add
+       Note that the default implementation is a redirect to add; stores can override it
+       to index a whole batch at once, as parsers hand their statements over in batches.
        """
        for s,p,o,c in quads:
            assert c is not None, "Context associated with %s %s %s is None!"%(s,p,o)
@@ -198,7 +200,8 @@ class Store(object):
 
     def remove(self, (subject, predicate, object), context=None):
         """ Remove the set of triples matching the pattern from the store """
-        self.dispatcher.dispatch(TripleRemovedEvent(triple=(subject, predicate, object), context=context))
+        if self.dispatcher.subscribed(TripleRemovedEvent):
+            self.dispatcher.dispatch(TripleRemovedEvent(triple=(subject, predicate, object), context=context))
 
     def triples_choices(self, (subject, predicate, object_),context=None):
         """
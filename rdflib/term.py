@@ -32,6 +32,8 @@ __all__ = [
 
     'Variable',
     'Statement',
+
+    'TermPool',
     ]
 
 import logging
@@ -41,6 +43,7 @@ _LOGGER = logging.getLogger(__name__)
 import base64
 
 import threading
+from weakref import WeakValueDictionary
 from urlparse import urlparse, urljoin, urldefrag
 from string import ascii_letters
 from random import choice
@@ -81,7 +84,7 @@ class URIRef(Identifier):
     RDF URI Reference: http://www.w3.org/TR/rdf-concepts/#section-Graph-URIref
     """
 
-    __slots__ = ()
+    __slots__ = ("__weakref__",) # for TermPool
 
     def __new__(cls, value, base=None):
         if base is not None:
@@ -319,7 +322,7 @@ class Literal(Identifier):
     """
     __doc__ = py3compat.format_doctest_out(doc)
 
-    __slots__ = ("language", "datatype", "_cmp_value")
+    __slots__ = ("language", "datatype", "_cmp_value", "__weakref__")
 
     def __new__(cls, value, lang=None, datatype=None):
         if lang is not None and datatype is not None:
@@ -332,7 +335,8 @@ class Literal(Identifier):
             value, datatype = _castPythonToLiteral(value)
             if datatype:
                 lang = None
-        if datatype:
+        if datatype and type(datatype) is not URIRef:
+            # a URIRef is kept, so a TermPool's datatypes are shared
             datatype = URIRef(datatype)
         if py3compat.PY3 and isinstance(value, bytes):
             value = value.decode('utf-8')
@@ -896,6 +900,78 @@ def bind(datatype, conversion_function):
 
 
 
+class TermPool(object):
+    """
+    Intern pool for URIRefs and Literals: asking it twice for an equal
+    term gives the same object, so data repeating a predicate or type
+    URI millions of times keeps a single copy of it. The pool only
+    holds weak references, so a term is dropped from it as soon as
+    nothing else uses it.
+
+    The parsers use the pool passed to them as ``pool``, or
+    :data:`defaultTermPool` if that is set. Pooling is opt-in: it pays
+    off for stores that keep a term object per triple, like ``Memory``,
+    but a store that already maps each term to a single id, like
+    ``IOMemory`` or ``ArrayMemory``, keeps one copy anyway, and the pool
+    only adds its own entries.
+
+    >>> pool = TermPool()
+    >>> pool.uriref(u"http://example.org/a") is pool.uriref(u"http://example.org/a")
+    True
+    """
+
+    def __init__(self):
+        self.urirefs = WeakValueDictionary()
+        self.literals = WeakValueDictionary()
+
+    def __len__(self):
+        return len(self.urirefs) + len(self.literals)
+
+    # terms don't hash like their text, so they're looked up by a plain
+    # string, and stored under one as bytes if it's ascii, which takes
+    # less space: in Python 2 u"a" and "a" are equal keys
+
+    def _plain(self, value):
+        if type(value) is str or type(value) is unicode:
+            return value
+        return unicode(value)
+
+    def _key(self, value):
+        if type(value) is str:
+            return value
+        try:
+            return value.encode("ascii")
+        except UnicodeError:
+            return value
+
+    def uriref(self, value, base=None):
+        if base is not None:
+            value = URIRef(value, base)
+        value = self._plain(value)
+        uri = self.urirefs.get(value)
+        if uri is None:
+            uri = URIRef(value)
+            self.urirefs[self._key(value)] = uri
+        return uri
+
+    def literal(self, value, lang=None, datatype=None):
+        value = self._plain(value)
+        if datatype is not None:
+            datatype = self._plain(datatype)
+        literal = self.literals.get((value, lang, datatype))
+        if literal is None:
+            key = (self._key(value), lang, datatype and self._key(datatype))
+            if datatype is not None:
+                datatype = self.uriref(datatype)
+            literal = self.literals[key] = Literal(value, lang, datatype)
+        return literal
+
+#: the TermPool used by the parsers when they aren't given one, or None.
+#: None by default, as pooling only saves memory with some stores (see
+#: :class:`TermPool`); set it around a bulk load into one of those.
+defaultTermPool = None
+
+
 class Variable(Identifier):
     """
     """
@@ -2,16 +2,49 @@
 # imports
 ###########
 
+import os
+import re
+import copy
+import gzip
+import math
+import time
+import uuid
+import zlib
+import httplib
+import Queue
+import sqlite3
+import hashlib
+import urllib
 import urllib2
+import threading
+from array import array
+from collections import OrderedDict, deque
+from cStringIO import StringIO
+from multiprocessing import TimeoutError
+from multiprocessing.pool import ThreadPool
 from rdflib import Namespace, Literal, URIRef, BNode, URIRef
-from SPARQLWrapper import SPARQLWrapper, JSON
+from rdflib import ConjunctiveGraph
+from rdflib.term import TermPool
+from rdflib.store import VALID_STORE
+from rdflib.plugins.snapshot import write_snapshot
+from SPARQLWrapper import SPARQLWrapper, JSON, XML, ConnectionPool, AsyncClient
+from SPARQLWrapper.Wrapper import QueryResult
+from SPARQLWrapper.AsyncWrapper import QueryTimeout
+from SPARQLWrapper.SPARQLExceptions import QueryBadFormed
+
+# optional: columnar results use numpy arrays if it's installed
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 # there's a lot of useful stuff in this package,
 # but it can be hard to find. see these pages:
 #     https://bitbucket.org/exogen/telescope/wiki/SPARQLBuilder
 #     http://code.google.com/p/telescope/wiki/QueryBuilderDesign
 #
-from telescope.sparql.queryforms import Select
+from telescope.sparql.queryforms import Select, Construct
+from telescope.sparql.patterns   import GroupGraphPattern
 from telescope.sparql.helpers    import RDF, RDFS
 from telescope.sparql.helpers    import v  as Variable
 from telescope.sparql.helpers    import op as Operator
@@ -36,7 +69,25 @@ __all__ = []
 # classes defined here
 __all__.append('SBOLQuery' )
 __all__.append('SBOLResult')
+__all__.append('ResultColumn')
+__all__.append('ColumnarResults')
+__all__.append('TermFactory')
+__all__.append('Parameter' )
+__all__.append('PreparedQuery')
 __all__.append('SBOLNode'  )
+__all__.append('AsyncSBOLNode')
+__all__.append('LocalSBOLNode')
+__all__.append('MirrorSync')
+__all__.append('NodeHealth')
+__all__.append('HealthTracker')
+__all__.append('ReplicatedSBOLNode')
+__all__.append('CircuitOpen')
+__all__.append('QueryCache')
+__all__.append('DiskQueryCache')
+
+# functions defined here
+__all__.append('federated_execute')
+__all__.append('result_class')
 
 # SBOLNode instances
 __all__.append('SBPKB2')
@@ -56,8 +107,142 @@ __all__.append('Literal' )
 # classes
 ###########
 
+class TrackedList(list):
+    '''
+    A list that calls on_change whenever it is modified in place.
+    SBOLQuery uses it to know when its compiled query is outdated.
+    '''
+
+    def __init__(self, items=(), on_change=None):
+        list.__init__(self, items)
+        self.on_change = on_change
+
+    def _changed(self):
+        if self.on_change is not None:
+            self.on_change()
+
+def _tracked(method):
+    'Wraps a list method so that it reports changes'
+    def wrapper(self, *args):
+        result = method(self, *args)
+        self._changed()
+        return result
+    wrapper.__name__ = method.__name__
+    wrapper.__doc__  = method.__doc__
+    return wrapper
+
+for _name in ['append', 'extend', 'insert', 'remove', 'pop', 'sort',
+              'reverse', '__setitem__', '__delitem__', '__setslice__',
+              '__delslice__', '__iadd__', '__imul__']:
+    setattr(TrackedList, _name, _tracked(getattr(list, _name)))
+del _name
+
+class Parameter(object):
+    '''
+    Placeholder for a value that is only known when a prepared
+    query is executed. It can be used anywhere a term can, e.g.
+        query.FILTER.append(Operator.regex(name, Parameter('keyword')))
+    See SBOLQuery.prepare.
+    '''
+
+    def __init__(self, name):
+        if not re.match(r'^\w+$', name):
+            raise ValueError('Invalid parameter name: %r' % (name,))
+        self.name = name
+        # unique text that stands in for the value in the compiled query
+        self.marker = u'\0%s\0%s\0' % (uuid.uuid4().hex, name)
+
+    def __repr__(self):
+        return '%s(%r)' % (self.__class__.__name__, self.name)
+
+    def n3(self):
+        return self.marker
+    __unicode__ = n3
+
+class PreparedQuery(object):
+    '''
+    A query compiled once, with Parameters left as placeholders.
+    bind fills them in by plain string substitution on the compiled
+    text, which is much cheaper than compiling the query again.
+    Values are escaped (strings) or validated (URIRefs) so that they
+    can't change the structure of the query.
+    '''
+
+    _markers  = re.compile(u'\0[0-9a-f]{32}\0(\\w+)\0')
+    _iri      = re.compile(u'^[^\\x00-\\x20<>"{}|^`\\\\]*$')
+    _language = re.compile(r'^[a-zA-Z]+(-[a-zA-Z0-9]+)*$')
+    _escapes  = {u'\\': u'\\\\', u'"': u'\\"',
+                 u'\n': u'\\n', u'\r': u'\\r', u'\t': u'\\t'}
+
+    def __init__(self, query):
+        if hasattr(query, 'compile_query'):
+            compiled = query.compile_query()
+        else:
+            compiled = query.compile() # a telescope query
+        # text and parameter names alternate in tokens
+        self.tokens = self._markers.split(compiled)
+        self.parameters = frozenset(self.tokens[1::2])
+
+    def _iri_term(self, value):
+        if not self._iri.match(value):
+            raise ValueError('Invalid URI: %r' % (value,))
+        return u'<%s>' % value
+
+    def _term(self, value):
+        'Converts a value to SPARQL syntax'
+        if isinstance(value, URIRef):
+            return self._iri_term(value)
+        if isinstance(value, bool):
+            return value and u'true' or u'false'
+        if isinstance(value, (int, long, float)):
+            return repr(value).rstrip('L')
+        if not isinstance(value, basestring):
+            raise TypeError('Unsupported parameter value: %r' % (value,))
+        if isinstance(value, str):
+            value = value.decode('utf-8')
+        text = u'"%s"' % u''.join([self._escapes.get(c, c) for c in value])
+        if isinstance(value, Literal):
+            if value.language:
+                if not self._language.match(value.language):
+                    raise ValueError('Invalid language: %r' % (value.language,))
+                text += u'@' + value.language
+            elif value.datatype:
+                text += u'^^' + self._iri_term(value.datatype)
+        return text
+
+    def bind(self, **values):
+        '''
+        Returns the query with values for each Parameter, ready to
+        be passed to SBOLNode.execute like an SBOLQuery
+        '''
+        missing = self.parameters.difference(values)
+        if missing:
+            raise ValueError('No value for parameters: %s'
+                             % ', '.join(sorted(missing)))
+        terms = dict([(name, self._term(values[name]))
+                      for name in self.parameters])
+        tokens = list(self.tokens)
+        tokens[1::2] = [terms[name] for name in tokens[1::2]]
+        return BoundQuery(u''.join(tokens))
+
+class BoundQuery(object):
+    'A PreparedQuery with values for all of its Parameters'
+
+    def __init__(self, text):
+        self.text = text
+
+    def __str__(self):
+        return self.text
+
+    def compile_query(self):
+        return self.text
+
 class SBOLQuery(object):
 
+    # changing any of these makes the compiled query outdated
+    TRACKED = ('SELECT', 'WHERE', 'FILTER', 'OPTIONAL',
+               'ORDER', 'LIMIT', 'OFFSET')
+
     def __init__(self, keyword=None, limit=1000):
         'Creates the default query'
         # todo remove keyword
@@ -73,6 +258,7 @@ class SBOLQuery(object):
         self.OPTIONAL = []
         self.ORDER    = []
         self.LIMIT    = limit
+        self.OFFSET   = None
 
         #self.available_only = True
 
@@ -100,6 +286,26 @@ class SBOLQuery(object):
             expr = Operator.regex(name, keyword, 'i')
             self.FILTER.append(expr)
 
+    def __setattr__(self, name, value):
+        'Tracks changes to the query elements'
+        if name in self.TRACKED:
+            if isinstance(value, list):
+                value = TrackedList(value, self._invalidate)
+            self._invalidate()
+        object.__setattr__(self, name, value)
+
+    def __copy__(self):
+        'Copies the query, giving the copy its own query elements'
+        clone = self.__class__.__new__(self.__class__)
+        clone.__dict__.update(self.__dict__)
+        for name in self.TRACKED:
+            if name in self.__dict__:
+                setattr(clone, name, getattr(self, name))
+        return clone
+
+    def _invalidate(self):
+        object.__setattr__(self, '_compiled', None)
+
     def __str__(self):
         'Returns the query as a str'
         return self.compile_query()
@@ -129,41 +335,441 @@ class SBOLQuery(object):
         self.WHERE.append((self.result, RDF.type, ref))
 
     def compile_query(self):
-        'Builds the query and returns it as a str'
+        '''
+        Returns the query as a str. It is only built again
+        after the query elements have changed.
+        Note that changes inside the elements themselves
+        (rather than to the lists holding them) are not noticed.
+        '''
+        if self.__dict__.get('_compiled') is None:
+            self._invalidate()
+            compiled = self.build_query().compile()
+            object.__setattr__(self, '_compiled', compiled)
+        return self._compiled
 
-        # start with a SELECT statement
-        kwargs = {'limit'    : self.LIMIT,
-                  'order_by' : self.ORDER,
-                  'distinct' : True}
-        query = Select(self.SELECT, **kwargs)
+    def prepare(self):
+        '''
+        Compiles the query, which can contain Parameters, so that it
+        can then be executed with different values for them, e.g.
+            prepared = SBOLQuery(Parameter('keyword')).prepare()
+            SBPKB2.execute( prepared.bind(keyword='B0010') )
+        '''
+        return PreparedQuery(self)
+
+    def build_query(self):
+        'Builds the query as a telescope Select'
 
         # add WHERE clauses
+        # (each one in its own group, like Select.where does)
+        pattern = GroupGraphPattern([])
         for clause in self.WHERE:
-            query = query.where(clause)
+            pattern.pattern( GroupGraphPattern.from_obj((clause,)) )
 
         # todo put this back once SBPkb2 has sbol:status
         #if self.available_only:
-        #    query = query.where(( self.result, SBOL.status, Literal('Available') ))
+        #    pattern.pattern( GroupGraphPattern.from_obj((( self.result, SBOL.status, Literal('Available') ),)) )
 
         # add optional WHERE clauses
         for clause in self.OPTIONAL:
-            query = query.where(clause, optional=True)
+            pattern.pattern( GroupGraphPattern.from_obj((clause,), optional=True) )
 
         # add FILTER clauses
         for expression in self.FILTER:
-            query = query.filter(expression)
+            pattern.filter(expression)
 
-        return query.compile()
+        # wrap it in a SELECT statement
+        kwargs = {'limit'    : self.LIMIT,
+                  'offset'   : self.OFFSET,
+                  'order_by' : list(self.ORDER),
+                  'distinct' : True}
+        return Select(list(self.SELECT), pattern, **kwargs)
 
 class SBOLResult(object):
+    '''
+    One result of a query, with an attribute per variable bound in
+    it. Results are instances of a subclass made by result_class
+    for the variables of their query, which keeps the values in
+    __slots__ instead of a __dict__ per result.
+    '''
+    __slots__ = ()
+    _fields   = ()
+    typed     = False
+
+    @property
+    def __dict__(self):
+        'The attributes that are set, as a new dict'
+        return dict((name, getattr(self, name)) for name in self._fields
+                    if hasattr(self, name))
 
     def __repr__(self):
         return '<%s %s>' % (self.__class__.__name__, self.__dict__)
 
+class TermFactory(object):
+    '''
+    Converts the cells of JSON bindings to rdflib terms. The same
+    URIs and literals repeat a lot (every part has the type
+    SBOL.DnaComponent), so they're made through a TermPool, which
+    shares equal terms for as long as any of them is in use.
+    Typed literals get their datatype, so toPython gives an int for
+    an xsd:int and so on.
+    '''
+
+    def __init__(self, pool=None):
+        if pool is None:
+            pool = TermPool()
+        self.pool = pool
+
+    def __call__(self, cell):
+        kind, value = cell['type'], cell['value']
+        if kind == 'uri':
+            return self.pool.uriref(value)
+        if kind == 'bnode':
+            return BNode(value)
+        return self.pool.literal(value, cell.get('xml:lang'), cell.get('datatype'))
+
+# shared by all typed results
+_terms = TermFactory()
+
+class _LazyTerm(object):
+    '''
+    Descriptor for a variable of a typed result class. The slot
+    holds the JSON cell until the attribute is first read, when
+    it's replaced by the rdflib term.
+    '''
+
+    def __init__(self, slot):
+        self.slot = slot
+
+    def __get__(self, result, cls):
+        if result is None:
+            return self
+        value = self.slot.__get__(result, cls)
+        if type(value) is dict:
+            value = _terms(value)
+            self.slot.__set__(result, value)
+        return value
+
+    def __set__(self, result, value):
+        self.slot.__set__(result, value)
+
+# result classes, keyed by their variables
+_result_classes = {}
+_result_classes_lock = threading.Lock()
+_RESULT_CLASSES_MAX = 256
+
+def result_class(names, typed=False):
+    '''
+    Returns the SBOLResult subclass with a slot for each of names,
+    plus source for federated_execute. It's only created once for
+    the same names, so all results of a query share it.
+    If typed, its attributes are rdflib terms instead of strings,
+    converted from the JSON cells when first read.
+    '''
+    names = tuple(names)
+    key = (names, typed)
+    cls = _result_classes.get(key)
+    if cls is None:
+        fields = names
+        if 'source' not in names:
+            fields += ('source',)
+        slots = fields
+        if typed:
+            # the cells go in slots of their own, behind _LazyTerms
+            slots = tuple('cell_' + name for name in names) + fields[len(names):]
+        cls = type('SBOLResult', (SBOLResult,), {'__slots__': slots,
+                                                 '_fields'  : fields,
+                                                 'typed'    : typed})
+        if typed:
+            cls._cells = dict((name, cls.__dict__['cell_' + name])
+                              for name in names)
+            for name, cell in cls._cells.items():
+                setattr(cls, name, _LazyTerm(cell))
+        with _result_classes_lock:
+            if len(_result_classes) >= _RESULT_CLASSES_MAX:
+                _result_classes.clear()
+            _result_classes[key] = cls
+    return cls
+
+class ResultColumn(object):
+    '''
+    The values of one variable in ColumnarResults, as parallel
+    arrays: values holds the strings, types a code per row (see
+    below), and datatypes and langs the datatype URI and language
+    tag of literals, or None. Datatypes and langs are interned,
+    so repeated ones cost a single string.
+    With numpy installed the arrays are numpy arrays (int8 for
+    types); otherwise types is an array.array and the rest lists.
+    '''
+
+    UNBOUND = 0
+    URI     = 1
+    LITERAL = 2
+    BNODE   = 3
+
+    TYPES = {'uri'          : URI,
+             'literal'      : LITERAL,
+             'typed-literal': LITERAL,
+             'bnode'        : BNODE}
+
+    def __init__(self, values, types, datatypes, langs):
+        self.values    = values
+        self.types     = types
+        self.datatypes = datatypes
+        self.langs     = langs
+
+    def __len__(self):
+        return len(self.values)
+
+    def __repr__(self):
+        return '<%s of %d>' % (self.__class__.__name__, len(self))
+
+class ColumnarResults(object):
+    '''
+    Results of a SELECT query stored by column instead of by row:
+    an OrderedDict mapping each variable to its ResultColumn. Built
+    by SBOLNode.execute(query, columnar=True).
+    '''
+
+    def __init__(self, columns=None):
+        self.columns = columns or OrderedDict()
+
+    @property
+    def vars(self):
+        return self.columns.keys()
+
+    def __len__(self):
+        for column in self.columns.values():
+            return len(column)
+        return 0
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def __repr__(self):
+        return '<%s %s x %d>' % (self.__class__.__name__, self.vars, len(self))
+
+    @classmethod
+    def from_bindings(cls, bindings, names=()):
+        '''
+        Fills the columns in one pass over an iterable of JSON
+        bindings, such as QueryResult.iterBindings(), so the rows
+        never have to be held in memory together. names are the
+        variables to start with; others are added as they come up.
+        '''
+        unbound = ResultColumn.UNBOUND
+        type_codes = ResultColumn.TYPES
+        interned = {None: None}
+        intern = interned.setdefault
+        cells = OrderedDict((name, ([], [], [], [])) for name in names)
+        rows = 0
+        for binding in bindings:
+            for name in binding:
+                if name not in cells:
+                    # earlier rows left this variable unbound
+                    cells[name] = ([None] * rows, [unbound] * rows,
+                                   [None] * rows, [None] * rows)
+            for name, (values, types, datatypes, langs) in cells.iteritems():
+                cell = binding.get(name)
+                if cell is None:
+                    values.append(None)
+                    types.append(unbound)
+                    datatypes.append(None)
+                    langs.append(None)
+                    continue
+                values.append(cell['value'])
+                types.append(type_codes[ cell['type'] ])
+                datatypes.append( intern(cell.get('datatype'), cell.get('datatype')) )
+                langs.append( intern(cell.get('xml:lang'), cell.get('xml:lang')) )
+            rows += 1
+        columns = OrderedDict()
+        for name, (values, types, datatypes, langs) in cells.iteritems():
+            if numpy is None:
+                types = array('b', types)
+            else:
+                values    = numpy.array(values,    dtype=object)
+                types     = numpy.array(types,     dtype=numpy.int8)
+                datatypes = numpy.array(datatypes, dtype=object)
+                langs     = numpy.array(langs,     dtype=object)
+            columns[name] = ResultColumn(values, types, datatypes, langs)
+        return cls(columns)
+
+    @classmethod
+    def from_json(cls, json):
+        'Fills the columns from the bindings of a decoded JSON response'
+        return cls.from_bindings(json['results']['bindings'],
+                                 json.get('head', {}).get('vars', []))
+
+class FederatedResults(list):
+    '''
+    The SBOLResults returned by federated_execute, with an errors
+    attribute mapping each node that failed to its exception
+    '''
+
+    def __init__(self, results=()):
+        list.__init__(self, results)
+        self.errors = OrderedDict()
+
+class QueryCache(object):
+    '''
+    In-memory cache of raw query responses for SBOLNode.
+    Entries are evicted least recently used first once there are
+    more than max_entries of them or their bodies add up to more
+    than max_bytes, and expire ttl seconds after being stored
+    (set ttl=None to keep them until evicted).
+    '''
+
+    def __init__(self, max_entries=1000, max_bytes=64*1024*1024, ttl=300):
+        self.max_entries = max_entries
+        self.max_bytes   = max_bytes
+        self.ttl         = ttl
+        self.hits   = 0
+        self.misses = 0
+        self.size   = 0 # total bytes of the cached bodies
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _expired(self, entry):
+        return self.ttl is not None and time.time() - entry[0] > self.ttl
+
+    def get(self, key, stale=False):
+        '''
+        Returns the (body, headers, url) cached for key, or None.
+        With stale=True expired entries are returned too, so they
+        can be revalidated, and hits and misses are not counted.
+        '''
+        with self._lock:
+            entry = self._entries.get(key)
+            if stale:
+                return entry and entry[1:]
+            if entry is None or self._expired(entry):
+                self.misses += 1
+                return None
+            del self._entries[key]
+            self._entries[key] = entry # move to the most recent end
+            self.hits += 1
+            return entry[1:]
+
+    def put(self, key, body, headers, url):
+        'Stores a response body with its headers and url'
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old[1])
+            self._entries[key] = (time.time(), body, headers, url)
+            self.size += len(body)
+            while len(self._entries) > self.max_entries \
+                    or self.size > self.max_bytes:
+                entry = self._entries.popitem(last=False)[1]
+                self.size -= len(entry[1])
+
+    def clear(self):
+        'Removes all entries'
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+class DiskQueryCache(object):
+    '''
+    Cache of raw query responses stored in a sqlite file, so that
+    it survives restarts and can be shared by several processes
+    on one host (sqlite takes care of the file locking).
+    Bodies are compressed with zlib. Entries older than ttl seconds
+    are not used as they are, but revalidated with a conditional
+    request using the ETag and Last-Modified headers of the response.
+    '''
+
+    def __init__(self, path, ttl=3600):
+        self.path   = path
+        self.ttl    = ttl
+        self.hits   = 0
+        self.misses = 0
+        self._lock  = threading.Lock()
+        self._run('CREATE TABLE IF NOT EXISTS responses ('
+                  'key TEXT PRIMARY KEY, stored REAL, '
+                  'body BLOB, headers TEXT, url TEXT)')
+
+    def _run(self, statement, parameters=()):
+        'Executes one statement and returns the rows it selected'
+        # a new connection each time is what makes it safe
+        # to share the file between threads and processes
+        db = sqlite3.connect(self.path, timeout=30)
+        try:
+            rows = db.execute(statement, parameters).fetchall()
+            db.commit()
+            return rows
+        finally:
+            db.close()
+
+    def _hash(self, key):
+        parts = [part.encode('utf-8') if isinstance(part, unicode) else part
+                 for part in key]
+        return hashlib.sha1('\0'.join(parts)).hexdigest()
+
+    def __len__(self):
+        return self._run('SELECT COUNT(*) FROM responses')[0][0]
+
+    def get(self, key, stale=False):
+        '''
+        Returns the (body, headers, url) cached for key, or None.
+        With stale=True expired entries are returned too, so they
+        can be revalidated, and hits and misses are not counted.
+        '''
+        rows = self._run('SELECT stored, body, headers, url FROM responses '
+                         'WHERE key = ?', (self._hash(key),))
+        entry = rows and rows[0] or None
+        if not stale:
+            if entry is None or (self.ttl is not None
+                                 and time.time() - entry[0] > self.ttl):
+                with self._lock:
+                    self.misses += 1
+                return None
+            with self._lock:
+                self.hits += 1
+        if entry is None:
+            return None
+        stored, body, headers, url = entry
+        # put decoded the raw header bytes as latin-1, which maps
+        # every byte to one character, so this gives them back as sent
+        headers = httplib.HTTPMessage(StringIO(headers.encode('latin-1')))
+        return (zlib.decompress(body), headers, url)
+
+    def put(self, key, body, headers, url):
+        'Stores a response body with its headers and url'
+        self._run('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)',
+                  (self._hash(key), time.time(),
+                   sqlite3.Binary(zlib.compress(body)),
+                   str(headers).decode('latin-1'), url))
+
+    def clear(self):
+        'Removes all entries'
+        self._run('DELETE FROM responses')
+
 class SBOLNode(object):
 
-    def __init__(self, server_url):
+    def __init__(self, server_url, pool_size=4, idle_timeout=30,
+                 max_requests=100, cache=None, retries=0, deadline=None):
+        '''
+        Connects to the SPARQL endpoint at server_url.
+        Queries are sent over a pool of keep-alive connections
+        holding up to pool_size idle connections, each of which is
+        dropped after idle_timeout seconds or max_requests queries.
+        If cache is a QueryCache or DiskQueryCache, repeated queries
+        are answered from it.
+        Queries failing with a server or connection error are tried
+        up to retries more times, with jittered exponential backoff,
+        and given up after deadline seconds in total.
+        '''
         self.server = SPARQLWrapper(server_url)
+        self.pool = ConnectionPool(pool_size, idle_timeout, max_requests)
+        self.server.setConnectionPool(self.pool)
+        self.server.setRetries(retries)
+        self.server.setDeadline(deadline)
+        self.cache = cache
 
     def __repr__(self):
         return "<%s '%s'>" % (self.__class__.__name__, self.server.baseURI)
@@ -171,29 +777,919 @@ class SBOLNode(object):
     def login(self, username, password):
         self.server.setCredentials(username, password)
 
-    def execute(self, query):
-        'Performs the query and returns results as SBOLResults'
+    def _query_result(self, query, timeout=None):
+        '''
+        Performs the query and returns the QueryResult, which
+        comes from the cache if there is one.
+        timeout limits each network operation, in seconds.
+        '''
+
+        # each call gets its own copy of self.server, so that
+        # concurrent queries don't overwrite each other's settings
+        server = copy.copy(self.server)
+        server.setQuery( query.compile_query() )
+        server.setReturnFormat(JSON)
+        server.setTimeout(timeout)
+        if self.cache is None:
+            return server.query()
+
+        # answer from the cache if possible
+        key = (server.baseURI, server.queryString, server.returnFormat)
+        entry = self.cache.get(key)
+        if entry is None:
+            entry = self._revalidate(server, self.cache.get(key, stale=True))
+            self.cache.put(key, *entry)
+        return self._cached_result(entry, server.returnFormat)
+
+    def _fetch(self, query, timeout=None):
+        '''
+        Performs the query and returns the decoded JSON.
+        timeout limits each network operation, in seconds.
+        '''
+        return self._query_result(query, timeout).convert()
+
+    def _fetch_columns(self, query):
+        '''
+        Performs the query and returns ColumnarResults, filled while
+        the bindings are parsed instead of from the decoded JSON
+        '''
+        # the SELECTed telescope variables wrap rdflib Variables;
+        # a BoundQuery has none, its variables come with the bindings
+        names = [unicode(var.value) for var in getattr(query, 'SELECT', [])]
+        bindings = self._query_result(query).iterBindings()
+        return ColumnarResults.from_bindings(bindings, names)
 
-        # fetch JSON
-        self.server.setQuery( query.compile_query() )
-        self.server.setReturnFormat(JSON)
+    def _revalidate(self, server, stale):
+        '''
+        Fetches a (body, headers, url) response for the query in server.
+        If a stale cache entry is given, asks the endpoint to only send
+        the response if it changed, and returns the stale one otherwise.
+        '''
+        if stale is not None:
+            headers = stale[1]
+            server.customHttpHeaders = server.customHttpHeaders.copy()
+            if headers.get('etag'):
+                server.addCustomHttpHeader('If-None-Match', headers['etag'])
+            if headers.get('last-modified'):
+                server.addCustomHttpHeader('If-Modified-Since',
+                                           headers['last-modified'])
         try:
-            json = self.server.query().convert()
+            response = server.query().response
+        except urllib2.HTTPError, e:
+            if e.code == 304 and stale is not None:
+                e.read() # lets the connection go back to the pool
+                return stale
+            raise
+        return (response.read(), response.info(), response.geturl())
+
+    def _cached_result(self, entry, format):
+        'Rebuilds a QueryResult from a (body, headers, url) cache entry'
+        body, headers, url = entry
+        response = urllib.addinfourl(StringIO(body), headers, url)
+        return QueryResult((response, format))
+
+    def _to_result(self, binding, cls=None):
+        'Converts one JSON binding to an SBOLResult'
+        if cls is None:
+            cls = result_class(sorted(binding))
+        result = cls()
+        if cls.typed:
+            cells = cls._cells
+            for key in binding:
+                cells[key].__set__(result, binding[key])
+        else:
+            for key in binding:
+                setattr(result, key, binding[key]['value'])
+        return result
+
+    def _to_results(self, json, typed=False):
+        '''
+        Converts JSON bindings to SBOLResults, all of the result class
+        for the variables in the head of the response. Variables some
+        endpoints bind without listing them get slots as they come up.
+        '''
+        names = list(json.get('head', {}).get('vars', []))
+        cls = result_class(names, typed)
+        results = []
+        for binding in json['results']['bindings']:
+            try:
+                results.append( self._to_result(binding, cls) )
+            except (AttributeError, KeyError):
+                names += [key for key in binding if key not in names]
+                cls = result_class(names, typed)
+                results.append( self._to_result(binding, cls) )
+        return results
+
+    def execute(self, query, columnar=False, typed=False):
+        '''
+        Performs the query and returns results as SBOLResults,
+        or as ColumnarResults if columnar is set. If typed is set,
+        the SBOLResults hold rdflib terms instead of strings.
+        '''
+        try:
+            if columnar:
+                return self._fetch_columns(query)
+            json = self._fetch(query)
         except Exception, e:
             print e
             print query
+            if columnar:
+                return ColumnarResults()
             return []
+        return self._to_results(json, typed)
 
-        # process into SBOLResults
-        results = []
-        for binding in json['results']['bindings']:
-            result = SBOLResult()
-            for key in binding:
-                result.__setattr__(key, binding[key]['value'])
-            results.append(result)
+    def construct(self, query):
+        '''
+        Performs a telescope Construct query and returns the
+        resulting triples as an rdflib graph
+        '''
+        server = copy.copy(self.server)
+        server.setQuery( query.compile() )
+        server.setReturnFormat(XML)
+        return server.query().convert()
+
+    def iter_execute(self, query):
+        '''
+        Performs the query and yields SBOLResults one at a time,
+        parsing them as they arrive rather than after downloading
+        all of them, so memory use doesn't grow with the number of
+        results. Unlike execute, errors are raised, and the cache
+        is not used.
+        '''
+        server = copy.copy(self.server)
+        server.setQuery( query.compile_query() )
+        server.setReturnFormat(JSON)
+        for binding in server.query().iterBindings():
+            yield self._to_result(binding)
+
+    def paginate(self, query, page_size=1000):
+        '''
+        Performs the query one page of page_size results at a time,
+        using LIMIT and OFFSET, and yields the SBOLResults of all pages.
+        The next page is fetched in the background while the current
+        one is being consumed. The total is still capped by query.LIMIT;
+        set it to None to page through every result.
+        Pages are only consistent if the results have a stable order,
+        so if query.ORDER is empty the SELECTed variables are used.
+        '''
+        page = copy.copy(query)
+        if not page.ORDER:
+            page.ORDER = list(page.SELECT)
+
+        def fetch(offset, limit):
+            current = copy.copy(page)
+            current.OFFSET = offset
+            current.LIMIT  = limit
+            return self._to_results( self._fetch(current) )
+
+        def next_limit(fetched):
+            if query.LIMIT is None:
+                return page_size
+            return min(page_size, query.LIMIT - fetched)
 
+        offset  = query.OFFSET or 0
+        fetched = 0
+        limit   = next_limit(fetched)
+        if limit <= 0:
+            return
+        workers = ThreadPool(1)
+        try:
+            pending = workers.apply_async(fetch, (offset, limit))
+            while limit > 0:
+                results = pending.get()
+                fetched += len(results)
+                offset  += len(results)
+                if len(results) < limit:
+                    limit = 0 # a short page is the last one
+                else:
+                    limit = next_limit(fetched)
+                if limit > 0:
+                    pending = workers.apply_async(fetch, (offset, limit))
+                for result in results:
+                    yield result
+        finally:
+            # also stops the prefetch if the generator is abandoned
+            workers.terminate()
+
+    def _execute_or_error(self, query):
+        'Like execute, but returns the exception if the query fails'
+        try:
+            return self._to_results( self._fetch(query) )
+        except Exception, e:
+            return e
+
+    def execute_many(self, queries, max_workers=4):
+        '''
+        Performs several queries concurrently, using up to max_workers
+        threads. Returns one item per query, in the same order:
+        a list of SBOLResults, or the exception raised by that query.
+        '''
+        queries = list(queries)
+        if not queries:
+            return []
+        workers = ThreadPool( min(max_workers, len(queries)) )
+        try:
+            return workers.map(self._execute_or_error, queries, chunksize=1)
+        finally:
+            workers.close()
+            workers.join()
+
+    def _lookup_query(self, ids, attributes):
+        'Builds a query for the parts whose displayId is one of ids'
+        query = SBOLQuery(limit=None)
+        for rdf_predicate, attr_name in attributes:
+            query.map_attribute(rdf_predicate, attr_name, optional=True)
+        if ids:
+            name = Variable('name')
+            query.FILTER.append( Operator.or_(*[name == Literal(id) for id in ids]) )
+        return query
+
+    def _query_size(self, text):
+        'Returns the size of the query once URL-encoded'
+        if isinstance(text, unicode):
+            text = text.encode('utf-8')
+        return len( urllib.quote_plus(text) )
+
+    def _lookup_batches(self, ids, attributes, batch_size, max_query_bytes):
+        'Splits ids into queries of at most batch_size ids and max_query_bytes'
+
+        # estimate the size of each query from the size of one
+        # without ids plus the size of each id's part of the FILTER
+        base = self._query_size( self._lookup_query([], attributes).compile_query() )
+        base += self._query_size(u'FILTER ()')
+        batches = [[]]
+        size = base
+        for id in ids:
+            cost = self._query_size(u' || ?name = ' + Literal(id).n3())
+            if batches[-1] and (len(batches[-1]) >= batch_size
+                                or size + cost > max_query_bytes):
+                batches.append([])
+                size = base
+            batches[-1].append(id)
+            size += cost
+
+        # check the estimate, splitting batches that are still too big
+        queries = []
+        while batches:
+            batch = batches.pop(0)
+            query = self._lookup_query(batch, attributes)
+            if len(batch) > 1 and \
+                    self._query_size(query.compile_query()) > max_query_bytes:
+                half = len(batch) // 2
+                batches[0:0] = [batch[:half], batch[half:]]
+            else:
+                queries.append(query)
+        return queries
+
+    def lookup_parts(self, ids, attributes=(), batch_size=100,
+                     max_query_bytes=4000, max_workers=4):
+        '''
+        Looks up many parts by exact displayId, packing the ids into a
+        few queries of at most batch_size ids each, small enough to stay
+        under max_query_bytes once URL-encoded. The queries run
+        concurrently on up to max_workers threads.
+        attributes is a list of (rdf_predicate, attr_name) pairs, mapped
+        like map_attribute(rdf_predicate, attr_name, optional=True).
+        Returns an OrderedDict mapping each id to its list of SBOLResults
+        (empty if it wasn't found). Raises the error of a failed query.
+        '''
+        ids = list(OrderedDict.fromkeys(ids))
+        found = OrderedDict([(id, []) for id in ids])
+        if not ids:
+            return found
+        queries = self._lookup_batches(ids, attributes, batch_size,
+                                       max_query_bytes)
+        for results in self.execute_many(queries, max_workers):
+            if isinstance(results, Exception):
+                raise results
+            for result in results:
+                if result.name in found:
+                    found[result.name].append(result)
+        return found
+
+class AsyncSBOLNode(SBOLNode):
+    '''
+    An SBOLNode that performs queries without blocking.
+    execute only schedules a query and returns a handle on it;
+    run then performs all scheduled queries from a single thread,
+    with at most max_concurrency requests in flight at once.
+    '''
+
+    def __init__(self, server_url, max_concurrency=10, timeout=None):
+        SBOLNode.__init__(self, server_url)
+        self.client = AsyncClient(max_concurrency, timeout)
+
+    def execute(self, query, callback=None, timeout=None):
+        '''
+        Schedules the query and returns an AsyncQuery handle.
+        Pass the handle to results once it is done, or cancel it.
+        '''
+        server = copy.copy(self.server)
+        server.setQuery( query.compile_query() )
+        server.setReturnFormat(JSON)
+        return self.client.submit(server, callback, timeout)
+
+    def run(self, timeout=None):
+        '''
+        Performs the scheduled queries. Returns False if timeout
+        seconds passed before all of them were done.
+        '''
+        return self.client.run(timeout)
+
+    def results(self, handle):
+        'Returns the SBOLResults of a finished query, or raises its error'
+        return self._to_results( handle.result().convert() )
+
+    def execute_many(self, queries, max_workers=None):
+        '''
+        Performs several queries and returns, in the same order,
+        a list of SBOLResults or the exception raised for each.
+        max_workers overrides max_concurrency for this call.
+        '''
+        handles = [self.execute(query) for query in queries]
+        default = self.client.maxConcurrency
+        if max_workers is not None:
+            self.client.maxConcurrency = max_workers
+        try:
+            self.run()
+        finally:
+            self.client.maxConcurrency = default
+        results = []
+        for handle in handles:
+            try:
+                results.append( self.results(handle) )
+            except Exception, e:
+                results.append(e)
         return results
 
+class CircuitOpen(Exception):
+    'Raised instead of querying a node that failed recently'
+
+class NodeHealth(object):
+    '''
+    Latency and error statistics of one node over its last window
+    queries, and a circuit breaker: after failure_threshold failures
+    in a row the circuit opens and the node is skipped. Once
+    reset_timeout seconds have passed it goes half-open, and a
+    single query is let through as a probe; the circuit closes
+    again if the probe succeeds, and reopens if it fails.
+    '''
+
+    CLOSED    = 'closed'
+    OPEN      = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, failure_threshold=3, reset_timeout=30, window=100):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout     = reset_timeout
+        self.latencies = deque(maxlen=window)
+        self.outcomes  = deque(maxlen=window)
+        self.failures  = 0 # in a row
+        self.state     = self.CLOSED
+        self.opened_at = None
+        self.probing   = False
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return '<%s %s>' % (self.__class__.__name__, self.summary())
+
+    def percentile(self, percent):
+        'Returns a latency percentile in seconds, or None if unknown'
+        with self._lock:
+            latencies = sorted(self.latencies)
+        if not latencies:
+            return None
+        rank = int(math.ceil(percent / 100.0 * len(latencies)))
+        return latencies[max(rank, 1) - 1]
+
+    def error_rate(self):
+        'Returns the fraction of recent queries that failed'
+        with self._lock:
+            if not self.outcomes:
+                return 0.0
+            return self.outcomes.count(False) / float(len(self.outcomes))
+
+    def summary(self):
+        return {'state'     : self.state,
+                'p50'       : self.percentile(50),
+                'p95'       : self.percentile(95),
+                'p99'       : self.percentile(99),
+                'error_rate': self.error_rate()}
+
+    def _expired(self):
+        return self.state == self.OPEN and \
+            time.time() - self.opened_at >= self.reset_timeout
+
+    def can_probe(self):
+        'Whether the next query would be a half-open probe'
+        with self._lock:
+            return self._expired() or \
+                (self.state == self.HALF_OPEN and not self.probing)
+
+    def allow_request(self):
+        '''
+        Returns whether the node may be queried now. In the
+        half-open state this takes the single probe.
+        '''
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self._expired():
+                self.state = self.HALF_OPEN
+                self.probing = False
+            if self.state == self.HALF_OPEN and not self.probing:
+                self.probing = True
+                return True
+            return False
+
+    def record_success(self, latency):
+        with self._lock:
+            self.latencies.append(latency)
+            self.outcomes.append(True)
+            self.failures = 0
+            self.state    = self.CLOSED
+            self.probing  = False
+
+    def record_failure(self):
+        with self._lock:
+            self.outcomes.append(False)
+            self.failures += 1
+            if self.state == self.HALF_OPEN or \
+                    self.failures >= self.failure_threshold:
+                self.state     = self.OPEN
+                self.opened_at = time.time()
+                self.probing   = False
+
+class HealthTracker(object):
+    '''
+    Keeps a NodeHealth for each SBOLNode it is asked about,
+    all with the same circuit breaker settings.
+    '''
+
+    def __init__(self, failure_threshold=3, reset_timeout=30, window=100):
+        self.settings = (failure_threshold, reset_timeout, window)
+        self.nodes = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, node):
+        with self._lock:
+            if node not in self.nodes:
+                self.nodes[node] = NodeHealth(*self.settings)
+            return self.nodes[node]
+
+    def ranked(self, nodes):
+        '''
+        Returns the nodes that may be queried, fastest first by
+        median latency. Nodes due for a probe come first, so they
+        can recover, and so do nodes that were never timed.
+        '''
+        def key(node):
+            health = self[node]
+            return (not health.can_probe(), health.percentile(50) or 0)
+        candidates = [node for node in nodes
+                      if self[node].state == NodeHealth.CLOSED
+                      or self[node].can_probe()]
+        return sorted(candidates, key=key)
+
+    def call(self, node, function, *args):
+        '''
+        Calls function(*args), recording its latency or failure
+        for node. A badly formed query is the fault of the query,
+        not of the node, so it counts as an answer.
+        '''
+        start = time.time()
+        try:
+            value = function(*args)
+        except QueryBadFormed:
+            self[node].record_success(time.time() - start)
+            raise
+        except Exception:
+            self[node].record_failure()
+            raise
+        self[node].record_success(time.time() - start)
+        return value
+
+class ReplicatedSBOLNode(SBOLNode):
+    '''
+    An SBOLNode for several nodes serving the same data. Each query
+    goes to the fastest healthy one according to tracker, falling
+    back to the next ones if it fails. Nodes whose circuit is open
+    are skipped until it is time to probe them again.
+    With hedge set, a query that the first node hasn't answered
+    within its 95th percentile latency is also sent to the next
+    one, and whichever answers first is used. A node without any
+    latencies yet, like a new or recovering one, is given
+    hedge_delay seconds instead.
+    '''
+
+    def __init__(self, nodes, tracker=None, hedge=False, hedge_delay=0.5):
+        if tracker is None:
+            tracker = HealthTracker()
+        self.nodes   = list(nodes)
+        self.tracker = tracker
+        self.hedge   = hedge
+        self.hedge_delay = hedge_delay
+        self.cache   = None
+
+    def __repr__(self):
+        return '<%s %r>' % (self.__class__.__name__, self.nodes)
+
+    def login(self, username, password):
+        for node in self.nodes:
+            node.login(username, password)
+
+    def _call(self, answers, node, method, args):
+        'Puts (True, value) or (False, error) from a node in answers'
+        try:
+            answers.put(( True, self.tracker.call(node, getattr(node, method), *args) ))
+        except Exception, e:
+            answers.put(( False, e ))
+
+    def _hedged_route(self, method, *args):
+        '''
+        Like _route, but the nodes are queried in background threads,
+        so that a second one can be started while the first is slow.
+        Left over queries finish in the background; their latency is
+        still recorded.
+        '''
+        error = CircuitOpen('no healthy node among %r' % (self.nodes,))
+        answers = Queue.Queue()
+        ranked  = iter(self.tracker.ranked(self.nodes))
+
+        def start():
+            for node in ranked:
+                if self.tracker[node].allow_request():
+                    thread = threading.Thread(target=self._call,
+                                              args=(answers, node, method, args))
+                    thread.daemon = True
+                    thread.start()
+                    return node
+            return None
+
+        first   = start()
+        running = int(first is not None)
+        hedged  = False
+        while running:
+            delay = None
+            if not hedged:
+                delay = self.tracker[first].percentile(95)
+                if delay is None:
+                    delay = self.hedge_delay
+            try:
+                ok, value = answers.get(timeout=delay)
+            except Queue.Empty:
+                hedged = True
+                if start() is not None:
+                    running += 1
+                continue
+            running -= 1
+            if ok:
+                return value
+            if isinstance(value, QueryBadFormed):
+                raise value
+            error = value
+            if running == 0:
+                first = start()
+                running = int(first is not None)
+        raise error
+
+    def _route(self, method, *args):
+        'Calls method on the best node that answers'
+        if self.hedge:
+            return self._hedged_route(method, *args)
+        error = CircuitOpen('no healthy node among %r' % (self.nodes,))
+        for node in self.tracker.ranked(self.nodes):
+            if not self.tracker[node].allow_request():
+                continue
+            try:
+                return self.tracker.call(node, getattr(node, method), *args)
+            except QueryBadFormed:
+                raise
+            except Exception, e:
+                error = e
+        raise error
+
+    def _fetch(self, query, timeout=None):
+        return self._route('_fetch', query, timeout)
+
+    def _fetch_columns(self, query):
+        return self._route('_fetch_columns', query)
+
+    def construct(self, query):
+        return self._route('construct', query)
+
+    def iter_execute(self, query):
+        '''
+        Performs the query and yields SBOLResults one at a time.
+        Unlike execute, errors are raised.
+        '''
+        for binding in self._fetch(query)['results']['bindings']:
+            yield self._to_result(binding)
+
+class LocalSBOLNode(SBOLNode):
+    '''
+    An SBOLNode that answers queries from an rdflib graph in
+    this process instead of a remote endpoint, for example a
+    mirror loaded from an SBPkb dump with load. It takes the
+    same SBOLQuerys and returns the same SBOLResults.
+    '''
+
+    # rdflib parser for each dump file extension
+    FORMATS = {'.nt' : 'nt',
+               '.nq' : 'nquads',
+               '.rdf': 'xml',
+               '.xml': 'xml',
+               '.owl': 'xml',
+               '.n3' : 'n3',
+               '.ttl': 'n3'}
+
+    def __init__(self, graph=None):
+        '''
+        Queries graph, or a new empty ConjunctiveGraph
+        if none is given.
+        '''
+        if graph is None:
+            graph = ConjunctiveGraph()
+        self.graph = graph
+        self.cache = None
+
+    def __repr__(self):
+        return '<%s %r>' % (self.__class__.__name__, self.graph)
+
+    def login(self, username, password):
+        'Does nothing; a local graph needs no credentials'
+        pass
+
+    def load(self, source=None, format=None, data=None, processes=None):
+        '''
+        Adds the triples of an RDF dump to the graph. source is
+        a path, URL or file object, or data a string. The format
+        is guessed from the file extension if not given, and
+        files ending in .gz are decompressed. With processes,
+        N-Triples and N-Quads dumps are parsed by that many
+        processes at once.
+        '''
+        args = {}
+        if processes:
+            args['processes'] = processes
+        if data is not None:
+            self.graph.parse(data=data, format=format or 'nt', **args)
+            return
+        if not isinstance(source, basestring):
+            self.graph.parse(source, format=format or 'xml', **args)
+            return
+        path = source
+        compressed = path.endswith('.gz')
+        if compressed:
+            path = path[:-3]
+        if format is None:
+            extension = os.path.splitext(path)[1].lower()
+            format = self.FORMATS.get(extension, 'xml')
+        if compressed:
+            dump = gzip.open(source, 'rb')
+            try:
+                self.graph.parse(dump, publicID=path, format=format, **args)
+            finally:
+                dump.close()
+        else:
+            self.graph.parse(source, format=format, **args)
+
+    def save_snapshot(self, path):
+        '''
+        Writes the graph to a snapshot file at path, which
+        from_snapshot can open without parsing anything
+        '''
+        write_snapshot(self.graph, path)
+
+    @classmethod
+    def from_snapshot(cls, path):
+        '''
+        Returns a LocalSBOLNode querying the snapshot file at path
+        in place. The file is mapped into memory read-only, so it
+        opens at once and all the processes that open it share
+        the same pages.
+        '''
+        graph = ConjunctiveGraph('Snapshot')
+        if graph.open(path) != VALID_STORE:
+            raise IOError('%s is not a snapshot' % path)
+        return cls(graph)
+
+    def _to_json(self, term):
+        'Converts an rdflib term to a SPARQL JSON value'
+        if isinstance(term, URIRef):
+            return {'type': 'uri', 'value': unicode(term)}
+        if isinstance(term, BNode):
+            return {'type': 'bnode', 'value': unicode(term)}
+        value = {'type': 'literal', 'value': unicode(term)}
+        if term.language:
+            value['xml:lang'] = term.language
+        if term.datatype:
+            value['type'] = 'typed-literal'
+            value['datatype'] = unicode(term.datatype)
+        return value
+
+    def _fetch(self, query, timeout=None):
+        '''
+        Performs the query on the graph and returns the results in
+        the same form as the decoded JSON from an endpoint
+        '''
+        result = self.graph.query( query.compile_query() )
+        names = [unicode(var) for var in result.vars]
+        bindings = []
+        for row in result.bindings:
+            bindings.append(dict([(unicode(var), self._to_json(term))
+                                  for var, term in row.items()
+                                  if term is not None]))
+        return {'head'   : {'vars': names},
+                'results': {'bindings': bindings}}
+
+    def _fetch_columns(self, query):
+        # the rows are in memory already, there is nothing to stream
+        return ColumnarResults.from_json(self._fetch(query))
+
+    def construct(self, query):
+        '''
+        Performs a telescope Construct query and returns the
+        resulting triples as an rdflib graph
+        '''
+        return self.graph.query( query.compile() ).graph
+
+    def iter_execute(self, query):
+        '''
+        Performs the query and yields SBOLResults one at a time.
+        Unlike execute, errors are raised.
+        '''
+        for binding in self._fetch(query)['results']['bindings']:
+            yield self._to_result(binding)
+
+class MirrorSync(object):
+    '''
+    Copies the DnaComponents of a remote SBOLNode into the graph
+    of a LocalSBOLNode, and keeps them up to date.
+
+    The remote node is read in pages of page_size triples with
+    CONSTRUCT queries, ordered by part so that each page can start
+    after the last part of the previous one. A hash of the triples
+    of each part is kept in a sqlite file at state_path, and only
+    parts whose hash changed are written to the mirror; parts that
+    are no longer on the remote node are removed from it at the
+    end of a pass. The position in the current pass is saved after
+    every page, so an interrupted sync continues where it stopped.
+    The state describes the contents of the mirror, so it should
+    be kept (or reset) together with them.
+    '''
+
+    def __init__(self, remote, mirror, state_path, page_size=1000):
+        self.remote    = remote
+        self.mirror    = mirror
+        self.path      = state_path
+        self.page_size = page_size
+        self._reset_counts()
+        db = sqlite3.connect(self.path, timeout=30)
+        try:
+            db.execute('CREATE TABLE IF NOT EXISTS parts ('
+                       'subject TEXT PRIMARY KEY, hash TEXT, pass INTEGER)')
+            db.execute('CREATE TABLE IF NOT EXISTS state ('
+                       'name TEXT PRIMARY KEY, value TEXT)')
+            db.commit()
+        finally:
+            db.close()
+
+    def _reset_counts(self):
+        self.pages     = 0
+        self.added     = 0
+        self.changed   = 0
+        self.unchanged = 0
+        self.removed   = 0
+
+    def _get_state(self, db, name):
+        row = db.execute('SELECT value FROM state WHERE name = ?',
+                         (name,)).fetchone()
+        return row and row[0] or None
+
+    def _set_state(self, db, name, value):
+        db.execute('INSERT OR REPLACE INTO state VALUES (?, ?)', (name, value))
+
+    def _page_query(self, cursor, limit):
+        'Builds a query for the triples of the parts after cursor'
+        part, p, o = Variable('part'), Variable('p'), Variable('o')
+        pattern = GroupGraphPattern.from_obj([(part, RDF.type, SBOL.DnaComponent),
+                                              (part, p, o)])
+        pattern.filter(Operator.str(part) > Literal(cursor))
+        return Construct([(part, p, o)], pattern,
+                         order_by=[part, p, o], limit=limit)
+
+    def _fetch_page(self, cursor):
+        '''
+        Returns a list of (part, triples) after cursor, in order.
+        The last part of a full page may continue on the next page,
+        so it is left out, and fetched again with the next page.
+        '''
+        limit = self.page_size
+        while True:
+            graph = self.remote.construct( self._page_query(cursor, limit) )
+            self.pages += 1
+            parts = {}
+            count = 0
+            for triple in graph:
+                parts.setdefault(triple[0], set()).add(triple)
+                count += 1
+            subjects = sorted(parts, key=unicode)
+            if count < limit:
+                return [(s, parts[s]) for s in subjects], True
+            if len(subjects) > 1:
+                return [(s, parts[s]) for s in subjects[:-1]], False
+            # a single part fills the page: try again with bigger pages
+            limit *= 2
+
+    def _hash(self, triples):
+        'Hashes the triples of a part, ignoring blank node labels'
+        lines = []
+        for s, p, o in triples:
+            if isinstance(o, BNode):
+                lines.append(u'%s _:' % p.n3())
+            else:
+                lines.append(u'%s %s' % (p.n3(), o.n3()))
+        lines.sort()
+        return hashlib.sha1(u'\n'.join(lines).encode('utf-8')).hexdigest()
+
+    def _update(self, part, triples):
+        'Applies the difference between the mirrored and remote part'
+        graph = self.mirror.graph
+        local = set(graph.triples((part, None, None)))
+        for triple in local - triples:
+            graph.remove(triple)
+        for triple in triples - local:
+            graph.add(triple)
+
+    def _finish_pass(self, db, current):
+        'Removes the parts that were not seen during the pass'
+        rows = db.execute('SELECT subject FROM parts WHERE pass != ?',
+                          (current,)).fetchall()
+        for (subject,) in rows:
+            self.mirror.graph.remove((URIRef(subject), None, None))
+            self.removed += 1
+        db.execute('DELETE FROM parts WHERE pass != ?', (current,))
+        self._set_state(db, 'cursor', None)
+
+    def sync(self, max_pages=None):
+        '''
+        Runs (or continues) a pass over the remote parts. Stops
+        early after max_pages pages if given; the next call then
+        continues from there. Returns True once the pass is done.
+        The counts of pages, added, changed, unchanged and removed
+        parts are kept as attributes.
+        '''
+        self._reset_counts()
+        db = sqlite3.connect(self.path, timeout=30)
+        try:
+            current = int(self._get_state(db, 'pass') or 0)
+            cursor  = self._get_state(db, 'cursor')
+            if cursor is None:
+                # start a new pass
+                current += 1
+                cursor = u''
+                self._set_state(db, 'pass', current)
+                self._set_state(db, 'cursor', cursor)
+                db.commit()
+            while max_pages is None or self.pages < max_pages:
+                parts, last = self._fetch_page(cursor)
+                for part, triples in parts:
+                    digest = self._hash(triples)
+                    row = db.execute('SELECT hash FROM parts WHERE subject = ?',
+                                     (unicode(part),)).fetchone()
+                    if row is None:
+                        self.added += 1
+                    elif row[0] != digest:
+                        self.changed += 1
+                    else:
+                        self.unchanged += 1
+                    if row is None or row[0] != digest:
+                        self._update(part, triples)
+                    db.execute('INSERT OR REPLACE INTO parts VALUES (?, ?, ?)',
+                               (unicode(part), digest, current))
+                if parts:
+                    cursor = unicode(parts[-1][0])
+                    self._set_state(db, 'cursor', cursor)
+                if last:
+                    self._finish_pass(db, current)
+                db.commit()
+                if last:
+                    return True
+            return False
+        finally:
+            db.close()
+
+    def reset(self):
+        'Forgets all hashes, so the next pass rewrites every part'
+        db = sqlite3.connect(self.path, timeout=30)
+        try:
+            db.execute('DELETE FROM parts')
+            db.execute('DELETE FROM state')
+            db.commit()
+        finally:
+            db.close()
+
 #############
 # functions
 #############
@@ -205,6 +1701,96 @@ def list_known_nodes(index='http://index.sbolstandard.org/syndex.txt'):
     nodes = [SBOLNode(url) for url in urls]
     return nodes
 
+def _timed_fetch(node, query, timeout, started=None):
+    '''
+    Returns how long the query took on node, and its JSON.
+    The start time is also put in the started queue, if given.
+    '''
+    start = time.time()
+    if started is not None:
+        started.put(start)
+    json = node._fetch(query, timeout)
+    return (time.time() - start, json)
+
+def federated_execute(query, nodes=None, timeout=30, max_workers=None,
+                      tracker=None):
+    '''
+    Performs the query on several SBOLNodes at once (by default
+    all known ones) and merges their results into one list,
+    keeping a single SBOLResult per result URI. Each result is
+    tagged with the node it came from as its source attribute;
+    a part found on several nodes comes from the first of them.
+    Nodes that fail, or haven't answered timeout seconds after
+    their own request started, are left out: the returned
+    FederatedResults maps them to their exceptions in its errors
+    attribute.
+    If a HealthTracker is given, nodes whose circuit is open are
+    not queried, and the latency or failure of the others is
+    recorded in it.
+    Uses one thread per node, or max_workers threads. With more
+    nodes than threads, the rest wait for a free thread, and their
+    timeout only starts when they are sent; a node still waiting
+    after as many timeouts as there are rounds of threads is given
+    up on too.
+    '''
+    if nodes is None:
+        nodes = list_known_nodes()
+    nodes = list(nodes)
+    merged = FederatedResults()
+    if tracker is not None:
+        for node in nodes:
+            if not tracker[node].allow_request():
+                merged.errors[node] = CircuitOpen('%r failed recently' % node)
+        nodes = [node for node in nodes if node not in merged.errors]
+    if not nodes:
+        return merged
+
+    # the result URIs are needed to find duplicates
+    query = copy.copy(query)
+    if 'result' not in [str(var.value) for var in query.SELECT]:
+        query.SELECT.append(query.result)
+
+    size = max_workers or len(nodes)
+    workers = ThreadPool(size)
+    try:
+        starts = [Queue.Queue(1) for node in nodes]
+        pending = [workers.apply_async(_timed_fetch,
+                                       (node, query, timeout, started))
+                   for node, started in zip(nodes, starts)]
+        if timeout is not None:
+            rounds = (len(nodes) + size - 1) // size
+            last = time.time() + rounds * timeout
+        seen = set()
+        for node, answer, started in zip(nodes, pending, starts):
+            try:
+                if timeout is None:
+                    latency, json = answer.get()
+                else:
+                    start = started.get(True, max(0, last - time.time()))
+                    latency, json = answer.get( max(0, start + timeout - time.time()) )
+            except (TimeoutError, Queue.Empty):
+                merged.errors[node] = QueryTimeout(timeout)
+            except Exception, e:
+                merged.errors[node] = e
+            if node in merged.errors:
+                if tracker is not None:
+                    tracker[node].record_failure()
+                continue
+            if tracker is not None:
+                tracker[node].record_success(latency)
+            for result in node._to_results(json):
+                uri = getattr(result, 'result', None)
+                if uri is not None:
+                    if uri in seen:
+                        continue
+                    seen.add(uri)
+                result.source = node
+                merged.append(result)
+    finally:
+        # don't wait for the nodes that timed out
+        workers.close()
+    return merged
+
 #############
 # instances
 #############
@@ -0,0 +1,339 @@
+import os
+import sys
+import time
+import shutil
+import tempfile
+import random
+import resource
+import multiprocessing
+from sbol_query import *
+from sbol_query_tests import StubEndpoint, echo_keyword, sbpkb_dump
+from rdflib import Graph
+from rdflib.term import TermPool
+from rdflib.plugins.memory import Memory, IOMemory
+from rdflib.plugins.arraymemory import ArrayMemory
+from rdflib.plugins.parsers.ntriples import NTriplesParser
+
+###########
+# helpers
+###########
+
+def timed(function, *args, **kwargs):
+    'Returns how many seconds function(*args, **kwargs) took'
+    start = time.time()
+    function(*args, **kwargs)
+    return time.time() - start
+
+def report(name, seconds, count):
+    print '%-28s %8.3f s %10.1f queries/s' % (name, seconds, count / seconds)
+
+def slow_endpoint(latency):
+    'Starts a stub endpoint that takes latency seconds per query'
+    def answer(query):
+        time.sleep(latency)
+        return echo_keyword(query)
+    return StubEndpoint(answer)
+
+##############
+# benchmarks
+##############
+
+def bench_async(count=200, latency=0.02):
+    print 'async vs sync: %d queries, %.0f ms latency' % (count, latency * 1000)
+    endpoint = slow_endpoint(latency)
+    queries = [SBOLQuery('B%04d' % i) for i in range(count)]
+    try:
+        node = SBOLNode(endpoint.url)
+        report('SBOLNode.execute', timed(map, node.execute, queries), count)
+        report('SBOLNode.execute_many', timed(node.execute_many, queries, 20), count)
+        node = AsyncSBOLNode(endpoint.url, max_concurrency=20)
+        report('AsyncSBOLNode.execute_many', timed(node.execute_many, queries), count)
+    finally:
+        endpoint.stop()
+
+def bench_compile(repeat=200):
+    print 'compile_query: %d compilations' % repeat
+    for clauses in [1, 10, 100]:
+        query = SBOLQuery()
+        for i in range(clauses):
+            query.map_attribute(SBOL['attribute%d' % i], 'attr%d' % i)
+        cold = timed(lambda: [query.build_query().compile() for i in range(repeat)])
+        warm = timed(lambda: [query.compile_query() for i in range(repeat)])
+        print '%3d clauses: %8.3f ms uncached %8.4f ms cached' % \
+            (clauses, cold * 1000 / repeat, warm * 1000 / repeat)
+
+def bench_prepared(repeat=1000):
+    print 'prepared queries: %d bindings' % repeat
+    names = ['B%04d' % i for i in range(repeat)]
+    build = timed(lambda: [SBOLQuery(name).compile_query() for name in names])
+    prepared = SBOLQuery(Parameter('keyword')).prepare()
+    bind = timed(lambda: [prepared.bind(keyword=name) for name in names])
+    print 'SBOLQuery(...).compile_query %8.4f ms' % (build * 1000 / repeat)
+    print 'PreparedQuery.bind           %8.4f ms' % (bind * 1000 / repeat)
+
+class DictResult(object):
+    'An SBOLResult as it was before result_class, with a __dict__'
+    pass
+
+def dict_results(json):
+    results = []
+    for binding in json['results']['bindings']:
+        result = DictResult()
+        for key in binding:
+            result.__setattr__(key, binding[key]['value'])
+        results.append(result)
+    return results
+
+def result_bytes(results):
+    'Bytes used by the result objects, not counting the shared values'
+    total = 0
+    for result in results:
+        total += sys.getsizeof(result)
+        if not isinstance(result, SBOLResult):
+            total += sys.getsizeof(result.__dict__)
+    return total
+
+def bench_results(count=100000):
+    print 'result rows: %d rows of 3 variables' % count
+    names = ['name', 'description', 'type']
+    json = {'head': {'vars': names},
+            'results': {'bindings': [
+                dict((name, {'type': 'literal', 'value': '%s%d' % (name, i)})
+                     for name in names)
+                for i in range(count)]}}
+    node = SBOLNode('http://localhost/sparql')
+    for label, convert in [('__dict__ rows', dict_results),
+                           ('slotted rows',  node._to_results),
+                           ('typed rows',    lambda json: node._to_results(json, True))]:
+        start = time.time()
+        results = convert(json)
+        seconds = time.time() - start
+        print '%-14s %8.3f s %8.1f MB' % \
+            (label, seconds, result_bytes(results) / 1024.0 ** 2)
+
+def load_dump(args):
+    '''
+    Parses an N-Triples dump into a fresh store, in a process of
+    its own, and returns the seconds and KB of memory it took
+    '''
+    data, store, pooled = args
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.time()
+    graph = Graph(store())
+    if pooled:
+        graph.parse(data=data, format='nt', pool=TermPool())
+    else:
+        graph.parse(data=data, format='nt')
+    seconds = time.time() - start
+    return seconds, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - before
+
+def bench_interning(parts=20000):
+    print 'term interning: SBPkb dump of %d parts' % parts
+    data = sbpkb_dump(['P%06d' % i for i in range(parts)])
+    for store in [IOMemory, Memory]:
+        for pooled in [False, True]:
+            workers = multiprocessing.Pool(1)
+            seconds, kb = workers.apply(load_dump, [(data, store, pooled)])
+            workers.terminate()
+            print '%-8s %-9s %8.3f s %8.1f MB' % (store.__name__,
+                pooled and 'TermPool' or 'no pool', seconds, kb / 1024.0)
+
+def query_store(args):
+    '''
+    Loads an N-Triples dump into a fresh store, in a process of its
+    own, and looks parts up by subject and by displayId. Returns the
+    seconds the load took, its KB of memory, and the milliseconds
+    per lookup.
+    '''
+    data, store, names, lookups = args
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.time()
+    graph = Graph(store())
+    graph.parse(data=data, format='nt')
+    len(graph) # ArrayMemory sorts its indexes on the first read
+    seconds = time.time() - start
+    kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - before
+    return seconds, kb, lookup_parts(graph, names, lookups)
+
+def lookup_parts(graph, names, lookups):
+    'Milliseconds per lookup of a part by subject or by displayId'
+    names = random.Random(0).sample(names, lookups)
+    start = time.time()
+    for name in names:
+        part = URIRef('http://partsregistry.org/part/%s' % name)
+        list(graph.triples((part, None, None)))
+        list(graph.triples((None, SBOL.displayId, Literal(name))))
+    return (time.time() - start) * 1000 / (2 * lookups)
+
+def bench_stores(parts=20000, lookups=2000):
+    print 'stores: SBPkb dump of %d parts, %d lookups' % (parts, lookups)
+    names = ['P%06d' % i for i in range(parts)]
+    data = sbpkb_dump(names)
+    for store in [IOMemory, ArrayMemory]:
+        workers = multiprocessing.Pool(1)
+        seconds, kb, lookup = workers.apply(query_store,
+                                            [(data, store, names, lookups)])
+        workers.terminate()
+        print '%-11s load %7.3f s %8.1f MB   lookup %7.4f ms' % \
+            (store.__name__, seconds, kb / 1024.0, lookup)
+
+class AddSink(object):
+    'An N-Triples sink adding one triple at a time, as NTSink used to'
+    def __init__(self, graph):
+        self.graph = graph
+    def triple(self, s, p, o):
+        self.graph.add((s, p, o))
+
+def bulk_load(args):
+    '''
+    Loads an N-Triples dump into a fresh store, in a process of its
+    own, one triple at a time or in batches, and returns the seconds
+    it took
+    '''
+    data, store, batched = args
+    start = time.time()
+    graph = Graph(store())
+    if batched:
+        graph.parse(data=data, format='nt')
+    else:
+        NTriplesParser(AddSink(graph)).parsestring(data)
+    len(graph)
+    return time.time() - start
+
+def bench_bulk_load(parts=100000):
+    print 'bulk load: SBPkb dump of %d parts' % parts
+    data = sbpkb_dump(['P%06d' % i for i in range(parts)])
+    triples = data.count('\n')
+    for store in [IOMemory, ArrayMemory]:
+        for batched in [False, True]:
+            workers = multiprocessing.Pool(1)
+            seconds = workers.apply(bulk_load, [(data, store, batched)])
+            workers.terminate()
+            print '%-11s %-5s %8.3f s %10.0f triples/s' % (store.__name__,
+                batched and 'addN' or 'add', seconds, triples / seconds)
+
+def open_snapshot(args):
+    '''
+    Opens a snapshot file, in a process of its own, and returns the
+    seconds and KB of memory that took, and the milliseconds per
+    lookup
+    '''
+    path, names, lookups = args
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.time()
+    graph = LocalSBOLNode.from_snapshot(path).graph
+    seconds = time.time() - start
+    kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - before
+    return seconds, kb, lookup_parts(graph, names, lookups)
+
+def bench_snapshot(parts=20000, lookups=2000):
+    print 'snapshot: SBPkb dump of %d parts, %d lookups' % (parts, lookups)
+    names = ['P%06d' % i for i in range(parts)]
+    node = LocalSBOLNode()
+    node.load(data=sbpkb_dump(names))
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, 'sbpkb.snapshot')
+        seconds = timed(node.save_snapshot, path)
+        print 'written in %.3f s, %.1f MB' % \
+            (seconds, os.path.getsize(path) / 1024.0 ** 2)
+        for label, function, args in [
+                ('parse', query_store, (sbpkb_dump(names), IOMemory, names, lookups)),
+                ('snapshot', open_snapshot, (path, names, lookups))]:
+            workers = multiprocessing.Pool(1)
+            seconds, kb, lookup = workers.apply(function, [args])
+            workers.terminate()
+            print '%-9s open %7.3f s %8.1f MB   lookup %7.4f ms' % \
+                (label, seconds, kb / 1024.0, lookup)
+    finally:
+        shutil.rmtree(directory)
+
+def bench_parallel_parse(parts=100000):
+    print 'parallel parse: SBPkb dump of %d parts, %d CPUs' % \
+        (parts, multiprocessing.cpu_count())
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, 'sbpkb.nt')
+        dump = open(path, 'wb')
+        dump.write(sbpkb_dump(['P%06d' % i for i in range(parts)]))
+        dump.close()
+        # run here, as the daemonic processes of a Pool can't start one
+        for processes in [None, 2, 4]:
+            graph = Graph(ArrayMemory())
+            start = time.time()
+            graph.parse(path, format='nt', processes=processes)
+            seconds = time.time() - start
+            print '%-11s %8.3f s %10.0f triples/s' % \
+                (processes and '%d processes' % processes or 'sequential',
+                 seconds, len(graph) / seconds)
+            del graph
+    finally:
+        shutil.rmtree(directory)
+
+XSD_INTEGER = 'http://www.w3.org/2001/XMLSchema#integer'
+
+def sbol_dump(parts):
+    '''
+    N-Triples shaped like a registry dump: per part a DnaComponent
+    with names, a description (some with escapes or a language), a
+    DnaSequence, and a SequenceAnnotation blank node with typed
+    positions. 12 triples per part.
+    '''
+    rnd = random.Random(0)
+    lines = []
+    for i in range(parts):
+        name = 'P%06d' % i
+        part = '<http://partsregistry.org/part/%s>' % name
+        sequence = '<http://partsregistry.org/seq/%s>' % name
+        annotation = '_:a%d' % i
+        if i % 10 == 0:
+            description = r'"\"%s\" terminator,\nfrom E. coli"' % name
+        elif i % 10 == 1:
+            description = '"Promoter %s"@en' % name
+        else:
+            description = '"Ribosome binding site %s"' % name
+        lines += ['%s <%s> <%s> .' % (part, RDF.type, SBOL.DnaComponent),
+                  '%s <%s> "%s" .' % (part, SBOL.displayId, name),
+                  '%s <%s> "%s" .' % (part, SBOL.name, name),
+                  '%s <%s> %s .' % (part, SBOL.description, description),
+                  '%s <%s> %s .' % (part, SBOL.dnaSequence, sequence),
+                  '%s <%s> <%s> .' % (sequence, RDF.type, SBOL.DnaSequence),
+                  '%s <%s> "%s" .' % (sequence, SBOL.nucleotides,
+                      ''.join(rnd.choice('acgt') for j in range(60))),
+                  '%s <%s> %s .' % (part, SBOL.annotation, annotation),
+                  '%s <%s> <%s> .' % (annotation, RDF.type, SBOL.SequenceAnnotation),
+                  '%s <%s> "%d"^^<%s> .' % (annotation, SBOL.bioStart, 1, XSD_INTEGER),
+                  '%s <%s> "%d"^^<%s> .' % (annotation, SBOL.bioEnd, 60, XSD_INTEGER),
+                  '%s <%s> <http://partsregistry.org/part/B0034> .' %
+                      (annotation, SBOL.subComponent)]
+    return '\n'.join(lines) + '\n'
+
+class CountingSink(object):
+    'An N-Triples sink that only counts the triples'
+    def __init__(self):
+        self.length = 0
+    def triple(self, s, p, o):
+        self.length += 1
+
+def bench_ntriples(parts=20000, repeat=3):
+    data = sbol_dump(parts)
+    print 'N-Triples parser: %d parts, %d triples, %.1f MB' % \
+        (parts, data.count('\n'), len(data) / 1024.0 ** 2)
+    best = None
+    for i in range(repeat):
+        sink = CountingSink()
+        seconds = timed(NTriplesParser(sink).parsestring, data)
+        best = min(best or seconds, seconds)
+    print 'NTriplesParser %8.3f s %10.0f triples/s' % (best, sink.length / best)
+
+if __name__ == '__main__':
+    bench_compile()
+    bench_prepared()
+    bench_results()
+    bench_interning()
+    bench_stores()
+    bench_bulk_load()
+    bench_snapshot()
+    bench_parallel_parse()
+    bench_ntriples()
+    bench_async()
@@ -1,5 +1,154 @@
+import os
+import re
+import gc
+import copy
+import gzip
+import json
+import time
+import shutil
+import hashlib
+import httplib
+import tempfile
+import socket
+import urlparse
+import StringIO
 import unittest
+import threading
+import BaseHTTPServer
+import SocketServer
 from sbol_query import *
+from multiprocessing.dummy import DummyProcess
+from rdflib import Graph, ConjunctiveGraph, term
+from rdflib.term import TermPool
+from rdflib.store import TripleAddedEvent
+from rdflib.plugins.parsers.ntriples import ParseError
+from SPARQLWrapper import JSON
+from SPARQLWrapper.Wrapper import QueryResult
+from SPARQLWrapper.AsyncWrapper import QueryTimeout
+from SPARQLWrapper.SPARQLExceptions import QueryBadFormed, EndPointInternalError
+
+#################
+# stub endpoint
+#################
+
+class StubHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    'Answers every query with the bindings of its StubEndpoint'
+    protocol_version = 'HTTP/1.1'
+    wbufsize = -1
+
+    def do_GET(self):
+        endpoint = self.server.endpoint
+        endpoint.requests += 1
+        params = urlparse.parse_qs(urlparse.urlparse(self.path).query)
+        bindings = endpoint.bindings
+        if callable(bindings):
+            bindings = bindings(params['query'][0])
+        if bindings is None or isinstance(bindings, int):
+            body = 'stub endpoint error'
+            self.send_response(bindings or 500)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        body = json.dumps({'head'   : {'vars': endpoint.vars},
+                           'results': {'bindings': bindings}})
+        etag = '"%s"' % hashlib.md5(body).hexdigest()
+        if self.headers.get('If-None-Match') == etag:
+            endpoint.not_modified += 1
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('ETag', etag)
+        self.send_header('Content-Type', 'application/sparql-results+json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if endpoint.trickle:
+            pieces = 10
+            size = len(body) // pieces + 1
+            for i in range(0, len(body), size):
+                self.wfile.write(body[i:i + size])
+                self.wfile.flush()
+                time.sleep(float(endpoint.trickle) / pieces)
+        else:
+            self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+class StubServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+    def get_request(self):
+        request = BaseHTTPServer.HTTPServer.get_request(self)
+        self.endpoint.connections += 1
+        self.endpoint.sockets.append(request[0])
+        return request
+
+    def handle_error(self, request, client_address):
+        # connections are dropped on purpose when the endpoint stops
+        pass
+
+class StubEndpoint(object):
+    '''
+    Local stand-in for a SPARQL endpoint that counts connections and requests.
+    bindings can also be a function of the query string; returning None
+    from it makes the endpoint answer with a 500 error, and returning
+    a number with that HTTP error. With trickle set, the body of each
+    answer is sent bit by bit over that many seconds.
+    '''
+
+    def __init__(self, bindings=None):
+        self.vars = ['name']
+        if bindings is None:
+            bindings = [{'name': {'type': 'literal', 'value': 'B0010'}}]
+        self.bindings = bindings
+        self.connections = 0
+        self.requests = 0
+        self.not_modified = 0
+        self.trickle = 0
+        self.sockets = []
+        self.server = StubServer(('127.0.0.1', 0), StubHandler)
+        self.server.endpoint = self
+        self.url = 'http://127.0.0.1:%d/sparql' % self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever,
+                                       kwargs={'poll_interval': 0.05})
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        for sock in self.sockets:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+        self.thread.join()
+
+################
+# local mirror
+################
+
+def sbpkb_dump(names):
+    'N-Triples for a DnaComponent with a displayId per name'
+    lines = []
+    for name in names:
+        part = '<http://partsregistry.org/part/%s>' % name
+        lines.append('%s <%s> <%s> .' % (part, RDF.type, SBOL.DnaComponent))
+        lines.append('%s <%s> "%s" .' % (part, SBOL.displayId, name))
+        lines.append('%s <%s> "part %s" .' % (part, SBOL.shortDescription, name))
+    return '\n'.join(lines) + '\n'
+
+# runs the query suite without network access
+SBPKB = LocalSBOLNode()
+SBPKB.load(data=sbpkb_dump(['B0010', 'B0015', 'B0034', 'J23100', 'R0040']))
+
+#########
+# tests
+#########
 
 class TestQueryResults(unittest.TestCase):
 
@@ -55,5 +204,1159 @@ class TestQueryResults(unittest.TestCase):
     #def test_add_filter(self):
     #    'Check that FILTERing by an expression works'
 
+class TestCompileQuery(unittest.TestCase):
+
+    def test_memoized(self):
+        'Check that an unchanged query is not compiled again'
+        query = SBOLQuery('B0010')
+        self.assertTrue(query.compile_query() is query.compile_query())
+
+    def test_changes_invalidate(self):
+        'Check that changing the query elements recompiles it'
+        query = SBOLQuery()
+        compiled = query.compile_query()
+        query.map_attribute(SBOL.longDescription, 'long')
+        self.assertTrue('?long' in query.compile_query())
+        query.FILTER.append(Operator.regex(Variable('long'), 'promoter'))
+        self.assertTrue('promoter' in query.compile_query())
+        query.FILTER[:] = []
+        self.assertFalse('promoter' in query.compile_query())
+        query.LIMIT = 5
+        self.assertTrue('LIMIT 5' in query.compile_query())
+        query.ORDER = [Variable('name')]
+        self.assertTrue('ORDER BY ?name' in query.compile_query())
+        query.ORDER.pop()
+        self.assertFalse('ORDER BY' in query.compile_query())
+
+    def test_copies_independent(self):
+        'Check that changing a copy leaves the original alone'
+        query = SBOLQuery()
+        compiled = query.compile_query()
+        clone = copy.copy(query)
+        clone.WHERE.append((clone.result, SBOL.status, Literal('Available')))
+        self.assertEqual(query.compile_query(), compiled)
+        self.assertNotEqual(clone.compile_query(), compiled)
+
+class TestPreparedQuery(unittest.TestCase):
+
+    def test_same_as_compiled(self):
+        'Check that binding gives the same text as compiling'
+        prepared = SBOLQuery(Parameter('keyword'), limit=20).prepare()
+        for keyword in ['B0010', u'caf\u00e9', 'a "quoted" \\ word']:
+            self.assertEqual(prepared.bind(keyword=keyword).compile_query(),
+                             SBOLQuery(keyword, limit=20).compile_query())
+
+    def test_uri_and_numbers(self):
+        'Check that URIs and numbers are bound as terms'
+        query = SBOLQuery()
+        query.WHERE.append((query.result, SBOL.status, Parameter('status')))
+        query.LIMIT = Parameter('limit')
+        text = query.prepare().bind(status=URIRef('http://example.com/ok'),
+                                    limit=5).compile_query()
+        self.assertTrue('<http://sbols.org/v1#status> <http://example.com/ok>' in text)
+        self.assertTrue(text.endswith('LIMIT 5'))
+
+    def test_injection(self):
+        'Check that values cannot change the structure of the query'
+        prepared = SBOLQuery(Parameter('keyword')).prepare()
+        text = prepared.bind(keyword='x") } DELETE { ?s ?p ?o } #').compile_query()
+        self.assertTrue('"x\\") } DELETE { ?s ?p ?o } #"' in text)
+        query = SBOLQuery()
+        query.WHERE.append((query.result, SBOL.status, Parameter('status')))
+        prepared = query.prepare()
+        self.assertRaises(ValueError, prepared.bind,
+                          status=URIRef('http://x> } DELETE { ?s ?p ?o'))
+
+    def test_missing_value(self):
+        'Check that every parameter needs a value'
+        prepared = SBOLQuery(Parameter('keyword')).prepare()
+        self.assertRaises(ValueError, prepared.bind)
+
+class TestConnectionPool(unittest.TestCase):
+
+    def setUp(self):
+        self.endpoint = StubEndpoint()
+
+    def tearDown(self):
+        self.endpoint.stop()
+
+    def test_connection_reused(self):
+        'Check that consecutive queries share one connection'
+        node = SBOLNode(self.endpoint.url)
+        for i in range(5):
+            results = node.execute(SBOLQuery())
+            self.assertEqual(results[0].name, 'B0010')
+        self.assertEqual(self.endpoint.requests, 5)
+        self.assertEqual(self.endpoint.connections, 1)
+
+    def test_max_requests(self):
+        'Check that connections are replaced after max_requests queries'
+        node = SBOLNode(self.endpoint.url, max_requests=2)
+        for i in range(5):
+            node.execute(SBOLQuery())
+        self.assertEqual(self.endpoint.connections, 3)
+
+    def test_idle_timeout(self):
+        'Check that idle connections are not reused after idle_timeout'
+        node = SBOLNode(self.endpoint.url, idle_timeout=0)
+        for i in range(3):
+            node.execute(SBOLQuery())
+        self.assertEqual(self.endpoint.connections, 3)
+
+    def test_default_timeout(self):
+        'Check that reused connections keep the default socket timeout'
+        node = SBOLNode(self.endpoint.url)
+        previous = socket.getdefaulttimeout()
+        socket.setdefaulttimeout(7)
+        try:
+            for i in range(2):
+                node.execute(SBOLQuery())
+        finally:
+            socket.setdefaulttimeout(previous)
+        self.assertEqual(self.endpoint.connections, 1)
+        [[pooled]] = node.pool._idle.values()
+        self.assertEqual(pooled.connection.sock.gettimeout(), 7)
+
+def echo_keyword(query):
+    'Stub bindings naming the part searched for by the query'
+    keyword = re.search(r'regex\(\?name, "(\w+)"', query).group(1)
+    if keyword == 'FAIL':
+        return None
+    return [{'name': {'type': 'literal', 'value': keyword}}]
+
+class TestExecuteMany(unittest.TestCase):
+
+    def setUp(self):
+        self.endpoint = StubEndpoint(echo_keyword)
+        self.node = SBOLNode(self.endpoint.url)
+
+    def tearDown(self):
+        self.endpoint.stop()
+
+    def test_order_preserved(self):
+        'Check that results come back in the order of the queries'
+        names = ['B%04d' % i for i in range(20)]
+        queries = [SBOLQuery(name) for name in names]
+        results = self.node.execute_many(queries, max_workers=5)
+        self.assertEqual([r[0].name for r in results], names)
+        self.assertEqual(self.endpoint.requests, 20)
+
+    def test_errors_reported(self):
+        'Check that a failing query is reported without losing the others'
+        queries = [SBOLQuery('B0010'), SBOLQuery('FAIL'), SBOLQuery('B0015')]
+        results = self.node.execute_many(queries, max_workers=2)
+        self.assertEqual(results[0][0].name, 'B0010')
+        self.assertTrue(isinstance(results[1], Exception))
+        self.assertEqual(results[2][0].name, 'B0015')
+
+class TestResultClass(unittest.TestCase):
+
+    def test_shared(self):
+        'Check that results of a query share one slotted class'
+        endpoint = StubEndpoint(registry_parts(['B0010', 'B0015']))
+        try:
+            results = SBOLNode(endpoint.url).execute(SBOLQuery())
+        finally:
+            endpoint.stop()
+        self.assertEqual(len(set(type(r) for r in results)), 1)
+        self.assertEqual(type(results[0]).__slots__, ('name', 'result', 'source'))
+        self.assertEqual(results[1].__dict__, {
+            'name'  : 'B0015',
+            'result': 'http://partsregistry.org/part/B0015'})
+
+    def test_attributes(self):
+        'Check that results behave like the attribute bags they were'
+        cls = result_class(['name', 'description'])
+        self.assertTrue(result_class(('name', 'description')) is cls)
+        result = cls()
+        result.name = 'B0010'
+        self.assertTrue(isinstance(result, SBOLResult))
+        self.assertEqual(repr(result), "<SBOLResult {'name': 'B0010'}>")
+        self.assertRaises(AttributeError, getattr, result, 'description')
+        self.assertRaises(AttributeError, setattr, result, 'other', 1)
+
+class TestColumnarResults(unittest.TestCase):
+
+    def setUp(self):
+        xsd = 'http://www.w3.org/2001/XMLSchema#'
+        self.endpoint = StubEndpoint([
+            {'name': {'type': 'literal', 'value': 'B0010', 'xml:lang': 'en'},
+             'size': {'type': 'typed-literal', 'value': '80', 'datatype': xsd + 'int'}},
+            {'name': {'type': 'uri', 'value': 'http://partsregistry.org/part/B0015'},
+             'size': {'type': 'typed-literal', 'value': '129', 'datatype': xsd + 'int'}},
+            {'name': {'type': 'bnode', 'value': 'b0'}}])
+        self.endpoint.vars = ['name']
+
+    def tearDown(self):
+        self.endpoint.stop()
+
+    def test_columns(self):
+        'Check that each variable gets a value, type, datatype and lang column'
+        results = SBOLNode(self.endpoint.url).execute(SBOLQuery(), columnar=True)
+        self.assertEqual(results.vars, ['name', 'size'])
+        self.assertEqual(len(results), 3)
+        name, size = results['name'], results['size']
+        self.assertEqual(list(name.values), ['B0010', 'http://partsregistry.org/part/B0015', 'b0'])
+        self.assertEqual(list(name.types), [ResultColumn.LITERAL, ResultColumn.URI, ResultColumn.BNODE])
+        self.assertEqual(list(name.langs), ['en', None, None])
+        self.assertEqual(list(size.values), ['80', '129', None])
+        self.assertEqual(list(size.types), [ResultColumn.LITERAL] * 2 + [ResultColumn.UNBOUND])
+        self.assertTrue(size.datatypes[0] is size.datatypes[1])
+
+    def test_error(self):
+        'Check that a failed query gives empty columns'
+        self.endpoint.bindings = lambda query: None
+        results = SBOLNode(self.endpoint.url).execute(SBOLQuery(), columnar=True)
+        self.assertEqual(len(results), 0)
+        self.assertEqual(results.vars, [])
+
+    def test_streamed(self):
+        'Check that columns are filled without decoding the whole response'
+        convert = QueryResult.convert
+        def fail(self):
+            raise AssertionError('the whole response was decoded')
+        QueryResult.convert = fail
+        try:
+            results = SBOLNode(self.endpoint.url).execute(SBOLQuery(), columnar=True)
+        finally:
+            QueryResult.convert = convert
+        self.assertEqual(len(results), 3)
+
+    def test_late_variable(self):
+        'Check that a variable first bound in a later row is unbound before it'
+        self.endpoint.bindings = [{'name': {'type': 'literal', 'value': 'B0010'}},
+                                  {'size': {'type': 'literal', 'value': '80'}}]
+        results = SBOLNode(self.endpoint.url).execute(SBOLQuery(), columnar=True)
+        self.assertEqual(results.vars, ['name', 'size'])
+        self.assertEqual(list(results['name'].values), ['B0010', None])
+        self.assertEqual(list(results['size'].values), [None, '80'])
+        self.assertEqual(list(results['size'].types), [ResultColumn.UNBOUND, ResultColumn.LITERAL])
+
+    def test_no_results(self):
+        'Check that the selected variables get columns even without results'
+        self.endpoint.bindings = []
+        results = SBOLNode(self.endpoint.url).execute(SBOLQuery(), columnar=True)
+        self.assertEqual(results.vars, ['name'])
+        self.assertEqual(len(results), 0)
+
+    def test_cached(self):
+        'Check that cached responses give the same columns'
+        node = SBOLNode(self.endpoint.url, cache=QueryCache())
+        first  = node.execute(SBOLQuery(), columnar=True)
+        second = node.execute(SBOLQuery(), columnar=True)
+        self.assertEqual(self.endpoint.requests, 1)
+        self.assertEqual(list(second['size'].values), list(first['size'].values))
+
+class TestTypedResults(unittest.TestCase):
+
+    def setUp(self):
+        xsd = 'http://www.w3.org/2001/XMLSchema#'
+        part = {'type': 'uri', 'value': 'http://partsregistry.org/part/B0010'}
+        self.endpoint = StubEndpoint([
+            {'result': part, 'name': {'type': 'literal', 'value': 'B0010', 'xml:lang': 'en'},
+             'size': {'type': 'typed-literal', 'value': '80', 'datatype': xsd + 'int'}},
+            {'result': part, 'name': {'type': 'bnode', 'value': 'b0'}}])
+        self.endpoint.vars = ['result', 'name', 'size']
+
+    def tearDown(self):
+        self.endpoint.stop()
+
+    def test_terms(self):
+        'Check that typed results keep the RDF term types'
+        results = SBOLNode(self.endpoint.url).execute(SBOLQuery(), typed=True)
+        self.assertEqual(results[0].name, Literal('B0010', lang='en'))
+        self.assertEqual(results[0].size.toPython(), 80)
+        self.assertTrue(isinstance(results[1].name, BNode))
+        self.assertFalse(hasattr(results[1], 'size'))
+        self.assertEqual(results[0].result, URIRef('http://partsregistry.org/part/B0010'))
+        self.assertTrue(results[0].result is results[1].result)
+
+    def test_lazy(self):
+        'Check that cells are only converted when read'
+        results = SBOLNode(self.endpoint.url).execute(SBOLQuery(), typed=True)
+        name = type(results[0]).__dict__['name']
+        self.assertEqual(type(name.slot.__get__(results[0])), dict)
+        results[0].name
+        self.assertTrue(isinstance(name.slot.__get__(results[0]), Literal))
+        self.assertEqual(results[1].__dict__, {
+            'result': URIRef('http://partsregistry.org/part/B0010'),
+            'name'  : BNode('b0')})
+
+class TestTermPool(unittest.TestCase):
+
+    part = 'http://partsregistry.org/part/B0015'
+    data = {'nt': '<%s> <%s> "B0015"@en .\n' % (part, SBOL.name),
+            'nquads': '<%s> <%s> "B0015"@en <http://x/g> .\n' % (part, SBOL.name),
+            'xml': '<rdf:RDF xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#">'
+                   '<rdf:Description rdf:about="%s"><name xmlns="%s" xml:lang="en">'
+                   'B0015</name></rdf:Description></rdf:RDF>' % (part, SBOL)}
+
+    def setUp(self):
+        self.default = term.defaultTermPool
+
+    def tearDown(self):
+        term.defaultTermPool = self.default
+
+    def test_identity(self):
+        'Check that equal terms are the same object'
+        pool = TermPool()
+        self.assertTrue(pool.uriref(self.part) is pool.uriref(unicode(self.part)))
+        self.assertTrue(pool.literal('B0015', 'en') is pool.literal(u'B0015', 'en'))
+        self.assertFalse(pool.literal('B0015', 'en') is pool.literal('B0015'))
+        integer = 'http://www.w3.org/2001/XMLSchema#integer'
+        one = pool.literal('1', datatype=integer)
+        self.assertTrue(one is pool.literal(u'1', datatype=URIRef(integer)))
+        self.assertEqual(one.toPython(), 1)
+        self.assertTrue(one.datatype is pool.uriref(integer))
+
+    def test_evicted(self):
+        'Check that a term is dropped once nothing else uses it'
+        pool = TermPool()
+        uri = pool.uriref(self.part)
+        name = pool.literal('B0015', 'en')
+        self.assertEqual(len(pool), 2)
+        del uri
+        gc.collect()
+        self.assertEqual(len(pool), 1)
+        del name
+        gc.collect()
+        self.assertEqual(len(pool), 0)
+
+    def parsed(self, format, **args):
+        'Parses the data in format, and returns the subject and object'
+        graph = ConjunctiveGraph()
+        graph.parse(data=self.data[format], format=format, **args)
+        (s, p, o), = list(graph.triples((None, None, None)))
+        return graph, s, o
+
+    def assert_pooled(self, expected, format, **args):
+        'Checks that the terms parsed from format come from the expected pool'
+        graph, s, o = self.parsed(format, **args)
+        self.assertTrue(s is expected.uriref(self.part))
+        self.assertTrue(o is expected.literal('B0015', 'en'))
+
+    def test_parsers(self):
+        'Check that each parser makes its terms through the given pool'
+        for format in ['nt', 'nquads', 'xml']:
+            pool = TermPool()
+            self.assert_pooled(pool, format, pool=pool)
+        pool = TermPool()
+        self.assert_pooled(pool, 'nt', pool=pool, processes=2)
+
+    def test_default(self):
+        'Check that the parsers use defaultTermPool if it is set'
+        self.assertTrue(term.defaultTermPool is None)
+        for format in ['nt', 'nquads', 'xml']:
+            pool = term.defaultTermPool = TermPool()
+            try:
+                self.assert_pooled(pool, format)
+            finally:
+                term.defaultTermPool = None
+
+class TestQueryCache(unittest.TestCase):
+
+    def setUp(self):
+        self.endpoint = StubEndpoint(echo_keyword)
+
+    def tearDown(self):
+        self.endpoint.stop()
+
+    def test_repeat_query_cached(self):
+        'Check that repeating a query does not touch the network'
+        cache = QueryCache()
+        node = SBOLNode(self.endpoint.url, cache=cache)
+        for i in range(3):
+            self.assertEqual(node.execute(SBOLQuery('B0010'))[0].name, 'B0010')
+        node.execute(SBOLQuery('B0015'))
+        self.assertEqual(self.endpoint.requests, 2)
+        self.assertEqual((cache.hits, cache.misses), (2, 2))
+
+    def test_lru_eviction(self):
+        'Check that the least recently used entry is evicted first'
+        cache = QueryCache(max_entries=2)
+        node = SBOLNode(self.endpoint.url, cache=cache)
+        for name in ['B0010', 'B0015', 'B0010', 'B0034', 'B0010']:
+            node.execute(SBOLQuery(name))
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(self.endpoint.requests, 3)
+        node.execute(SBOLQuery('B0015'))
+        self.assertEqual(self.endpoint.requests, 4)
+
+    def test_max_bytes(self):
+        'Check that entries are evicted to stay under max_bytes'
+        node = SBOLNode(self.endpoint.url, cache=QueryCache())
+        node.execute(SBOLQuery('B0010'))
+        size = node.cache.size
+        node.cache = QueryCache(max_bytes=size * 2 - 1)
+        for name in ['B0010', 'B0015', 'B0034']:
+            node.execute(SBOLQuery(name))
+        self.assertEqual(len(node.cache), 1)
+        self.assertTrue(node.cache.size <= node.cache.max_bytes)
+
+    def test_ttl(self):
+        'Check that expired entries are fetched again'
+        node = SBOLNode(self.endpoint.url, cache=QueryCache(ttl=0.05))
+        node.execute(SBOLQuery('B0010'))
+        time.sleep(0.1)
+        node.execute(SBOLQuery('B0010'))
+        self.assertEqual(self.endpoint.requests, 2)
+
+class TestDiskQueryCache(unittest.TestCase):
+
+    def setUp(self):
+        self.endpoint = StubEndpoint(echo_keyword)
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'cache.sqlite')
+
+    def tearDown(self):
+        self.endpoint.stop()
+        shutil.rmtree(self.directory)
+
+    def test_shared_between_caches(self):
+        'Check that entries survive a new cache on the same file'
+        node = SBOLNode(self.endpoint.url, cache=DiskQueryCache(self.path))
+        node.execute(SBOLQuery('B0010'))
+        node = SBOLNode(self.endpoint.url, cache=DiskQueryCache(self.path))
+        self.assertEqual(node.execute(SBOLQuery('B0010'))[0].name, 'B0010')
+        self.assertEqual(self.endpoint.requests, 1)
+        self.assertEqual(node.cache.hits, 1)
+
+    def test_conditional_revalidation(self):
+        'Check that stale entries are revalidated instead of downloaded'
+        node = SBOLNode(self.endpoint.url, cache=DiskQueryCache(self.path, ttl=0))
+        for i in range(3):
+            self.assertEqual(node.execute(SBOLQuery('B0010'))[0].name, 'B0010')
+        self.assertEqual(self.endpoint.requests, 3)
+        self.assertEqual(self.endpoint.not_modified, 2)
+
+    def test_changed_response(self):
+        'Check that a changed response replaces the cached one'
+        node = SBOLNode(self.endpoint.url, cache=DiskQueryCache(self.path, ttl=0))
+        node.execute(SBOLQuery('B0010'))
+        self.endpoint.bindings = lambda query: [{'name': {'type': 'literal', 'value': 'new'}}]
+        self.assertEqual(node.execute(SBOLQuery('B0010'))[0].name, 'new')
+        self.assertEqual(self.endpoint.not_modified, 0)
+
+    def test_header_bytes(self):
+        'Check that non-ASCII header bytes come back as they were sent'
+        raw = 'ETag: "caf\xe9"\r\nLast-Modified: Mon, 01 Jan 2024 00:00:00 GMT\r\n'
+        cache = DiskQueryCache(self.path)
+        cache.put(('q',), 'body', httplib.HTTPMessage(StringIO.StringIO(raw)), 'u')
+        body, headers, url = cache.get(('q',))
+        self.assertEqual(headers['etag'], '"caf\xe9"')
+        self.assertEqual(str(headers), raw)
+
+    def test_counters_threaded(self):
+        'Check that hits and misses are all counted from several threads'
+        cache = DiskQueryCache(self.path)
+        cache.put(('hit',), 'body', httplib.HTTPMessage(StringIO.StringIO('')), 'u')
+        def lookups():
+            for i in range(20):
+                cache.get(('hit',))
+                cache.get(('miss',))
+        threads = [threading.Thread(target=lookups) for i in range(4)]
+        for thread in threads: thread.start()
+        for thread in threads: thread.join()
+        self.assertEqual((cache.hits, cache.misses), (80, 80))
+
+class TestIterExecute(unittest.TestCase):
+
+    def setUp(self):
+        bindings = [{'name': {'type': 'literal', 'value': u'B%04d \u00e9' % i}}
+                    for i in range(1000)]
+        self.endpoint = StubEndpoint(bindings)
+        self.node = SBOLNode(self.endpoint.url)
+
+    def tearDown(self):
+        self.endpoint.stop()
+
+    def test_matches_execute(self):
+        'Check that streamed results are the same as with execute'
+        streamed = [r.name for r in self.node.iter_execute(SBOLQuery())]
+        self.assertEqual(streamed, [r.name for r in self.node.execute(SBOLQuery())])
+        self.assertEqual(len(streamed), 1000)
+
+    def test_small_chunks(self):
+        'Check that bindings split across chunks are parsed correctly'
+        self.node.server.setQuery(SBOLQuery().compile_query())
+        self.node.server.setReturnFormat(JSON)
+        bindings = list(self.node.server.query().iterBindings(chunkSize=7))
+        self.assertEqual(bindings, self.endpoint.bindings)
+
+    def test_connection_reused(self):
+        'Check that the connection goes back to the pool after streaming'
+        for i in range(3):
+            list(self.node.iter_execute(SBOLQuery()))
+        self.assertEqual(self.endpoint.connections, 1)
+
+def numbered_parts(count):
+    '''
+    Stub bindings for count parts, honouring the LIMIT and OFFSET
+    of the query, which must also be ORDERed
+    '''
+    names = ['B%04d' % i for i in range(count)]
+    def answer(query):
+        assert 'ORDER BY' in query
+        limit  = re.search(r'LIMIT (\d+)',  query)
+        offset = re.search(r'OFFSET (\d+)', query)
+        start = offset and int(offset.group(1)) or 0
+        stop  = limit and start + int(limit.group(1)) or None
+        return [{'name': {'type': 'literal', 'value': name}}
+                for name in names[start:stop]]
+    return answer
+
+class TestPaginate(unittest.TestCase):
+
+    def setUp(self):
+        self.endpoint = StubEndpoint(numbered_parts(25))
+        self.node = SBOLNode(self.endpoint.url)
+
+    def tearDown(self):
+        self.endpoint.stop()
+
+    def test_all_pages(self):
+        'Check that every page is fetched, stopping at the short one'
+        names = [r.name for r in self.node.paginate(SBOLQuery(limit=None), page_size=10)]
+        self.assertEqual(names, ['B%04d' % i for i in range(25)])
+        self.assertEqual(self.endpoint.requests, 3)
+
+    def test_limit(self):
+        'Check that the LIMIT of the query caps the total'
+        names = [r.name for r in self.node.paginate(SBOLQuery(limit=15), page_size=10)]
+        self.assertEqual(names, ['B%04d' % i for i in range(15)])
+        self.assertEqual(self.endpoint.requests, 2)
+
+    def test_query_unchanged(self):
+        'Check that paginating does not modify the query'
+        query = SBOLQuery(limit=None)
+        before = query.compile_query()
+        list(self.node.paginate(query, page_size=10))
+        self.assertEqual(query.compile_query(), before)
+
+    def test_limit_zero(self):
+        'Check that a LIMIT of 0 makes no requests'
+        self.assertEqual(list(self.node.paginate(SBOLQuery(limit=0))), [])
+        self.assertEqual(self.endpoint.requests, 0)
+
+    def test_abandoned(self):
+        'Check that the prefetching thread stops if paging is abandoned'
+        before = set(threading.enumerate())
+        pages = self.node.paginate(SBOLQuery(limit=None), page_size=10)
+        self.assertEqual(pages.next().name, 'B0000')
+        pages.close()
+        deadline = time.time() + 5
+        while [t for t in threading.enumerate()
+               if t not in before and isinstance(t, DummyProcess)]:
+            self.assertTrue(time.time() < deadline)
+            time.sleep(0.01)
+        self.assertTrue(self.endpoint.requests <= 2)
+
+def known_parts(names):
+    'Stub bindings for the parts named in the FILTER of the query'
+    def answer(query):
+        asked = re.findall(r'\?name = "(\w+)"', query)
+        return [{'name': {'type': 'literal', 'value': name},
+                 'long': {'type': 'literal', 'value': 'part %s' % name}}
+                for name in asked if name in names]
+    return answer
+
+class TestLookupParts(unittest.TestCase):
+
+    def setUp(self):
+        self.names = ['B%04d' % i for i in range(30)]
+        self.endpoint = StubEndpoint(known_parts(self.names))
+        self.node = SBOLNode(self.endpoint.url)
+
+    def tearDown(self):
+        self.endpoint.stop()
+
+    def test_batches(self):
+        'Check that ids are looked up in batches and demultiplexed'
+        ids = self.names[:25] + ['MISSING']
+        found = self.node.lookup_parts(ids, [(SBOL.longDescription, 'long')],
+                                       batch_size=10)
+        self.assertEqual(found.keys(), ids)
+        self.assertEqual(found['MISSING'], [])
+        for id in self.names[:25]:
+            self.assertEqual([r.long for r in found[id]], ['part %s' % id])
+        self.assertEqual(self.endpoint.requests, 3)
+
+    def test_query_size(self):
+        'Check that batches are split to stay under max_query_bytes'
+        found = self.node.lookup_parts(self.names, max_query_bytes=800)
+        self.assertTrue(self.endpoint.requests > 1)
+        self.assertEqual(sum([len(r) for r in found.values()]), 30)
+
+class TestAsyncSBOLNode(unittest.TestCase):
+
+    def setUp(self):
+        self.endpoint = StubEndpoint(echo_keyword)
+        self.node = AsyncSBOLNode(self.endpoint.url, max_concurrency=5)
+
+    def tearDown(self):
+        self.endpoint.stop()
+
+    def test_execute_many(self):
+        'Check that queries run concurrently keep their order and errors'
+        names = ['B%04d' % i for i in range(20)] + ['FAIL']
+        results = self.node.execute_many([SBOLQuery(name) for name in names])
+        self.assertEqual([r[0].name for r in results[:-1]], names[:-1])
+        self.assertTrue(isinstance(results[-1], Exception))
+
+    def test_callback(self):
+        'Check that callbacks are called once each query is done'
+        done = []
+        for name in ['B0010', 'B0015']:
+            self.node.execute(SBOLQuery(name), callback=done.append)
+        self.assertTrue(self.node.run())
+        names = sorted([self.node.results(h)[0].name for h in done])
+        self.assertEqual(names, ['B0010', 'B0015'])
+
+    def test_timeout(self):
+        'Check that a slow endpoint makes the query fail with a timeout'
+        def slow(query):
+            time.sleep(0.5)
+            return echo_keyword(query)
+        self.endpoint.bindings = slow
+        handle = self.node.execute(SBOLQuery('B0010'), timeout=0.1)
+        self.node.run()
+        self.assertRaises(Exception, self.node.results, handle)
+
+    def test_cancel(self):
+        'Check that cancelled queries are never sent'
+        first  = self.node.execute(SBOLQuery('B0010'))
+        second = self.node.execute(SBOLQuery('B0015'))
+        second.cancel()
+        self.node.run()
+        self.assertEqual(self.node.results(first)[0].name, 'B0010')
+        self.assertEqual(second.state, 'CANCELLED')
+        self.assertEqual(self.endpoint.requests, 1)
+
+class TestSPARQLEngine(unittest.TestCase):
+    'Graph.query on a local graph, without SBOLQuery'
+
+    def setUp(self):
+        self.graph = Graph()
+        self.graph.bind('x', 'http://x/')
+        for name, length, desc in [('a', 10, ''), ('b', 20, 'promoter'),
+                                   ('c', 5, ''), ('d', 30, 'terminator')]:
+            self.graph.add((self.x(name), self.x('length'), Literal(length)))
+            self.graph.add((self.x(name), self.x('desc'), Literal(desc)))
+        self.graph.add((self.x('a'), self.x('next'), self.x('b')))
+        self.graph.add((self.x('b'), self.x('next'), self.x('c')))
+        self.graph.add((self.x('b'), self.x('short'), Literal('pb')))
+
+    def x(self, name):
+        return URIRef('http://x/' + name)
+
+    def select(self, query):
+        'The rows of a SELECT query, with URIs shortened to their names'
+        return [tuple([isinstance(t, URIRef) and t[len('http://x/'):] or t
+                       for t in row])
+                for row in self.graph.query(query)]
+
+    def test_join(self):
+        'Check that patterns sharing a variable are joined'
+        self.assertEqual(self.select(
+            'SELECT ?a ?c WHERE { ?a x:next ?b . ?b x:next ?c }'), [('a', 'c')])
+
+    def test_empty_literal(self):
+        'Check that an empty literal is a constant, not a wildcard'
+        self.assertEqual(sorted(self.select(
+            'SELECT ?s WHERE { ?s x:desc "" }')), [('a',), ('c',)])
+        self.assertEqual(sorted(self.select(
+            'SELECT ?a ?b WHERE { ?a x:desc ?d . ?b x:desc ?d '
+            'FILTER (?a != ?b) }')), [('a', 'c'), ('c', 'a')])
+
+    def test_optional(self):
+        'Check that OPTIONAL leaves its variables unbound if it fails'
+        self.assertEqual(self.select(
+            'SELECT ?s ?n WHERE { ?s x:length ?l OPTIONAL { ?s x:short ?n } } '
+            'ORDER BY ?s'),
+            [('a', None), ('b', Literal('pb')), ('c', None), ('d', None)])
+
+    def test_union(self):
+        'Check that UNION gives the solutions of either pattern'
+        self.assertEqual(sorted(self.select(
+            'SELECT ?s WHERE { { ?s x:desc "promoter" } UNION '
+            '{ ?s x:desc "terminator" } }')), [('b',), ('d',)])
+
+    def test_filters(self):
+        'Check regex, comparison and bound filters'
+        self.assertEqual(self.select(
+            'SELECT ?s WHERE { ?s x:desc ?d FILTER regex(?d, "^TERM", "i") }'),
+            [('d',)])
+        self.assertEqual(self.select(
+            'SELECT ?s WHERE { ?s x:desc ?d FILTER regex(?d, "^term") }'),
+            [('d',)])
+        self.assertEqual(sorted(self.select(
+            'SELECT ?s WHERE { ?s x:length ?l FILTER (?l >= 10 && ?l < 30) }')),
+            [('a',), ('b',)])
+        self.assertEqual(sorted(self.select(
+            'SELECT ?s WHERE { ?s x:length ?l OPTIONAL { ?s x:short ?n } '
+            'FILTER (!bound(?n)) }')), [('a',), ('c',), ('d',)])
+
+    def test_order_limit_offset(self):
+        'Check ORDER BY ASC and DESC, LIMIT and OFFSET'
+        query = 'SELECT ?s WHERE { ?s x:length ?l } ORDER BY %s(?l)'
+        self.assertEqual(self.select(query % 'ASC'),
+                         [('c',), ('a',), ('b',), ('d',)])
+        self.assertEqual(self.select(query % 'DESC'),
+                         [('d',), ('b',), ('a',), ('c',)])
+        self.assertEqual(self.select(query % 'ASC' + ' LIMIT 2 OFFSET 1'),
+                         [('a',), ('b',)])
+
+    def test_distinct(self):
+        'Check that DISTINCT removes duplicate solutions'
+        self.assertEqual(self.select(
+            'SELECT DISTINCT ?d WHERE { ?s x:desc ?d } ORDER BY ?d'),
+            [(Literal(''),), (Literal('promoter'),), (Literal('terminator'),)])
+
+    def test_ask(self):
+        'Check that ASK tells whether the pattern has a solution'
+        self.assertTrue(self.graph.query('ASK { x:a x:next x:b }').askAnswer)
+        self.assertFalse(self.graph.query('ASK { x:a x:next x:c }').askAnswer)
+
+    def test_construct(self):
+        'Check that CONSTRUCT fills in its template for every solution'
+        result = self.graph.query(
+            'CONSTRUCT { ?b x:prev ?a } WHERE { ?a x:next ?b }')
+        self.assertEqual(sorted(result.graph), [
+            (self.x('b'), self.x('prev'), self.x('a')),
+            (self.x('c'), self.x('prev'), self.x('b'))])
+
+class TestLocalSBOLNode(unittest.TestCase):
+
+    def setUp(self):
+        self.names = ['B%04d' % i for i in range(30)]
+        self.node = LocalSBOLNode()
+        self.node.load(data=sbpkb_dump(self.names))
+
+    def test_execute(self):
+        'Check that the keyword FILTER is evaluated locally'
+        names = sorted([r.name for r in self.node.execute(SBOLQuery('b001'))])
+        self.assertEqual(names, ['B%04d' % i for i in range(10, 20)])
+
+    def test_same_results_as_remote(self):
+        'Check that results look like those of an endpoint'
+        endpoint = StubEndpoint(known_parts(self.names))
+        try:
+            remote = SBOLNode(endpoint.url)
+            attributes = [(SBOL.shortDescription, 'long')]
+            self.assertEqual(
+                repr(remote.lookup_parts(['B0003', 'B0029'], attributes)),
+                repr(self.node.lookup_parts(['B0003', 'B0029'], attributes)))
+        finally:
+            endpoint.stop()
+
+    def test_paginate(self):
+        'Check that LIMIT, OFFSET and ORDER BY work locally'
+        names = [r.name for r in self.node.paginate(SBOLQuery(limit=None), page_size=7)]
+        self.assertEqual(names, self.names)
+
+    def test_load_gzip(self):
+        'Check that compressed dumps are loaded by file extension'
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'sbpkb.nt.gz')
+            dump = gzip.open(path, 'wb')
+            dump.write(sbpkb_dump(['K0001']))
+            dump.close()
+            node = LocalSBOLNode()
+            node.load(path)
+            self.assertEqual([r.name for r in node.execute(SBOLQuery())], ['K0001'])
+        finally:
+            shutil.rmtree(directory)
+
+    def test_array_store(self):
+        'Check that a mirror in an ArrayMemory store gives the same results'
+        node = LocalSBOLNode(ConjunctiveGraph('ArrayMemory'))
+        node.load(data=sbpkb_dump(self.names))
+        for query in [SBOLQuery('b001'), SBOLQuery(limit=None)]:
+            self.assertEqual(sorted(r.name for r in node.execute(query)),
+                             sorted(r.name for r in self.node.execute(query)))
+        node.graph.remove((URIRef('http://partsregistry.org/part/B0010'), None, None))
+        self.assertEqual(len(node.execute(SBOLQuery('b001'))), 9)
+
+    def test_bulk_load(self):
+        'Check that loads in batches keep every triple and still send events'
+        triples = set(self.node.graph)
+        for store in ['IOMemory', 'ArrayMemory']:
+            graph = ConjunctiveGraph(store)
+            added = []
+            graph.store.dispatcher.subscribe(TripleAddedEvent, added.append)
+            graph.parse(data=sbpkb_dump(self.names), format='nt')
+            self.assertEqual(set(graph), triples)
+            self.assertEqual(len(added), len(triples))
+
+    def test_parallel_load(self):
+        'Check that a dump parsed by several processes gives the same graph'
+        node = LocalSBOLNode()
+        node.load(data=sbpkb_dump(self.names), processes=2)
+        self.assertEqual(set(node.graph), set(self.node.graph))
+
+    def test_ntriples_terms(self):
+        'Check that N-Triples lines parse to the same terms however written'
+        part = URIRef('http://partsregistry.org/part/B0015')
+        node = LocalSBOLNode()
+        node.load(format='nt', data='# a comment\r\n\r\n'
+            '<%s>\t<%s>   "\\"B0015\\" terminator,\\nfrom E. coli" .\r\n'
+            '  <%s> <%s> "Double terminator \\u00e9"@en.\r'
+            '<%s> <%s> _:a .\n'
+            '_:a <%s> "1"^^<http://www.w3.org/2001/XMLSchema#integer> .\n' %
+            (part, SBOL.description, part, SBOL.name, part, SBOL.annotation,
+             SBOL.bioStart))
+        self.assertEqual(node.graph.value(part, SBOL.description),
+                         Literal(u'"B0015" terminator,\nfrom E. coli'))
+        self.assertEqual(node.graph.value(part, SBOL.name),
+                         Literal(u'Double terminator \xe9', lang='en'))
+        annotation = node.graph.value(part, SBOL.annotation)
+        self.assertTrue(isinstance(annotation, BNode))
+        self.assertEqual(node.graph.value(annotation, SBOL.bioStart).toPython(), 1)
+        self.assertRaises(ParseError, LocalSBOLNode().load, format='nt',
+                          data='<%s> <%s> .\n' % (part, SBOL.name))
+
+    def test_snapshot(self):
+        'Check that a node opened from a snapshot answers like the original'
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'sbpkb.snapshot')
+            self.node.save_snapshot(path)
+            node = LocalSBOLNode.from_snapshot(path)
+            self.assertEqual(set(node.graph), set(self.node.graph))
+            for query in [SBOLQuery('b001'), SBOLQuery(limit=None)]:
+                self.assertEqual(sorted(r.name for r in node.execute(query)),
+                                 sorted(r.name for r in self.node.execute(query)))
+            self.assertEqual(len(node.graph), len(self.node.graph))
+            self.assertEqual(len(list(node.graph.contexts())), 1)
+            self.assertRaises(TypeError, node.graph.add,
+                (URIRef('http://partsregistry.org/part/K0001'), RDF.type, SBOL.DnaComponent))
+            node.graph.close()
+        finally:
+            shutil.rmtree(directory)
+
+class TestMirrorSync(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.state = os.path.join(self.directory, 'mirror.sqlite')
+        self.remote = LocalSBOLNode()
+        self.remote.load(data=sbpkb_dump(['B%04d' % i for i in range(20)]))
+        self.mirror = LocalSBOLNode()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def assert_mirrored(self):
+        self.assertEqual(set(self.mirror.graph), set(self.remote.graph))
+
+    def test_initial_sync(self):
+        'Check that all parts are copied, page by page'
+        sync = MirrorSync(self.remote, self.mirror, self.state, page_size=7)
+        self.assertTrue(sync.sync())
+        self.assert_mirrored()
+        self.assertEqual(sync.added, 20)
+        self.assertTrue(sync.pages > 5)
+
+    def test_only_changes_applied(self):
+        'Check that a second pass only touches new, changed and removed parts'
+        sync = MirrorSync(self.remote, self.mirror, self.state, page_size=7)
+        sync.sync()
+        graph = self.remote.graph
+        part = URIRef('http://partsregistry.org/part/B0003')
+        graph.remove((part, SBOL.shortDescription, None))
+        graph.add((part, SBOL.shortDescription, Literal('changed')))
+        graph.remove((URIRef('http://partsregistry.org/part/B0007'), None, None))
+        self.remote.load(data=sbpkb_dump(['B0100']))
+        self.assertTrue(sync.sync())
+        self.assert_mirrored()
+        self.assertEqual((sync.added, sync.changed, sync.unchanged, sync.removed),
+                         (1, 1, 18, 1))
+
+    def test_resume(self):
+        'Check that an interrupted pass continues where it stopped'
+        sync = MirrorSync(self.remote, self.mirror, self.state, page_size=7)
+        self.assertFalse(sync.sync(max_pages=3))
+        first = sync.added
+        sync = MirrorSync(self.remote, self.mirror, self.state, page_size=7)
+        self.assertTrue(sync.sync())
+        self.assert_mirrored()
+        self.assertEqual(first + sync.added, 20)
+
+    def test_large_part(self):
+        'Check that a part with more triples than a page is not split'
+        sync = MirrorSync(self.remote, self.mirror, self.state, page_size=2)
+        self.assertTrue(sync.sync())
+        self.assert_mirrored()
+
+def registry_parts(names, latency=0):
+    'Stub bindings for parts with result URIs, after latency seconds'
+    def answer(query):
+        time.sleep(latency)
+        return [{'result': {'type': 'uri',
+                            'value': 'http://partsregistry.org/part/%s' % name},
+                 'name': {'type': 'literal', 'value': name}}
+                for name in names]
+    return answer
+
+class TestFederatedExecute(unittest.TestCase):
+
+    def setUp(self):
+        self.endpoints = [StubEndpoint(registry_parts(['B0010', 'B0015'])),
+                          StubEndpoint(registry_parts(['B0015', 'B0034'])),
+                          StubEndpoint(registry_parts(['B0099'], latency=1))]
+        self.nodes = [SBOLNode(e.url) for e in self.endpoints]
+
+    def tearDown(self):
+        for endpoint in self.endpoints:
+            endpoint.stop()
+
+    def test_merged(self):
+        'Check that results are de-duplicated and tagged with their node'
+        results = federated_execute(SBOLQuery(), self.nodes[:2])
+        self.assertEqual([r.name for r in results], ['B0010', 'B0015', 'B0034'])
+        self.assertEqual([r.source for r in results], self.nodes[:1] * 2 + self.nodes[1:2])
+        self.assertEqual(results.errors, {})
+
+    def test_partial_results(self):
+        'Check that slow and unreachable nodes are reported, not waited for'
+        unreachable = StubEndpoint()
+        unreachable.stop()
+        nodes = self.nodes + [SBOLNode(unreachable.url)]
+        start = time.time()
+        results = federated_execute(SBOLQuery(), nodes, timeout=0.3)
+        self.assertTrue(time.time() - start < 0.9)
+        self.assertEqual(sorted([r.name for r in results]), ['B0010', 'B0015', 'B0034'])
+        self.assertEqual(results.errors.keys(), nodes[2:])
+
+    def test_queued_nodes(self):
+        'Check that the timeout of a node counts from when it is sent'
+        endpoints = [StubEndpoint(registry_parts(['B%04d' % i], latency=0.3))
+                     for i in range(3)]
+        try:
+            nodes = [SBOLNode(e.url) for e in endpoints]
+            results = federated_execute(SBOLQuery(), nodes, timeout=0.6,
+                                        max_workers=1)
+            self.assertEqual(results.errors, {})
+            self.assertEqual([r.name for r in results], ['B0000', 'B0001', 'B0002'])
+        finally:
+            for endpoint in endpoints:
+                endpoint.stop()
+
+class Flaky(object):
+    '''
+    Stub bindings that fail with a 500 error while failing is set,
+    and answer after latency seconds
+    '''
+
+    def __init__(self, answer):
+        self.answer  = answer
+        self.failing = False
+        self.latency = 0
+
+    def __call__(self, query):
+        time.sleep(self.latency)
+        if self.failing:
+            return None
+        return self.answer(query)
+
+class TestNodeHealth(unittest.TestCase):
+
+    def test_stats(self):
+        'Check latency percentiles and the error rate'
+        health = NodeHealth(failure_threshold=100)
+        for latency in range(1, 101):
+            health.record_success(latency / 100.0)
+        self.assertEqual(health.percentile(50), 0.5)
+        self.assertEqual(health.percentile(95), 0.95)
+        self.assertEqual(health.error_rate(), 0)
+        for n in range(25):
+            health.record_failure()
+        self.assertEqual(health.error_rate(), 0.25)
+        self.assertEqual(NodeHealth().percentile(50), None)
+
+    def test_circuit(self):
+        'Check that the circuit opens, then lets a single probe through'
+        health = NodeHealth(failure_threshold=2, reset_timeout=0.1)
+        health.record_failure()
+        self.assertTrue(health.allow_request())
+        health.record_failure()
+        self.assertEqual(health.state, NodeHealth.OPEN)
+        self.assertFalse(health.allow_request())
+        time.sleep(0.15)
+        self.assertTrue(health.allow_request())
+        self.assertEqual(health.state, NodeHealth.HALF_OPEN)
+        self.assertFalse(health.allow_request())
+        health.record_failure()
+        self.assertEqual(health.state, NodeHealth.OPEN)
+        time.sleep(0.15)
+        self.assertTrue(health.allow_request())
+        health.record_success(0.01)
+        self.assertEqual(health.state, NodeHealth.CLOSED)
+
+class TestReplicatedSBOLNode(unittest.TestCase):
+
+    def setUp(self):
+        self.answers = [Flaky(registry_parts(['B0010'], latency=0.1)),
+                        Flaky(registry_parts(['B0010']))]
+        self.endpoints = [StubEndpoint(answer) for answer in self.answers]
+        self.nodes = [SBOLNode(e.url) for e in self.endpoints]
+        self.tracker = HealthTracker(failure_threshold=2, reset_timeout=0.3)
+        self.replicas = ReplicatedSBOLNode(self.nodes, self.tracker)
+
+    def tearDown(self):
+        for endpoint in self.endpoints:
+            endpoint.stop()
+
+    def query(self):
+        query = SBOLQuery()
+        query.LIMIT = None
+        return query
+
+    def test_fastest(self):
+        'Check that queries go to the fastest replica once both are timed'
+        for n in range(4):
+            results = self.replicas.execute(self.query())
+            self.assertEqual([r.name for r in results], ['B0010'])
+        before = self.endpoints[0].requests
+        for n in range(5):
+            self.replicas.execute(self.query())
+        self.assertEqual(self.endpoints[0].requests, before)
+        self.assertTrue(self.tracker[self.nodes[1]].percentile(50) < 0.1)
+
+    def test_circuit_breaking(self):
+        'Check that a failing replica is skipped, then probed again'
+        self.replicas.execute(self.query())
+        self.replicas.execute(self.query())
+        self.answers[1].failing = True
+        for n in range(3):
+            results = self.replicas.execute(self.query())
+            self.assertEqual([r.name for r in results], ['B0010'])
+        health = self.tracker[self.nodes[1]]
+        self.assertEqual(health.state, NodeHealth.OPEN)
+        before = self.endpoints[1].requests
+        self.replicas.execute(self.query())
+        self.assertEqual(self.endpoints[1].requests, before)
+        self.answers[1].failing = False
+        time.sleep(0.35)
+        self.replicas.execute(self.query())
+        self.assertEqual(self.endpoints[1].requests, before + 1)
+        self.assertEqual(health.state, NodeHealth.CLOSED)
+
+    def test_all_failing(self):
+        'Check that the last error is raised when no replica answers'
+        for answer in self.answers:
+            answer.failing = True
+        for n in range(2):
+            self.assertRaises(Exception, self.replicas._fetch, self.query())
+        self.assertRaises(CircuitOpen, self.replicas._fetch, self.query())
+
+    def test_federated(self):
+        'Check that federated_execute skips nodes whose circuit is open'
+        self.answers[0].failing = True
+        for n in range(2):
+            results = federated_execute(self.query(), self.nodes,
+                                        tracker=self.tracker)
+            self.assertEqual(results.errors.keys(), self.nodes[:1])
+        results = federated_execute(self.query(), self.nodes,
+                                    tracker=self.tracker)
+        self.assertTrue(isinstance(results.errors[self.nodes[0]], CircuitOpen))
+        self.assertEqual(self.endpoints[0].requests, 2)
+
+class TestRetries(unittest.TestCase):
+
+    def setUp(self):
+        self.errors = []
+        self.endpoint = StubEndpoint(self.answer)
+
+    def tearDown(self):
+        self.endpoint.stop()
+
+    def answer(self, query):
+        'Answers with the queued errors first'
+        if self.errors:
+            return self.errors.pop(0)
+        return registry_parts(['B0010'])(query)
+
+    def test_retried(self):
+        'Check that server errors are retried'
+        self.errors = [None, 503]
+        node = SBOLNode(self.endpoint.url, retries=2)
+        self.assertEqual([r.name for r in node.execute(SBOLQuery())], ['B0010'])
+        self.assertEqual(self.endpoint.requests, 3)
+        self.errors = [None, None]
+        node = SBOLNode(self.endpoint.url, retries=1)
+        self.assertRaises(EndPointInternalError, node._fetch, SBOLQuery())
+
+    def test_bad_query(self):
+        'Check that a badly formed query is not retried'
+        self.errors = [400]
+        node = SBOLNode(self.endpoint.url, retries=2)
+        self.assertRaises(QueryBadFormed, node._fetch, SBOLQuery())
+        self.assertEqual(self.endpoint.requests, 1)
+
+    def test_deadline(self):
+        'Check that a hung endpoint is given up on at the deadline'
+        self.endpoint.bindings = registry_parts(['B0010'], latency=2)
+        node = SBOLNode(self.endpoint.url, retries=5, deadline=0.3)
+        start = time.time()
+        self.assertRaises(Exception, node._fetch, SBOLQuery())
+        self.assertTrue(time.time() - start < 1)
+
+    def test_deadline_slow_body(self):
+        'Check that the deadline also covers reading a slow response body'
+        self.endpoint.trickle = 2
+        node = SBOLNode(self.endpoint.url, deadline=0.5)
+        start = time.time()
+        self.assertRaises(QueryTimeout, node._fetch, SBOLQuery())
+        self.assertTrue(time.time() - start < 1)
+        self.endpoint.trickle = 0.2
+        self.assertEqual(node._fetch(SBOLQuery())['results']['bindings'][0]['name']['value'], 'B0010')
+
+class TestHedging(unittest.TestCase):
+
+    def setUp(self):
+        self.answers = [Flaky(registry_parts(['B0010'])) for n in range(2)]
+        self.endpoints = [StubEndpoint(answer) for answer in self.answers]
+        self.nodes = [SBOLNode(e.url) for e in self.endpoints]
+        self.tracker = HealthTracker()
+        self.replicas = ReplicatedSBOLNode(self.nodes, self.tracker, hedge=True)
+
+    def tearDown(self):
+        for endpoint in self.endpoints:
+            endpoint.stop()
+
+    def test_hedged(self):
+        'Check that a slow query is also sent to the next replica'
+        for n in range(4):
+            self.replicas.execute(SBOLQuery())
+        best = self.nodes.index( self.tracker.ranked(self.nodes)[0] )
+        self.answers[best].latency = 2
+        before = [e.requests for e in self.endpoints]
+        start = time.time()
+        results = self.replicas.execute(SBOLQuery())
+        self.assertTrue(time.time() - start < 1)
+        self.assertEqual([r.name for r in results], ['B0010'])
+        self.assertEqual([e.requests - b for e, b in zip(self.endpoints, before)], [1, 1])
+
+    def test_hedged_cold(self):
+        'Check that a replica without latencies yet is hedged too'
+        first = self.nodes.index( self.tracker.ranked(self.nodes)[0] )
+        self.answers[first].latency = 2
+        start = time.time()
+        results = self.replicas.execute(SBOLQuery())
+        self.assertTrue(time.time() - start < 1.5)
+        self.assertEqual([r.name for r in results], ['B0010'])
+        self.assertEqual([e.requests for e in self.endpoints], [1, 1])
+
+    def test_fallback(self):
+        'Check that a failing replica is replaced without waiting'
+        for n in range(2):
+            self.replicas.execute(SBOLQuery())
+        for answer in self.answers:
+            answer.failing = True
+        self.assertRaises(EndPointInternalError, self.replicas._fetch, SBOLQuery())
+        self.assertEqual(sum(e.requests for e in self.endpoints), 4)
+
 if __name__ == '__main__':
     unittest.main()
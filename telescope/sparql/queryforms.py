@@ -21,7 +21,7 @@ class Construct(SolutionModifierSupportingQuery):
         self._template = template
 
     def _get_compiler_class(self):
-        from .sparql.compiler import ConstructCompiler
+        from ..sparql.compiler import ConstructCompiler
         return ConstructCompiler
     
     def template(self, template):